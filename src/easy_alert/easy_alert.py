@@ -1,5 +1,11 @@
 import sys
+import signal
+import threading
 from setting.setting import Setting
+from util import WorkerPool, Scheduler, Inotify, FileMonitor, default_resolver
+
+# maximum seconds to wait for the running watchers at exit
+SHUTDOWN_TIMEOUT = 30
 
 
 def main():
@@ -11,15 +17,173 @@ def main():
 
     try:
         setting = setting.load_config()
-        for watcher in setting.watchers:
-            for alert in watcher.watch():
-                for notifier in setting.notifiers:
-                    notifier.notify(alert)
-            watcher.after_success()
+        if setting.daemon:
+            run_daemon(setting)
+        else:
+            run_watchers(setting)
     except Exception as e:
         setting.logger.error('Script ended with error: %s: %s' % (e.__class__.__name__, e))
         setting.logger.traceback()
         return 1
+    finally:
+        _log_resolver_stats(setting)
 
     setting.logger.info('Script ended successfully.')
     return 0
+
+
+def run_watchers(setting):
+    """
+    Run all the watchers concurrently, then send the alerts in the order of the watchers.
+
+    Each watcher's after_success() runs in a worker only after all of its alerts have been notified.
+    A watcher ending with error is logged and skipped, and the first error is raised after the others have finished.
+    """
+    _prepare_watchers(setting)
+    pool = WorkerPool(setting.workers)
+    errors = []
+
+    def log_error(watcher_type):
+        e = sys.exc_info()[1]
+        setting.logger.error('Watcher %s ended with error: %s: %s' % (watcher_type, e.__class__.__name__, e))
+        setting.logger.traceback()
+        errors.append(sys.exc_info())
+
+    try:
+        futures = pool.map(lambda w: w.watch(), setting.watchers)
+
+        finishers = []
+        for watcher_type, watcher, future in zip(setting.watcher_types, setting.watchers, futures):
+            try:
+                alerts = future.get()
+            except Exception:
+                log_error(watcher_type)
+                continue
+            for alert in alerts:
+                for notifier in setting.notifiers:
+                    notifier.notify(alert)
+            finishers.append((watcher_type, pool.submit(watcher.after_success)))
+
+        for watcher_type, f in finishers:
+            try:
+                f.get()
+            except Exception:
+                log_error(watcher_type)
+    finally:
+        pool.shutdown(wait=True, timeout=SHUTDOWN_TIMEOUT)
+        _close_watchers(setting)
+
+    if errors:
+        t, v, tb = errors[0]
+        raise t, v, tb
+
+
+def run_daemon(setting):
+    """
+    Keep running the watchers with their own intervals until SIGTERM or SIGINT is received.
+
+    The configuration is loaded only once, and the watcher instances are reused for every tick.
+    Watchers are also triggered by the file events via inotify if available, and the intervals work as polling.
+    """
+    _prepare_watchers(setting)
+    pool = WorkerPool(setting.workers)
+    scheduler = Scheduler(pool, setting.logger)
+    notify_lock = threading.Lock()
+
+    for watcher_type, watcher in zip(setting.watcher_types, setting.watchers):
+        interval = setting.get_interval(watcher_type)
+        debounce = setting.get_debounce(watcher_type)
+        scheduler.add(watcher_type, interval,
+                      lambda w=watcher, t=watcher_type: _run_watcher(setting, t, w, notify_lock), debounce)
+        setting.logger.info('Scheduled watcher: %s (interval=%ss, debounce=%ss)' % (watcher_type, interval, debounce))
+
+    monitor = _start_file_monitor(setting, scheduler)
+
+    def stop(signum, frame):
+        setting.logger.info('Received signal: %d' % signum)
+        scheduler.stop()
+
+    handlers = [(signum, signal.signal(signum, stop)) for signum in [signal.SIGTERM, signal.SIGINT]]
+
+    try:
+        scheduler.run()
+    finally:
+        for signum, handler in handlers:
+            signal.signal(signum, handler)
+        if monitor is not None:
+            monitor.join(FileMonitor.WAIT_TIMEOUT * 2)
+        pool.shutdown(wait=True, timeout=SHUTDOWN_TIMEOUT)
+        _close_watchers(setting)
+
+
+def _prepare_watchers(setting):
+    """Let the watchers set up their resources (e.g. child processes) before any thread starts."""
+
+    for i, watcher in enumerate(setting.watchers):
+        try:
+            watcher.prepare()
+        except Exception:
+            _close_watchers(setting, i)
+            raise
+
+
+def _close_watchers(setting, n=None):
+    """Release the resources of the first n watchers (all if None). Errors are logged and never raised."""
+
+    for watcher_type, watcher in zip(setting.watcher_types, setting.watchers)[:n]:
+        try:
+            watcher.close()
+        except Exception as e:
+            setting.logger.warn('Failed to close watcher %s: %s: %s' % (watcher_type, e.__class__.__name__, e))
+
+
+def _log_resolver_stats(setting):
+    """Log the counters of the resolver cache for diagnostics if any watcher has used it."""
+
+    stats = default_resolver.get_stats()
+    if stats['hits'] + stats['negative_hits'] + stats['misses']:
+        setting.logger.info(
+            'Resolver cache: hits=%(hits)d, negative_hits=%(negative_hits)d, misses=%(misses)d, entries=%(entries)d'
+            % stats)
+
+
+def _start_file_monitor(setting, scheduler):
+    """Start watching the files for the watchers which are interested in them. Fall back to polling on failure."""
+
+    targets = [(t, w.watch_patterns()) for t, w in zip(setting.watcher_types, setting.watchers) if w.watch_patterns()]
+    if not targets:
+        return None
+
+    if not Inotify.is_available():
+        setting.logger.info('inotify is not available. Watchers run only with the intervals.')
+        return None
+
+    try:
+        monitor = FileMonitor(scheduler, setting.logger)
+    except OSError as e:
+        setting.logger.warn('Failed to initialize inotify: %s' % e)
+        return None
+
+    for watcher_type, patterns in targets:
+        if monitor.add(watcher_type, patterns):
+            setting.logger.info('Watching files for watcher: %s' % watcher_type)
+    monitor.start()
+    return monitor
+
+
+def _run_watcher(setting, watcher_type, watcher, notify_lock):
+    """Run one tick of the watcher in the daemon mode. Errors are logged and never stop the daemon."""
+
+    try:
+        alerts = watcher.watch()
+        notify_lock.acquire()
+        try:
+            for alert in alerts:
+                for notifier in setting.notifiers:
+                    notifier.notify(alert)
+        finally:
+            notify_lock.release()
+        watcher.after_success()
+    except Exception as e:
+        setting.logger.error('Watcher %s ended with error: %s: %s' % (watcher_type, e.__class__.__name__, e))
+        setting.logger.traceback()
@@ -11,11 +11,15 @@ MSG_CRITICAL = u"CRITICAL"
 MSG_PROC_NOT_RUNNING = u'not running'
 MSG_PROC_RUNNING = u'%(count)d process(es) are running'
 MSG_PROC_STATUS_FORMAT = u'[%(level)s] %(name)s: %(count)s (not %(condition)s)'
+MSG_PROC_RSS_STATUS_FORMAT = u'[%(level)s] %(name)s: %(value)d MB of RSS in total (not %(condition)s)'
+MSG_PROC_CPU_STATUS_FORMAT = u'[%(level)s] %(name)s: %(value)d%% of CPU in total (not %(condition)s)'
 MSG_PROC_ALERT_TITLE = u'Found Process Abnormality'
 MSG_PROC_ALERT = u'Found following process abnormality on server %(server_id)r.\n\n%(result)s\n\n=='
 
 MSG_LOG_SUMMARY = u'[%(tag)s]: %(count)d messages'
 MSG_LOG_SNIP = u'(snip)'
+MSG_LOG_TEMPLATE = u'%(template)s × %(count)d'
+MSG_LOG_OTHER_TEMPLATES = u'(%(count)d messages of other patterns)'
 MSG_LOG_ALERT_TITLE = u'Found Error Messages'
 MSG_LOG_ALERT = u'Found following errors on server %(server_id)r.\n\n%(result)s\n=='
 MSG_LOG_ALERT_PENDING_TITLE = u'Possible Retention of Log Watcher'
@@ -26,6 +30,18 @@ Please check the state of the files, then restart Fluentd or other applications
 MSG_SSH_STATUS_FORMAT = u'[%(name)s](%(user)s@%(host)s:%(port)d): %(msg)s'
 MSG_SSH_ALERT_TITLE = u'Found SSH Connection Error'
 MSG_SSH_ALERT = u'Failed to connect to the following servers using SSH from %(server_id)r.\n\n%(result)s\n\n=='
+MSG_SSH_NOT_CHECKED_FORMAT = u'[%(name)s](%(user)s@%(host)s:%(port)d)'
+MSG_SSH_NOT_CHECKED_TITLE = u'SSH Connection Not Checked'
+MSG_SSH_INVENTORY_FORMAT = u'[%(command)s]: %(error)s (using the output cached at %(cached_at)s)'
+MSG_SSH_INVENTORY_TITLE = u'Dynamic Inventory Error'
+MSG_SSH_INVENTORY_ALERT = u'The dynamic inventory commands failed on %(server_id)r, ' \
+                          u'so the cached host lists were used.\n\n%(result)s\n\n=='
+MSG_SSH_INVENTORY_FAILED_FORMAT = u'[%(command)s]: %(error)s'
+MSG_SSH_INVENTORY_FAILED_TITLE = u'Dynamic Inventory Failure'
+MSG_SSH_INVENTORY_FAILED_ALERT = u'The dynamic inventory commands failed on %(server_id)r ' \
+                                 u'without any cached host list, so their servers were not checked.\n\n%(result)s\n\n=='
+MSG_SSH_NOT_CHECKED = u'The following servers were not checked using SSH from %(server_id)r before the deadline ' \
+                      u'(%(deadline)s sec).\n\n%(result)s\n\n=='
 
 MSG_CMD_ALERT_FORMAT = u"""[%(level)s] Failed health check: %(name)s
   actual: {code:%(code)d, stdout:%(stdout)s, stderr:%(stderr)s}
@@ -35,13 +51,15 @@ MSG_CMD_ALERT = u'Found following errors on server %(server_id)r.\n\n%(result)s\
 
 MSG_HTTP_ALERT_FORMAT = u"""[%(level)s] Failed health check: %(name)s
   url    : %(url)s
-  actual : {code:%(code)d, size:%(size)d}
-  expect : {code:%(expect_code)d, size:%(expect_size)s, regexp:%(expect_regexp)s}
+  actual : {code:%(code)d, size:%(size)s}
+  timing : {dns:%(dns)dms, connect:%(connect)dms, tls:%(tls)dms, ttfb:%(ttfb)dms, total:%(total)dms}
+  expect : {code:%(expect_code)s, size:%(expect_size)s, regexp:%(expect_regexp)s, latency:%(expect_latency)s}
   message: %(additional_info)s"""
 MSG_HTTP_ALERT_FORMAT_ERR = u"""[%(level)s] Failed health check: %(name)s
   url    : %(url)s
   error  : %(error)s
   message: %(additional_info)s"""
+MSG_HTTP_NOT_CHECKED = u'Not checked before the deadline (%(deadline)s sec)'
 MSG_HTTP_ALERT_TITLE = u'Found HTTP Connection Error'
 MSG_HTTP_ALERT = u'Found following errors on server %(server_id)r.\n\n%(result)s\n\n=='
 
@@ -11,11 +11,15 @@ MSG_CRITICAL = u"緊急"
 MSG_PROC_NOT_RUNNING = u'起動していません'
 MSG_PROC_RUNNING = u'%(count)d 個 起動しています'
 MSG_PROC_STATUS_FORMAT = u'[%(level)s] %(name)s: %(count)s (%(condition)s に違反)'
+MSG_PROC_RSS_STATUS_FORMAT = u'[%(level)s] %(name)s: RSS 合計 %(value)d MB (%(condition)s に違反)'
+MSG_PROC_CPU_STATUS_FORMAT = u'[%(level)s] %(name)s: CPU 使用率 合計 %(value)d%% (%(condition)s に違反)'
 MSG_PROC_ALERT_TITLE = u'プロセス異常を検知しました'
 MSG_PROC_ALERT = u'サーバ %(server_id)s にて、以下のプロセス異常を検知しました。\n\n%(result)s\n\n以上'
 
 MSG_LOG_SUMMARY = u'[%(tag)s]: %(count)d件'
 MSG_LOG_SNIP = u'(省略されました)'
+MSG_LOG_TEMPLATE = u'%(template)s × %(count)d'
+MSG_LOG_OTHER_TEMPLATES = u'(その他のパターン %(count)d件)'
 MSG_LOG_ALERT_TITLE = u'エラーログを検知しました'
 MSG_LOG_ALERT = u'サーバ %(server_id)s にて、以下のエラーを検知しました。\n\n%(result)s\n以上'
 MSG_LOG_ALERT_PENDING_TITLE = u'ログ監視が滞留している可能性があります'
@@ -26,6 +30,16 @@ MSG_LOG_ALERT_PENDING = u"""サーバ %(server_id)s にて、ログ監視滞留
 MSG_SSH_STATUS_FORMAT = u'[%(name)s](%(user)s@%(host)s:%(port)d): %(msg)s'
 MSG_SSH_ALERT_TITLE = u'SSH疎通異常を検知しました'
 MSG_SSH_ALERT = u'サーバ %(server_id)s から、以下のサーバに対する SSH 疎通確認に失敗しました。\n\n%(result)s\n\n以上'
+MSG_SSH_NOT_CHECKED_FORMAT = u'[%(name)s](%(user)s@%(host)s:%(port)d)'
+MSG_SSH_NOT_CHECKED_TITLE = u'SSH疎通確認が期限内に完了しませんでした'
+MSG_SSH_INVENTORY_FORMAT = u'[%(command)s]: %(error)s (%(cached_at)s 時点のキャッシュを使用)'
+MSG_SSH_INVENTORY_TITLE = u'動的インベントリの取得に失敗しました'
+MSG_SSH_INVENTORY_ALERT = u'サーバ %(server_id)s にて、動的インベントリのコマンドが失敗したため、キャッシュされたホスト一覧を使用しました。\n\n%(result)s\n\n以上'
+MSG_SSH_INVENTORY_FAILED_FORMAT = u'[%(command)s]: %(error)s'
+MSG_SSH_INVENTORY_FAILED_TITLE = u'動的インベントリのコマンドが失敗しました'
+MSG_SSH_INVENTORY_FAILED_ALERT = u'サーバ %(server_id)s にて、動的インベントリのコマンドが失敗し、' \
+                                 u'キャッシュされたホスト一覧もないため、対象のサーバを確認できませんでした。\n\n%(result)s\n\n以上'
+MSG_SSH_NOT_CHECKED = u'サーバ %(server_id)s から、以下のサーバに対する SSH 疎通確認を期限 (%(deadline)s 秒) までに実施できませんでした。\n\n%(result)s\n\n以上'
 
 MSG_CMD_ALERT_FORMAT = u"""[%(level)s] %(name)s のヘルスチェックに失敗
   actual: {code:%(code)d, stdout:%(stdout)s, stderr:%(stderr)s}
@@ -35,13 +49,15 @@ MSG_CMD_ALERT = u'サーバ %(server_id)s にて、以下のヘルスチェッ
 
 MSG_HTTP_ALERT_FORMAT = u"""[%(level)s] %(name)s のヘルスチェックに失敗
   url    : %(url)s
-  actual : {code:%(code)d, size:%(size)d}
-  expect : {code:%(expect_code)d, size:%(expect_size)s, regexp:%(expect_regexp)s}
+  actual : {code:%(code)d, size:%(size)s}
+  timing : {dns:%(dns)dms, connect:%(connect)dms, tls:%(tls)dms, ttfb:%(ttfb)dms, total:%(total)dms}
+  expect : {code:%(expect_code)s, size:%(expect_size)s, regexp:%(expect_regexp)s, latency:%(expect_latency)s}
   message: %(additional_info)s"""
 MSG_HTTP_ALERT_FORMAT_ERR = u"""[%(level)s] %(name)s のヘルスチェックに失敗
   url    : %(url)s
   error  : %(error)s
   message: %(additional_info)s"""
+MSG_HTTP_NOT_CHECKED = u'期限 (%(deadline)s 秒) までに確認できませんでした'
 MSG_HTTP_ALERT_TITLE = u'HTTP疎通異常を検知しました'
 MSG_HTTP_ALERT = u'サーバ %(server_id)s にて、以下のヘルスチェック異常を検知しました。\n\n%(result)s\n\n以上'
 
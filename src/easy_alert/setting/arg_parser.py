@@ -1,5 +1,5 @@
 from optparse import OptionParser
-from default import VERSION, USAGE, DEFAULT_CONF_PATH
+from default import VERSION, USAGE, DEFAULT_CONF_PATH, DEFAULT_WORKERS
 
 
 def get_parser():
@@ -16,5 +16,13 @@ def get_parser():
         '--check', action='store_true', dest='print_only', default=False,
         help='print alerts instead of sending notifications'
     )
+    parser.add_option(
+        '--workers', dest='workers', default=DEFAULT_WORKERS, type='int',
+        help='number of watchers to run concurrently (default:%d)' % DEFAULT_WORKERS
+    )
+    parser.add_option(
+        '--daemon', action='store_true', dest='daemon', default=False,
+        help='keep running and check periodically with the intervals in the "schedule" section'
+    )
 
     return parser
@@ -5,9 +5,9 @@ from easy_alert.notifier import EmailNotifier
 WATCHER_FACTORIES = {
     'log': lambda conf, print_only, logger: LogWatcher(conf, print_only),
     'process': lambda conf, print_only, logger: ProcessWatcher(conf),
-    'ssh': lambda conf, print_only, logger: SSHWatcher(conf),
+    'ssh': lambda conf, print_only, logger: SSHWatcher(conf, print_only),
     'command': lambda conf, print_only, logger: CommandWatcher(conf),
-    'http': lambda conf, print_only, logger: HTTPWatcher(conf),
+    'http': lambda conf, print_only, logger: HTTPWatcher(conf, print_only),
 }
 
 # dict of the notifier and its factory
@@ -26,3 +26,11 @@ Available watcher types:
   """ + '\n  '.join(WATCHER_KEYS)
 
 DEFAULT_CONF_PATH = '/etc/easy-alert/easy-alert.yml'
+
+DEFAULT_WORKERS = 4
+
+# default interval in seconds for the daemon mode
+DEFAULT_INTERVAL = 60
+
+# default minimum seconds between the end of a run and the next run triggered by the file events
+DEFAULT_DEBOUNCE = 10
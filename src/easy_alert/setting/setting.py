@@ -3,7 +3,8 @@ import sys
 import yaml
 from easy_alert.logger import SystemLogger, PrintLogger
 from easy_alert.util import CaseClass
-from default import WATCHER_KEYS, WATCHER_FACTORIES, NOTIFIER_FACTORIES
+from default import WATCHER_KEYS, WATCHER_FACTORIES, NOTIFIER_FACTORIES, DEFAULT_WORKERS, DEFAULT_INTERVAL, \
+    DEFAULT_DEBOUNCE
 from setting_error import SettingError
 
 
@@ -16,9 +17,10 @@ class Setting(CaseClass):
     parser = arg_parser.get_parser()
 
     def __init__(self, watcher_types=list(), config_path=None, print_only=None, watchers=list(), notifiers=list(),
-                 logger=SystemLogger()):
+                 logger=SystemLogger(), workers=DEFAULT_WORKERS, daemon=False, intervals=dict(), debounces=dict()):
         super(Setting, self).__init__([
-            'watcher_types', 'config_path', 'print_only', 'watchers', 'notifiers', 'logger',
+            'watcher_types', 'config_path', 'print_only', 'watchers', 'notifiers', 'logger', 'workers', 'daemon',
+            'intervals', 'debounces',
         ])
         self.watcher_types = watcher_types
         self.config_path = config_path
@@ -26,6 +28,10 @@ class Setting(CaseClass):
         self.watchers = watchers
         self.notifiers = notifiers
         self.logger = logger
+        self.workers = workers
+        self.daemon = daemon
+        self.intervals = intervals
+        self.debounces = debounces
 
     def parse_args(self, argv):
         """Parse command line arguments and update operation and options"""
@@ -33,12 +39,13 @@ class Setting(CaseClass):
         options, args = Setting.parser.parse_args(argv[1:])
 
         # args should be at least one and all watcher should be known
-        if not args or set(args) - set(WATCHER_KEYS):
+        if not args or set(args) - set(WATCHER_KEYS) or options.workers < 1:
             self.parser.print_usage(sys.stderr)
             self.parser.exit(2)
 
         return Setting(sorted(set(args), key=args.index), options.config_path, options.print_only, self.watchers,
-                       self.notifiers, PrintLogger() if options.print_only else self.logger)
+                       self.notifiers, PrintLogger() if options.print_only else self.logger, options.workers,
+                       options.daemon)
 
     def load_config(self):
         """Load configuration file"""
@@ -71,7 +78,19 @@ class Setting(CaseClass):
         else:
             raise SettingError('Not found "notifiers" entry: %s' % self.config_path)
 
-        return Setting(self.watcher_types, self.config_path, self.print_only, watchers, notifiers, self.logger)
+        # parse schedule (optional)
+        intervals, debounces = self._parse_schedule(config.get('schedule') or {})
+
+        return Setting(self.watcher_types, self.config_path, self.print_only, watchers, notifiers, self.logger,
+                       self.workers, self.daemon, intervals, debounces)
+
+    def get_interval(self, watcher_type):
+        """Interval in seconds for the daemon mode"""
+        return self.intervals.get(watcher_type, DEFAULT_INTERVAL)
+
+    def get_debounce(self, watcher_type):
+        """Minimum seconds between the end of a run and the next run triggered by the file events"""
+        return self.debounces.get(watcher_type, DEFAULT_DEBOUNCE)
 
     def _parse_watcher(self, watcher_type, watcher_config):
         factory = WATCHER_FACTORIES.get(watcher_type)
@@ -84,6 +103,42 @@ class Setting(CaseClass):
 
         return factory(conf, self.print_only, self.logger)
 
+    def _parse_schedule(self, schedule_config):
+        """
+        Each value is the interval, or a dict of {interval, debounce}
+
+        :return: tuple(dict of watcher type -> interval in seconds, dict of watcher type -> debounce in seconds)
+        """
+        if not isinstance(schedule_config, dict):
+            raise SettingError('Syntax error: %s' % self.config_path)
+
+        def is_number(x):
+            return not isinstance(x, bool) and isinstance(x, (int, float))
+
+        intervals = {}
+        debounces = {}
+        for watcher_type, value in schedule_config.items():
+            if watcher_type not in WATCHER_KEYS:
+                raise SettingError('Unsupported watcher type in "schedule": %s' % watcher_type)
+
+            if isinstance(value, dict):
+                unknown = sorted(set(value.keys()) - set(['interval', 'debounce']))
+                if unknown:
+                    raise SettingError('Unknown schedule key for "%s": %s' % (watcher_type, ', '.join(unknown)))
+                interval = value.get('interval', DEFAULT_INTERVAL)
+                if 'debounce' in value:
+                    debounce = value['debounce']
+                    if not is_number(debounce) or debounce < 0:
+                        raise SettingError('Invalid debounce for "%s": %s' % (watcher_type, debounce))
+                    debounces[watcher_type] = debounce
+            else:
+                interval = value
+
+            if not is_number(interval) or interval <= 0:
+                raise SettingError('Invalid interval for "%s": %s' % (watcher_type, interval))
+            intervals[watcher_type] = interval
+        return intervals, debounces
+
     def _parse_notifier(self, notifier_type, notifier_config):
         factory = NOTIFIER_FACTORIES.get(notifier_type)
         if not factory:
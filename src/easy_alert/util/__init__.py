@@ -1,4 +1,13 @@
 from .case_class import CaseClass
 from .system_util import get_server_id
 from .util import apply_option, with_retry, exists
+from .retry_policy import RetryPolicy
 from .matcher import Matcher
+from .worker_pool import WorkerPool, WorkerTimeout, JobCancelled
+from .scheduler import Scheduler
+from .file_monitor import Inotify, FileMonitor
+from .multi_matcher import MultiPatternMatcher
+from .tick_cache import TickCache
+from .http_pool import HTTPConnectionPool, RequestTiming, get_header
+from .resolver import Resolver, default_resolver
+from .state_file import load_state_file, save_state_file
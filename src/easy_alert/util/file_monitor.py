@@ -0,0 +1,181 @@
+import os
+import errno
+import select
+import struct
+import fnmatch
+import threading
+import ctypes
+import ctypes.util
+
+
+class Inotify(object):
+    """
+    Minimal wrapper of the Linux inotify API via ctypes
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ONLYDIR = 0x01000000
+    IN_MASK_ADD = 0x20000000
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+    BUFFER_SIZE = 64 * 1024
+
+    _libc = None
+
+    def __init__(self):
+        libc = self._load_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.fd = fd
+
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                cls._libc = libc if hasattr(libc, 'inotify_init1') and hasattr(libc, 'inotify_add_watch') else False
+            except OSError:
+                cls._libc = False
+        return cls._libc or None
+
+    @classmethod
+    def is_available(cls):
+        return cls._load_libc() is not None
+
+    def add_watch(self, path, mask):
+        """
+        :param path: path to the file or directory
+        :param mask: event mask
+        :return: watch descriptor
+        """
+        wd = self._libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, '%s: %s' % (os.strerror(e), path))
+        return wd
+
+    def read_events(self, timeout):
+        """
+        Wait for the events
+
+        :param timeout: maximum seconds to wait
+        :return: list of tuple(watch descriptor, mask, name)
+        """
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+
+        try:
+            buf = os.read(self.fd, self.BUFFER_SIZE)
+        except OSError as e:
+            if e.errno in [errno.EAGAIN, errno.EINTR]:
+                return []
+            raise
+
+        events = []
+        pos = 0
+        while pos + self.EVENT_HEADER.size <= len(buf):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(buf, pos)
+            pos += self.EVENT_HEADER.size
+            events.append((wd, mask, buf[pos:pos + length].rstrip('\0')))
+            pos += length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileMonitor(object):
+    """
+    Trigger the scheduler jobs when the files matching the glob patterns are changed
+
+    The parent directories are watched, so the files created later (e.g. after the log rotation) are also detected.
+    """
+
+    WAIT_TIMEOUT = 1.0  # seconds
+
+    # events for the files written at once, and for the files growing in place
+    COMPLETED_MASK = Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO
+    APPENDED_MASK = Inotify.IN_MODIFY | Inotify.IN_CREATE | Inotify.IN_MOVED_TO
+
+    def __init__(self, scheduler, logger):
+        """
+        :param scheduler: Scheduler instance
+        :param logger: Logger instance
+        """
+        self.scheduler = scheduler
+        self.logger = logger
+        self.inotify = Inotify()
+        self.rules = {}  # watch descriptor -> list of tuple(mask, glob pattern, job name)
+        self._thread = None
+
+    def add(self, name, patterns):
+        """
+        :param name: job name to trigger
+        :param patterns: list of tuple(glob pattern, true if the file grows in place)
+        :return: number of the patterns which are being watched
+        """
+        n = 0
+        for pattern, appended in patterns:
+            mask = self.APPENDED_MASK if appended else self.COMPLETED_MASK
+            try:
+                wd = self.inotify.add_watch(os.path.dirname(pattern) or '.',
+                                            mask | Inotify.IN_ONLYDIR | Inotify.IN_MASK_ADD)
+            except OSError as e:
+                self.logger.warn('Failed to watch files: %s: %s' % (pattern, e))
+                continue
+            self.rules.setdefault(wd, []).append((mask, pattern, name))
+            n += 1
+        return n
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        """Wait for the thread to exit after the scheduler is stopped"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            while not self.scheduler.is_stopped():
+                for name in self._dispatch(self.inotify.read_events(self.WAIT_TIMEOUT)):
+                    self.scheduler.trigger(name)
+        except Exception as e:
+            self.logger.error('File monitor stopped with error: %s: %s' % (e.__class__.__name__, e))
+        finally:
+            self.inotify.close()
+
+    def _dispatch(self, events):
+        """
+        :return: set of the job names to trigger
+        """
+        names = set()
+        for wd, mask, name in events:
+            if mask & Inotify.IN_Q_OVERFLOW:
+                for rules in self.rules.values():
+                    names.update(n for _, _, n in rules)
+                continue
+            for rule_mask, pattern, job_name in self.rules.get(wd, []):
+                if mask & rule_mask and fnmatch.fnmatch(name, os.path.basename(pattern)):
+                    names.add(job_name)
+        return names
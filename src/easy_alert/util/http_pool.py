@@ -0,0 +1,262 @@
+import time
+import ssl
+import errno
+import socket
+import httplib
+import urllib
+import urllib2
+import threading
+from urlparse import urlparse, urljoin
+from resolver import default_resolver
+
+
+class RequestTiming(object):
+    """
+    Breakdown of the time spent for a request, in seconds
+
+      dns    : name resolution
+      connect: TCP connection
+      tls    : TLS handshake
+      ttfb   : from sending the request to receiving the response headers
+      total  : whole request including the body read by the consumer
+
+    dns, connect and tls are zero for a reused connection. With redirects, the times of all the requests are added up.
+    """
+
+    FIELDS = ['dns', 'connect', 'tls', 'ttfb', 'total']
+
+    def __init__(self):
+        for f in self.FIELDS:
+            setattr(self, f, 0.0)
+
+    def to_millis(self):
+        """
+        :return: dict of the field name -> milliseconds as an integer
+        """
+        return dict((f, int(round(getattr(self, f) * 1000))) for f in self.FIELDS)
+
+
+class HTTPConnectionPool(object):
+    """
+    Reuse the HTTP/1.1 keep-alive connections for each (scheme, host, port)
+
+    The pool behaves like urllib2.urlopen() for health checks:
+      - status codes >= 400 raise urllib2.HTTPError
+      - redirects (301, 302, 303, 307) are followed up to MAX_REDIRECTIONS times
+      - urls without the scheme are treated as http
+      - if a proxy is configured in the environment, the request goes through urllib2 without pooling
+
+    Host names are resolved through the shared Resolver, so the results are cached across the checks.
+    A stale connection closed by the server while idle is retried once with a fresh connection.
+    The body can be read partially by the consumer, and then the connection is closed instead of being reused.
+    """
+
+    MAX_REDIRECTIONS = 10
+    REDIRECT_CODES = [301, 302, 303, 307]
+    USER_AGENT = 'easy-alert (Python-urllib/%s)' % urllib2.__version__
+
+    def __init__(self, max_idle_per_host=10, max_idle_time=60, clock=time.time, resolver=default_resolver):
+        """
+        :param max_idle_per_host: maximum number of the idle connections to keep for each host
+        :param max_idle_time: seconds to keep the idle connections
+        :param clock: function which returns the current time in seconds
+        :param resolver: Resolver instance
+        """
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle_time = max_idle_time
+        self.clock = clock
+        self.resolver = resolver
+        self.idle = {}  # (scheme, host, port) -> list of tuple(connection, time when released)
+        self.stats = {'created': 0, 'reused': 0}
+        self._lock = threading.Lock()
+
+    def urlopen(self, url, timeout, consumer=None, timing=None, headers=None):
+        """
+        :param url: url string
+        :param timeout: socket timeout in seconds
+        :param consumer: function(status code, response) which reads the body and returns
+                         tuple(result, true if the whole body has been read) (default: read the whole body)
+                         The response headers can be read with get_header().
+        :param timing: RequestTiming instance to record the timings
+        :param headers: dict of the additional request headers (e.g. If-None-Match)
+        :return: tuple(status code, result of the consumer)
+        """
+        consumer = consumer or _read_all
+        timing = timing or RequestTiming()
+        if '://' not in url:
+            url = 'http://' + url
+
+        start = self.clock()
+        try:
+            for _ in range(self.MAX_REDIRECTIONS + 1):
+                parsed = urlparse(url)
+                if parsed.scheme.lower() in urllib.getproxies():
+                    try:
+                        u = urllib2.urlopen(urllib2.Request(url, headers=headers or {}), timeout=timeout)
+                    except urllib2.HTTPError as e:
+                        if e.code != 304:
+                            raise
+                        u = e  # not modified
+                    timing.ttfb = self.clock() - start
+                    try:
+                        return u.getcode(), consumer(u.getcode(), u)[0]
+                    finally:
+                        u.close()
+
+                code, reason, resp_headers, result = self._request(parsed, timeout, consumer, timing, headers)
+                location = resp_headers.get('location') or resp_headers.get('uri')
+                if code in self.REDIRECT_CODES and location:
+                    url = urljoin(url, location)
+                    continue
+                if code >= 400:
+                    raise urllib2.HTTPError(url, code, reason, resp_headers, None)
+                return code, result
+            raise urllib2.HTTPError(url, code, 'Too many redirections', resp_headers, None)
+        finally:
+            timing.total = self.clock() - start
+
+    def close(self):
+        """Close all the idle connections"""
+        self._lock.acquire()
+        try:
+            idle, self.idle = self.idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _request(self, parsed, timeout, consumer, timing, extra_headers):
+        """
+        :return: tuple(status code, reason, dict of headers in lower case, result of the consumer)
+        """
+        scheme = parsed.scheme.lower()
+        key = (scheme, parsed.hostname, parsed.port)
+        path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+        headers = {'User-Agent': self.USER_AGENT}
+        headers.update(extra_headers or {})
+
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            conn.timing = timing
+            try:
+                conn.request('GET', path, headers=headers)
+                sent = self.clock()  # the connection has been established by request()
+                resp = conn.getresponse()
+                timing.ttfb += self.clock() - sent
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused and _is_closed_by_peer(e):
+                    continue  # the server closed the idle connection; retry with a fresh one
+                raise
+
+            try:
+                if resp.status in self.REDIRECT_CODES or resp.status >= 400:
+                    result, complete = _read_all(resp.status, resp)
+                else:
+                    result, complete = consumer(resp.status, resp)
+            except Exception:
+                conn.close()
+                raise
+
+            if complete and not resp.will_close:
+                self._release(key, conn)
+            else:
+                conn.close()
+            return resp.status, resp.reason, dict(resp.getheaders()), result
+
+    def _acquire(self, key, timeout):
+        """
+        :return: tuple(connection, true if it is reused)
+        """
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            conns = self.idle.get(key, [])
+            while conns:
+                conn, released = conns.pop()
+                if now - released < self.max_idle_time:
+                    self.stats['reused'] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.stats['created'] += 1
+        finally:
+            self._lock.release()
+
+        scheme, host, port = key
+        cls = _TimedHTTPSConnection if scheme == 'https' else _TimedHTTPConnection
+        conn = cls(host, port, timeout=timeout)
+        conn.clock = self.clock
+        conn.resolver = self.resolver
+        return conn, False
+
+    def _release(self, key, conn):
+        self._lock.acquire()
+        try:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.max_idle_per_host:
+                conns.append((conn, self.clock()))
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+
+def get_header(resp, name):
+    """
+    :param resp: response given to the consumer (httplib.HTTPResponse or the urllib2 response)
+    :param name: header name
+    :return: header value or None
+    """
+    if hasattr(resp, 'getheader'):
+        return resp.getheader(name)
+    return resp.info().getheader(name)
+
+
+def _read_all(code, resp):
+    return resp.read(), True
+
+
+def _is_closed_by_peer(e):
+    """
+    :return: true if the error means that the server had closed the connection before the request
+
+    A timeout is not included, since retrying it would hide a slow server and double the time to wait.
+    """
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return isinstance(e, socket.error) and not isinstance(e, socket.timeout) and \
+        e.errno in [errno.ECONNRESET, errno.EPIPE]
+
+
+def _connect_timed(conn):
+    """
+    Same as socket.create_connection(), but record the time for the name resolution and the connection
+    """
+    t0 = conn.clock()
+    addrs = conn.resolver.getaddrinfo(conn.host, conn.port)
+    t1 = conn.clock()
+    conn.timing.dns += t1 - t0
+
+    sock = conn.resolver.connect_any(addrs, conn.timeout, conn.source_address)
+    conn.timing.connect += conn.clock() - t1
+    return sock
+
+
+class _TimedHTTPConnection(httplib.HTTPConnection):
+    def connect(self):
+        self.sock = _connect_timed(self)
+
+
+class _TimedHTTPSConnection(httplib.HTTPSConnection):
+    def connect(self):
+        sock = _connect_timed(self)
+        t = self.clock()
+        if hasattr(self, '_context'):
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+        else:
+            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file)  # before Python 2.7.9
+        self.timing.tls += self.clock() - t
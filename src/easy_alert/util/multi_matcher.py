@@ -0,0 +1,93 @@
+import re
+import sre_parse
+import sre_constants
+from case_class import CaseClass
+
+
+class MultiPatternMatcher(CaseClass):
+    """
+    Find all the regular expressions which match a string, running as few of them as possible
+
+    Each pattern is indexed by the literal text it requires:
+      - anchored patterns (e.g. '^/usr/sbin/syslogd') are looked up by the prefix of the string
+      - other patterns with a literal part (e.g. 'awesome-app .*') run only if the literal is in the string
+      - the rest (e.g. alternations, case-insensitive patterns) always run
+    The result is the same as calling pattern.search() for every pattern.
+    """
+
+    MIN_LITERAL_LEN = 2
+
+    def __init__(self, patterns):
+        """
+        :param patterns: list of compiled regular expressions
+        """
+        super(MultiPatternMatcher, self).__init__(['patterns'])
+        self.patterns = patterns
+
+        prefix_tables = {}  # length -> prefix -> list of pattern indices
+        substrings = {}  # literal -> list of pattern indices
+        self._always = []
+
+        for i, pattern in enumerate(patterns):
+            anchored, literal = self._required_literal(pattern)
+            if literal is None:
+                self._always.append(i)
+            elif anchored:
+                prefix_tables.setdefault(len(literal), {}).setdefault(literal, []).append(i)
+            else:
+                substrings.setdefault(literal, []).append(i)
+
+        self._prefix_tables = sorted(prefix_tables.items())
+        self._substrings = sorted(substrings.items())
+
+    def match(self, s):
+        """
+        :param s: string to test
+        :return: frozenset of the indices of the patterns which match the string
+        """
+        candidates = list(self._always)
+        for n, table in self._prefix_tables:
+            candidates.extend(table.get(s[:n], []))
+        for literal, indices in self._substrings:
+            if literal in s:
+                candidates.extend(indices)
+        return frozenset(i for i in candidates if self.patterns[i].search(s))
+
+    @classmethod
+    def _required_literal(cls, pattern):
+        """
+        Find the longest literal text which appears in every match of the pattern.
+
+        :return: tuple(is anchored at the beginning, literal string or None)
+        """
+        if pattern.flags & (re.IGNORECASE | re.LOCALE):
+            return False, None
+        try:
+            parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+        except (sre_constants.error, TypeError, ValueError):
+            return False, None
+        if parsed.pattern.flags & (re.IGNORECASE | re.LOCALE):
+            return False, None
+
+        items = list(parsed)
+        head = items[0] if items else None
+        anchored = head == (sre_constants.AT, sre_constants.AT_BEGINNING_STRING) or (
+            head == (sre_constants.AT, sre_constants.AT_BEGINNING) and not parsed.pattern.flags & re.MULTILINE)
+
+        # collect runs of ascii literals at the top level
+        runs, run = [], []
+        for op, av in items[1:] if anchored else items:
+            if op == sre_constants.LITERAL and av < 128:
+                run.append(chr(av))
+            else:
+                runs.append(''.join(run))
+                run = []
+        runs.append(''.join(run))
+
+        if anchored and len(runs[0]) >= cls.MIN_LITERAL_LEN:
+            return True, runs[0]
+
+        best = max(runs, key=len)
+        if len(best) >= cls.MIN_LITERAL_LEN:
+            return False, best
+        return False, None
@@ -0,0 +1,132 @@
+import time
+import socket
+import threading
+
+
+class Resolver(object):
+    """
+    Cache of the name resolution (socket.getaddrinfo) shared by all the network watchers
+
+    The results are kept for `ttl` seconds, and the names which do not exist for `negative_ttl` seconds.
+    Temporary failures (EAI_AGAIN) are never cached.
+    One instance lives for the whole process, so the cache persists across the ticks in the daemon mode.
+    """
+
+    DEFAULT_TTL = 60
+    DEFAULT_NEGATIVE_TTL = 10
+    DEFAULT_MAX_ENTRIES = 4096
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 clock=time.time, getaddrinfo=socket.getaddrinfo):
+        """
+        :param ttl: seconds to keep the results
+        :param negative_ttl: seconds to keep the errors for the names which do not exist
+        :param max_entries: number of the entries to start purging the expired ones
+        :param clock: function which returns the current time in seconds
+        :param getaddrinfo: function to resolve the names
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._getaddrinfo = getaddrinfo
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._entries = {}  # (host, port) -> tuple(expire time, list of addresses or socket.gaierror)
+        self._lock = threading.Lock()
+
+    def getaddrinfo(self, host, port):
+        """
+        Same as socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM) but cached
+
+        :return: list of tuple(family, socktype, proto, canonname, sockaddr)
+        """
+        key = (host, port)
+        now = self.clock()
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0]:
+                if isinstance(entry[1], socket.gaierror):
+                    self.negative_hits += 1
+                    raise entry[1]
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        finally:
+            self._lock.release()
+
+        try:
+            result = self._getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            self._store(key, now + self.ttl, result)
+            return result
+        except socket.gaierror as e:
+            if e.args and e.args[0] != socket.EAI_AGAIN:
+                self._store(key, now + self.negative_ttl, e)
+            raise
+
+    def create_connection(self, address, timeout, source_address=None):
+        """
+        Same as socket.create_connection() but with the cached name resolution
+
+        :param address: tuple(host, port)
+        :param timeout: socket timeout in seconds
+        :param source_address: tuple(host, port) to bind before connecting
+        :return: connected socket
+        """
+        return self.connect_any(self.getaddrinfo(*address), timeout, source_address)
+
+    @staticmethod
+    def connect_any(addrs, timeout, source_address=None):
+        """
+        Try the addresses in order, and return the first socket connected
+
+        :param addrs: result of getaddrinfo()
+        :return: connected socket
+        """
+        err = socket.error('getaddrinfo returns an empty list')
+        for af, socktype, proto, _, sa in addrs:
+            sock = None
+            try:
+                sock = socket.socket(af, socktype, proto)
+                sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sa)
+                return sock
+            except socket.error as e:
+                err = e
+                if sock is not None:
+                    sock.close()
+        raise err
+
+    def get_stats(self):
+        """
+        :return: dict of the counters for diagnostics
+        """
+        return {'hits': self.hits, 'negative_hits': self.negative_hits, 'misses': self.misses,
+                'entries': len(self._entries)}
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries = {}
+        finally:
+            self._lock.release()
+
+    def _store(self, key, expire, value):
+        self._lock.acquire()
+        try:
+            if len(self._entries) >= self.max_entries:
+                now = self.clock()
+                for k in [k for k, (t, _) in self._entries.items() if t <= now]:
+                    del self._entries[k]
+            self._entries[key] = (expire, value)
+        finally:
+            self._lock.release()
+
+
+# shared by all the watchers in the process
+default_resolver = Resolver()
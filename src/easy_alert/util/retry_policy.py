@@ -0,0 +1,126 @@
+import sys
+import time
+import random
+from case_class import CaseClass
+from worker_pool import JobCancelled
+
+
+class RetryPolicy(CaseClass):
+    """
+    Retry with exponential backoff and full jitter
+
+    The n-th wait (from 0) is random(0, min(max_backoff, backoff * multiplier ** n)) seconds,
+    so the clients failing at the same time do not retry in lockstep.
+    Without jitter, the wait is exactly the upper bound (e.g. multiplier=1 gives the fixed interval).
+
+    No attempt is made if the cancel event given by the caller has been set already (JobCancelled is raised).
+    Retries stop when any of these happens, and then the last exception is raised:
+      - `count` retries have been made
+      - the exception is not retryable
+      - the next attempt would start after the deadline of the call, or after the budget given by the caller
+      - the cancel event given by the caller is set while waiting
+    """
+
+    DEFAULT_BACKOFF = 1.0
+    DEFAULT_MAX_BACKOFF = 30.0
+    DEFAULT_MULTIPLIER = 2.0
+
+    def __init__(self, count, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF, multiplier=DEFAULT_MULTIPLIER,
+                 jitter=True, deadline=None, retryable=None, clock=time.time, rand=random.random, sleep=time.sleep):
+        """
+        :param count: maximum number of the retries
+        :param backoff: upper bound of the first wait in seconds
+        :param max_backoff: upper bound of the every wait in seconds
+        :param multiplier: ratio of the upper bound to the previous one
+        :param jitter: randomize the wait in [0, upper bound) if true
+        :param deadline: maximum seconds from the first attempt to the start of the last attempt (None: no limit)
+        :param retryable: function(exception) which returns true if the call should be retried (default: always)
+        :param clock: function which returns the current time in seconds
+        :param rand: function which returns a random float in [0.0, 1.0)
+        :param sleep: function which waits for the given seconds
+        """
+        super(RetryPolicy, self).__init__(['count', 'backoff', 'max_backoff', 'multiplier', 'jitter', 'deadline'])
+        if count < 0:
+            raise ValueError('Retry count should not be negative: %s' % count)
+
+        self.count = count
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retryable = retryable or (lambda e: True)
+        self.clock = clock
+        self.rand = rand
+        self.sleep = sleep
+
+    @classmethod
+    def from_config(cls, value, retryable=None):
+        """
+        :param value: number of the retries, or dict of {count, backoff, max_backoff, multiplier, jitter, deadline}
+        :param retryable: function(exception) which returns true if the call should be retried
+        :return: RetryPolicy instance
+        """
+        if not isinstance(value, dict):
+            return cls(int(value), retryable=retryable)
+
+        unknown = sorted(set(value.keys()) - set(['count', 'backoff', 'max_backoff', 'multiplier', 'jitter',
+                                                  'deadline']))
+        if unknown:
+            raise ValueError('Unknown retry key: %s' % ', '.join(unknown))
+        if not isinstance(value.get('jitter', True), bool):
+            raise ValueError('Retry jitter should be bool: %s' % value['jitter'])
+
+        deadline = value.get('deadline')
+        return cls(
+            int(value.get('count', 0)),
+            backoff=float(value.get('backoff', cls.DEFAULT_BACKOFF)),
+            max_backoff=float(value.get('max_backoff', cls.DEFAULT_MAX_BACKOFF)),
+            multiplier=float(value.get('multiplier', cls.DEFAULT_MULTIPLIER)),
+            jitter=value.get('jitter', True),
+            deadline=None if deadline is None else float(deadline),
+            retryable=retryable,
+        )
+
+    def get_wait(self, n):
+        """
+        :param n: number of the retries made so far
+        :return: seconds to wait before the next attempt
+        """
+        upper = min(self.max_backoff, self.backoff * self.multiplier ** n)
+        return self.rand() * upper if self.jitter else upper
+
+    def call(self, thunk, budget=None, cancel=None):
+        """
+        :param thunk: function to call
+        :param budget: absolute time (by the clock) when the caller gives up (None: no limit)
+        :param cancel: threading.Event which stops waiting when set
+        :return: return value of the thunk
+        """
+        start = self.clock()
+        ends = [t for t in [budget, None if self.deadline is None else start + self.deadline] if t is not None]
+        end = min(ends) if ends else None
+
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled('Cancelled before the first attempt')
+
+        n = 0
+        while True:
+            try:
+                return thunk()
+            except Exception as e:
+                exc_info = sys.exc_info()
+                if n >= self.count or not self.retryable(e):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                wait = self.get_wait(n)
+                if end is not None and self.clock() + wait >= end:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                if cancel is None:
+                    self.sleep(wait)
+                else:
+                    cancel.wait(wait)
+                    if cancel.is_set():
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                n += 1
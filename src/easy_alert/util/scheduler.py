@@ -0,0 +1,139 @@
+import time
+import random
+import threading
+
+
+class Scheduler(object):
+    """
+    Run jobs periodically on WorkerPool
+
+    Each run is delayed by a random jitter (up to `jitter` * interval) so that jobs sharing the same interval
+    do not fire in lockstep. When the previous run of a job is still busy, the tick is skipped.
+
+    A triggered run starts no earlier than `debounce` seconds after the previous run has finished,
+    so a burst of triggers (e.g. file events on a busy log) is merged into one run.
+    """
+
+    DEFAULT_JITTER = 0.1
+    MAX_SLEEP = 1.0  # seconds
+
+    class Job(object):
+        def __init__(self, name, interval, f, base_time, debounce):
+            self.name = name
+            self.interval = interval
+            self.debounce = debounce
+            self.f = f
+            self.base_time = base_time
+            self.next_time = base_time
+            self.future = None
+            self.skipped = 0
+            self.triggered = False
+            self.finished_time = None
+
+    def __init__(self, pool, logger, jitter=DEFAULT_JITTER, clock=time.time, rand=random.random):
+        """
+        :param pool: WorkerPool instance
+        :param logger: Logger instance
+        :param jitter: ratio of the maximum random delay to the interval
+        :param clock: function which returns the current time in seconds
+        :param rand: function which returns a random float in [0.0, 1.0)
+        """
+        self.pool = pool
+        self.logger = logger
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+        self.jobs = []
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+
+    def add(self, name, interval, f, debounce=0):
+        """
+        Register a job. The first run is scheduled right after the start with jitter.
+
+        :param name: job name for logging
+        :param interval: interval in seconds
+        :param f: function to call with no arguments
+        :param debounce: minimum seconds from the end of the previous run to the triggered run
+        """
+        if interval <= 0:
+            raise ValueError('Interval should be positive: %s' % interval)
+        if debounce < 0:
+            raise ValueError('Debounce should not be negative: %s' % debounce)
+        job = self.Job(name, interval, f, self.clock(), debounce)
+        self._set_next_time(job)
+        self.jobs.append(job)
+
+    def run(self):
+        """Block and run the jobs until stop() is called"""
+
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            now = self.clock()
+            for job in self.jobs:
+                if job.next_time <= now:
+                    self._fire(job, now)
+                elif job.triggered and self._is_idle(job) and self._get_trigger_time(job) <= now:
+                    self._submit(job)
+            self._wakeup.wait(self._time_to_wait())
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def trigger(self, name):
+        """
+        Run the job right away (thread-safe)
+
+        :param name: job name
+        """
+        for job in self.jobs:
+            if job.name == name:
+                job.triggered = True
+        self._wakeup.set()
+
+    def is_stopped(self):
+        return self._stopped.is_set()
+
+    def _fire(self, job, now):
+        if not self._is_idle(job):
+            job.skipped += 1
+            self.logger.warn('Skipped the tick for %s: previous run is still busy.' % job.name)
+        else:
+            self._submit(job)
+
+        # keep the cadence, but never try to catch up with missed ticks
+        job.base_time += job.interval
+        if job.base_time <= now:
+            job.base_time = now + job.interval
+        self._set_next_time(job)
+
+    @staticmethod
+    def _is_idle(job):
+        return job.future is None or job.future.done()
+
+    def _submit(self, job):
+        job.triggered = False
+        job.future = self.pool.submit(job.f)
+        job.future.add_done_callback(lambda _: self._on_done(job))
+
+    def _on_done(self, job):
+        job.finished_time = self.clock()
+        self._wakeup.set()  # a triggered run may be waiting for this run
+
+    @staticmethod
+    def _get_trigger_time(job):
+        """
+        :return: earliest time for the triggered run
+        """
+        return 0 if job.finished_time is None else job.finished_time + job.debounce
+
+    def _set_next_time(self, job):
+        job.next_time = job.base_time + self.rand() * self.jitter * job.interval
+
+    def _time_to_wait(self):
+        if not self.jobs:
+            return self.MAX_SLEEP
+        times = [j.next_time for j in self.jobs]
+        times.extend(self._get_trigger_time(j) for j in self.jobs if j.triggered and self._is_idle(j))
+        return max(0.0, min(self.MAX_SLEEP, min(times) - self.clock()))
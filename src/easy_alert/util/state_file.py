@@ -0,0 +1,48 @@
+import os
+import errno
+
+
+def load_state_file(path, parse, default=None, tolerant=False, description='state file'):
+    """
+    Read the small file which keeps the state across the runs (e.g. positions, checkpoints and caches)
+
+    :param path: path to the file
+    :param parse: function which takes the file content and returns the state,
+                  raising ValueError, KeyError, TypeError or IndexError if the content is broken
+    :param default: state returned when the file does not exist
+    :param tolerant: return the default also for the broken file if true (for the state which can be rebuilt)
+    :param description: name of the file for the error message
+    :return: parsed state
+    """
+    try:
+        with open(path) as f:
+            data = f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return default
+
+    try:
+        return parse(data)
+    except (ValueError, KeyError, TypeError, IndexError):
+        if tolerant:
+            return default
+        raise ValueError('Broken %s: %s' % (description, path))
+
+
+def save_state_file(path, data):
+    """
+    Replace the file with the data atomically
+
+    The data is written to '<path>.tmp' and synced first, then renamed to the path,
+    so a crash leaves either the old file or the new file, never a broken one.
+
+    :param path: path to the file
+    :param data: string to write
+    """
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
@@ -0,0 +1,48 @@
+class TickCache(object):
+    """
+    Memoize the results of a unary function across periodic runs (ticks)
+
+    An entry is evicted when its key has not been looked up for `max_idle_ticks` ticks,
+    so the memory stays bounded even if the keys keep changing.
+    """
+
+    def __init__(self, f, max_idle_ticks):
+        """
+        :param f: unary function to memoize
+        :param max_idle_ticks: number of ticks to keep the entry which has not been used
+        """
+        if max_idle_ticks < 1:
+            raise ValueError('max_idle_ticks should be positive: %s' % max_idle_ticks)
+
+        self.f = f
+        self.max_idle_ticks = max_idle_ticks
+        self.tick_count = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> [value, last used tick]
+
+    def __call__(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            value = self.f(key)
+            self._entries[key] = [value, self.tick_count]
+            return value
+
+        self.hits += 1
+        entry[1] = self.tick_count
+        return entry[0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def tick(self):
+        """Advance the tick, then evict the idle entries"""
+
+        self.tick_count += 1
+        limit = self.tick_count - self.max_idle_ticks
+        for key in [k for k, e in self._entries.iteritems() if e[1] < limit]:
+            del self._entries[key]
@@ -1,4 +1,4 @@
-import time
+from retry_policy import RetryPolicy
 
 
 def apply_option(f, arg):
@@ -23,21 +23,9 @@ def exists(opt, predicate):
 
 def with_retry(count, interval=1):
     """
-    Retryable function execution
+    Retryable function execution with the fixed interval (see RetryPolicy for the backoff and the jitter)
     :param count: retry limit
     :param interval: retry interval in sec
     :return:
     """
-
-    def f(thunk, c=count, it=interval):
-        while True:
-            try:
-                return thunk()
-            except Exception as e:
-                if c > 0:
-                    c -= 1
-                    time.sleep(it)
-                else:
-                    raise e
-
-    return f
+    return RetryPolicy(count, backoff=interval, max_backoff=interval, multiplier=1, jitter=False).call
@@ -0,0 +1,205 @@
+import sys
+import time
+import threading
+from Queue import Queue, Empty
+
+
+class WorkerTimeout(Exception):
+    """Raised when the result of a job is not ready in time"""
+
+
+class JobCancelled(Exception):
+    """Raised when the job was cancelled before it started"""
+
+
+class Future(object):
+    """
+    Placeholder for the result of the job submitted to WorkerPool
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """
+        Cancel the job if it has not started yet. Then get() raises JobCancelled.
+
+        :return: true if the job has been cancelled
+        """
+        self._lock.acquire()
+        try:
+            if self._started or self._event.is_set():
+                return False
+            e = JobCancelled('Job was cancelled before it started')
+            self._exc_info = (JobCancelled, e, None)
+        finally:
+            self._lock.release()
+        self._set_done()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish (or to be cancelled) without raising any error
+
+        :param timeout: maximum seconds to wait (wait forever if None)
+        :return: true if the job has finished
+        """
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def add_done_callback(self, fn):
+        """
+        Call the function with this future when the job finishes (or right away if it has finished)
+        """
+        self._lock.acquire()
+        try:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        fn(self)
+
+    def get(self, timeout=None):
+        """
+        Wait for the job to finish, then return its result.
+        The exception raised by the job is re-raised here.
+
+        :param timeout: maximum seconds to wait (wait forever if None)
+        :return: return value of the job
+        """
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise WorkerTimeout('Job did not finish in %s sec' % timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def _run(self, f, args):
+        self._lock.acquire()
+        try:
+            if self._event.is_set():
+                return  # cancelled
+            self._started = True
+        finally:
+            self._lock.release()
+
+        try:
+            self._result = f(*args)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        self._set_done()
+
+    def _set_done(self):
+        self._lock.acquire()
+        try:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for fn in callbacks:
+            fn(self)
+
+
+class WorkerPool(object):
+    """
+    Run jobs concurrently with the bounded number of worker threads
+
+    Threads are started lazily up to the worker count.
+    Worker threads are daemonic, so a hanging job never blocks the interpreter from exiting.
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: maximum number of the worker threads
+        """
+        if workers < 1:
+            raise ValueError('Number of workers should be positive: %s' % workers)
+
+        self.workers = workers
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
+
+    def submit(self, f, *args):
+        """
+        Schedule the function call
+        :param f: function to call
+        :param args: arguments for the function
+        :return: Future instance
+        """
+        future = Future()
+        self._queue.put((future, f, args))
+
+        self._lock.acquire()
+        try:
+            if len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+        finally:
+            self._lock.release()
+        return future
+
+    def map(self, f, xs):
+        """
+        Call the function for each element concurrently
+        :return: list of Future instances in the same order as the input
+        """
+        return [self.submit(f, x) for x in xs]
+
+    def shutdown(self, wait=False, timeout=None, cancel_pending=False):
+        """
+        Let all the worker threads exit after the queued jobs are done
+        :param wait: wait for the worker threads to exit if true
+        :param timeout: maximum seconds to wait in total (wait forever if None)
+        :param cancel_pending: cancel the queued jobs which have not started yet if true
+        """
+        self._lock.acquire()
+        try:
+            if cancel_pending:
+                markers = 0
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is None:
+                        markers += 1  # put by the previous shutdown
+                    else:
+                        item[0].cancel()
+                for _ in range(markers):
+                    self._queue.put(None)
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(None)
+        finally:
+            self._lock.release()
+
+        if wait:
+            deadline = None if timeout is None else time.time() + timeout
+            for t in threads:
+                t.join(None if deadline is None else max(0.0, deadline - time.time()))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, f, args = item
+            future._run(f, args)
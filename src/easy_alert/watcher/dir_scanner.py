@@ -0,0 +1,69 @@
+import os
+import glob
+import fnmatch
+
+
+class ScannedFile(object):
+    """
+    File found by scan_files(). The stat is taken only when needed, and only once.
+    """
+
+    __slots__ = ('path', '_stat')
+
+    def __init__(self, path):
+        """
+        :param path: path to the file
+        """
+        self.path = path
+        self._stat = None
+
+    def stat(self):
+        """
+        :return: result of stat, or None if the file has been removed
+        """
+        if self._stat is None:
+            try:
+                self._stat = os.stat(self.path)
+            except OSError:
+                self._stat = False
+        return self._stat or None
+
+
+def scan_files(patterns):
+    """
+    Find the files matching each glob pattern, listing the directory only once
+
+    The names are filtered with fnmatch for each pattern in the same way as glob,
+    and a file matching several patterns shares its stat.
+    If the patterns are not in the same directory, or the directory part has wildcards, glob is used instead.
+
+    :param patterns: list of glob patterns
+    :return: list (one for each pattern) of the lists of ScannedFile instances sorted by path
+    """
+    dir_paths = set(os.path.dirname(p) for p in patterns)
+    if len(dir_paths) != 1 or glob.has_magic(list(dir_paths)[0]):
+        return [_glob_files(p) for p in patterns]
+
+    dir_path = dir_paths.pop()
+    names = sorted(_list_dir(dir_path or os.curdir))  # fnmatch.filter keeps the order
+    visible = [name for name in names if name[0] != '.']
+
+    matched = [_filter(names, visible, os.path.basename(p)) for p in patterns]
+    files = dict((name, ScannedFile(os.path.join(dir_path, name))) for name in set().union(*matched))
+    return [[files[name] for name in m] for m in matched]
+
+
+def _filter(names, visible, base):
+    # same as glob: names starting with '.' match only the patterns starting with '.'
+    return fnmatch.filter(names if base.startswith('.') else visible, base)
+
+
+def _list_dir(dir_path):
+    try:
+        return os.listdir(dir_path)
+    except OSError:
+        return []  # same as glob for the missing directory
+
+
+def _glob_files(pattern):
+    return [ScannedFile(path) for path in sorted(glob.glob(pattern))]
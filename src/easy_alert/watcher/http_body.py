@@ -0,0 +1,156 @@
+class BodyTooLarge(Exception):
+    """Raised when the response body exceeds the limit before the check is decided"""
+
+
+class BodyChecker(object):
+    """
+    Read the response body in chunks, and stop as soon as the result of the check is decided
+
+    The check is decided when any expectation has failed, or when all the expectations have passed:
+      expect_code  : decided by the status code, before reading the body
+      expect_size  : decided once the size has passed the threshold (e.g. '>= 100' after reading 100 bytes)
+      expect_regexp: decided when the pattern has matched
+
+    The body is kept only for expect_regexp, and only up to max_body_size bytes.
+    Each new chunk is searched together with the last `overlap` bytes, so a match across the chunks stops the read.
+    A match ending at the last byte or the end of the data read so far is not accepted yet,
+    since '$' can match before a trailing newline, and '\\b' depends on the next byte.
+    A pattern with a lookahead never stops the read early, since the lookahead can depend on any later byte.
+    If the pattern has not matched at the end, the whole body is searched once more, so the result is always exact.
+
+    Once the check is decided, the rest of the body is still read if it is at most `drain_size` bytes,
+    so that the keep-alive connection can be reused.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    DEFAULT_OVERLAP = 4096
+    DEFAULT_DRAIN_SIZE = 64 * 1024
+
+    def __init__(self, expect_code, expect_size, expect_regexp, max_body_size, overlap=DEFAULT_OVERLAP,
+                 drain_size=DEFAULT_DRAIN_SIZE):
+        self.expect_code = expect_code
+        self.expect_size = expect_size
+        self.expect_regexp = expect_regexp
+        self.max_body_size = max_body_size
+        self.overlap = overlap
+        self.drain_size = drain_size
+        self.early_match = expect_regexp is not None and not any(
+            s in expect_regexp.pattern for s in ['(?=', '(?!'])
+
+        self.size = 0
+        self.complete = False  # true if the whole body has been read
+        self.matched = False
+        self._buf = bytearray()
+
+    def __call__(self, code, resp):
+        """
+        Read the body until the check is decided
+
+        :param code: status code of the response
+        :param resp: file-like object of the body
+        :return: tuple(self, true if the whole body has been read)
+        """
+        while not self.is_decided(code):
+            if self.size > self.max_body_size:
+                raise BodyTooLarge('Response body exceeds max_body_size: %d bytes' % self.max_body_size)
+            chunk = resp.read(min(self.CHUNK_SIZE, self.max_body_size + 1 - self.size))
+            if not chunk:
+                self._finish()
+            else:
+                self._feed(chunk)
+
+        if not self.complete:
+            self._drain(resp)
+        return self, self.complete
+
+    def to_dict(self):
+        """
+        :return: dict of the result which can be serialized as JSON
+        """
+        return {'size': self.size, 'complete': self.complete, 'matched': self.matched}
+
+    def restore(self, d):
+        """
+        Restore the result of the previous check for the same content (e.g. on 304 Not Modified)
+
+        :param d: dict made by to_dict()
+        :return: self
+        """
+        self.size, self.complete, self.matched = d['size'], d['complete'], d['matched']
+        return self
+
+    def should_alert(self, code):
+        """
+        :return: true if any of the expectations has failed
+        """
+        return any([
+            self.expect_code is not None and self.expect_code != code,
+            self._size_result() is False,
+            self._regexp_result() is False,
+        ])
+
+    def is_decided(self, code):
+        if self.should_alert(code):
+            return True
+        return self._size_result() is not None and self._regexp_result() is not None
+
+    def get_size_text(self):
+        """
+        :return: size of the body, with '>=' if the body has not been read to the end
+        """
+        return '%d' % self.size if self.complete else '>=%d' % self.size
+
+    def _size_result(self):
+        """
+        :return: result of expect_size, or None if not decided yet
+        """
+        if self.expect_size is None:
+            return True
+        if self.complete:
+            return self.expect_size.check(self.size)
+
+        # every operator gives the same result for all the sizes above the threshold
+        t = self.expect_size.threshold
+        if self.size >= t and self.expect_size.check(self.size) == self.expect_size.check(t + 1):
+            return self.expect_size.check(self.size)
+        return None
+
+    def _regexp_result(self):
+        """
+        :return: result of expect_regexp, or None if not decided yet
+        """
+        if self.expect_regexp is None or self.matched:
+            return True
+        return False if self.complete else None
+
+    def _feed(self, chunk):
+        start = max(0, self.size - self.overlap)
+        self.size += len(chunk)
+        if self.expect_regexp is None:
+            return
+
+        self._buf += chunk
+        if self.early_match and not self.matched:
+            m = self.expect_regexp.search(self._buf, start)
+            self.matched = m is not None and m.end() < len(self._buf) - 1
+
+    def _drain(self, resp):
+        """
+        Read the rest of the body if it is small, without changing the result of the check
+        """
+        remaining = getattr(resp, 'length', None)  # Content-Length left to read (httplib.HTTPResponse)
+        if self.drain_size <= 0 or (remaining is not None and remaining > self.drain_size):
+            return
+
+        limit = self.size + self.drain_size
+        while self.size <= limit:
+            chunk = resp.read(min(self.CHUNK_SIZE, limit + 1 - self.size))
+            if not chunk:
+                self._finish()
+                return
+            self._feed(chunk)
+
+    def _finish(self):
+        self.complete = True
+        if self.expect_regexp is not None and not self.matched:
+            self.matched = self.expect_regexp.search(self._buf) is not None
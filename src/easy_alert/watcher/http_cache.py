@@ -0,0 +1,102 @@
+import json
+import threading
+from easy_alert.util import CaseClass, load_state_file, save_state_file
+
+
+class ValidatorCache(CaseClass):
+    """
+    Validators (ETag and Last-Modified) and the verdicts of the body checks of HTTPWatcher, saved as a JSON file
+
+    For each url, the cache records
+      expect       : expectations of the body (the entry is ignored if they have changed)
+      etag         : ETag header of the last response
+      last_modified: Last-Modified header of the last response
+      code         : status code of the last response
+      body         : result of the body check (see BodyChecker.to_dict())
+    """
+
+    def __init__(self, path):
+        super(ValidatorCache, self).__init__(['path'])
+        self.path = path
+        self.entries = {}  # url -> dict
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load the cache file. A broken file is ignored, since the validators are fetched again anyway.
+
+        :return: self
+        """
+        entries = load_state_file(self.path, lambda data: json.loads(data)['entries'], {}, tolerant=True)
+        self.entries = entries if isinstance(entries, dict) else {}
+        self.loaded = True
+        return self
+
+    def save(self):
+        self._lock.acquire()
+        try:
+            data = json.dumps({'entries': self.entries})
+        finally:
+            self._lock.release()
+        save_state_file(self.path, data)
+
+    def get(self, url, expect):
+        """
+        :param url: url string
+        :param expect: string which represents the expectations of the body
+        :return: dict of the entry or None if not cached
+        """
+        self._lock.acquire()
+        try:
+            entry = self.entries.get(url)
+        finally:
+            self._lock.release()
+
+        if entry is None or entry.get('expect') != expect:
+            return None
+        return entry
+
+    def update(self, url, expect, etag, last_modified, code, body):
+        """
+        :param url: url string
+        :param expect: string which represents the expectations of the body
+        :param etag: ETag header or None
+        :param last_modified: Last-Modified header or None
+        :param code: status code
+        :param body: dict of the result of the body check
+        """
+        self._lock.acquire()
+        try:
+            if etag is None and last_modified is None:
+                self.entries.pop(url, None)
+            else:
+                self.entries[url] = {
+                    'expect': expect, 'etag': etag, 'last_modified': last_modified, 'code': code, 'body': body
+                }
+        finally:
+            self._lock.release()
+
+    def retain(self, urls):
+        """Forget the urls not in the list"""
+        self._lock.acquire()
+        try:
+            for url in list(self.entries.keys()):
+                if url not in urls:
+                    del self.entries[url]
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def get_request_headers(entry):
+        """
+        :param entry: dict of the entry or None
+        :return: dict of the headers for the conditional request
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
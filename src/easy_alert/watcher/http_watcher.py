@@ -1,35 +1,83 @@
+import os
 import re
+import time
 import urllib2
+import threading
 from urlparse import urlparse
 from datetime import datetime
 from watcher import Watcher
+from http_body import BodyChecker, BodyTooLarge
+from http_cache import ValidatorCache
 from easy_alert.entity import Alert, Level
 from easy_alert.i18n import *
 from easy_alert.setting.setting_error import SettingError
-from easy_alert.util import Matcher, get_server_id, apply_option, with_retry, exists
+from easy_alert.util import Matcher, WorkerPool, WorkerTimeout, JobCancelled, HTTPConnectionPool, RequestTiming
+from easy_alert.util import RetryPolicy, get_header
+from easy_alert.util import get_server_id, apply_option
 
 
 class HTTPWatcher(Watcher):
     """
     Check http(s) connection and response to the url
 
-    configuration should be a list of this dict
+    configuration should be a list of the target dicts, or a dict with these keys
+      targets  [required]: list of the target dicts
+      concurrency        : maximum number of the urls to check at the same time (default:10)
+      deadline           : maximum seconds to wait for all the checks (default:50)
+      cache              : path to the file to cache the validators (ETag, Last-Modified) and the body check results
+
+    The urls are checked concurrently, and the checks not finished by the deadline are reported as errors.
+    The urls not started by the deadline are reported as not checked, and never fetched afterwards.
+    Retries wait with exponential backoff and full jitter, and stop waiting when the deadline comes.
+    Client errors (HTTP 4xx except 408 and 429) are not retried.
+    The results are always in the order of the configuration.
+    Keep-alive connections are reused for each host during the check, and across the ticks in the daemon mode.
+    The body is read only until the result of the check is decided (e.g. once expect_regexp has matched).
+
+    target dict
       name    [required]: short description for the url
       level   [required]: alert level (should be in {critical, error, warn, info, debug})
       url     [required]: url string (scheme should be http or https)
       timeout           : connection timeout in second (default:10)
-      retry             : max count to retry (default:2)
+      retry             : max count to retry (default:2), or dict of the retry policy
+                            {count, backoff, max_backoff, multiplier, jitter, deadline} (see RetryPolicy)
       additional_info   : additional information string (default:empty string)
+      max_body_size     : maximum bytes of the body to read for the check (default:10485760)
       expect_code    [*]: expected status code of the response
       expect_size    [*]: expected data size in matcher format (e.g. '=123', '< 123', '>=123')
       expect_regexp  [*]: expected content text in regexp
+      expect_latency [*]: expected total time in milliseconds in matcher format (e.g. '< 500')
+
+    * Any of {expect_code, expect_size, expect_regexp, expect_latency} is required.
+
+    The alert shows the timings of the check (dns, connect, tls, time to first byte and total),
+    so a slow backend can be told apart from slow name resolution.
 
-    * Any of {expect_code, expect_size, expect_text} is required.
+    With the cache, the targets with expect_size or expect_regexp send a conditional request (If-None-Match,
+    If-Modified-Since), and the previous result of the body check is reused on 304 Not Modified.
+    The cache is saved after the alerts have been sent.
     """
     DEFAULT_TIMEOUT = 10
     DEFAULT_RETRY = 2
+    DEFAULT_MAX_BODY_SIZE = 10 * 1024 * 1024
+    DEFAULT_CONCURRENCY = 10
+    DEFAULT_DEADLINE = 50
+
+    def __init__(self, http_setting, print_only=False):
+        concurrency = self.DEFAULT_CONCURRENCY
+        deadline = self.DEFAULT_DEADLINE
+        cache = None
+        if isinstance(http_setting, dict) and 'targets' in http_setting:
+            try:
+                concurrency = int(http_setting.get('concurrency', self.DEFAULT_CONCURRENCY))
+                deadline = float(http_setting.get('deadline', self.DEFAULT_DEADLINE))
+                cache = apply_option(lambda p: ValidatorCache(os.path.expanduser(p)), http_setting.get('cache'))
+            except Exception as e:
+                raise SettingError('HTTPWatcher settings syntax error: %s' % e)
+            if concurrency < 1:
+                raise SettingError('HTTPWatcher concurrency should be positive: %s' % concurrency)
+            http_setting = http_setting['targets']
 
-    def __init__(self, http_setting):
         if not isinstance(http_setting, list):
             raise SettingError('HTTPWatcher settings not a list: %s' % http_setting)
 
@@ -43,11 +91,13 @@ class HTTPWatcher(Watcher):
                 level = self.__get_level(s['level'])
                 url = s['url']
                 timeout = int(s.get('timeout', self.DEFAULT_TIMEOUT))
-                retry = int(s.get('retry', self.DEFAULT_RETRY))
+                retry = RetryPolicy.from_config(s.get('retry', self.DEFAULT_RETRY), retryable=self._is_retryable)
                 additional_info = s.get('additional_info', '')
                 expect_code = apply_option(int, s.get('expect_code'))
                 expect_size = apply_option(Matcher, s.get('expect_size'))
                 expect_regexp = apply_option(re.compile, s.get('expect_regexp'))
+                max_body_size = int(s.get('max_body_size', self.DEFAULT_MAX_BODY_SIZE))
+                expect_latency = apply_option(Matcher, s.get('expect_latency'))
             except SettingError as e:
                 raise e
             except KeyError as e:
@@ -56,13 +106,18 @@ class HTTPWatcher(Watcher):
                 raise SettingError('HTTPWatcher settings syntax error: %s' % e)
 
             self.__verify_url(url)
-            if all([expect_code is None, expect_size is None, expect_regexp is None]):
-                raise SettingError('HTTPWatcher any of expect_code, expect_size or expect_regexp should be set.')
+            if all([expect_code is None, expect_size is None, expect_regexp is None, expect_latency is None]):
+                raise SettingError(
+                    'HTTPWatcher any of expect_code, expect_size, expect_regexp or expect_latency should be set.')
 
-            settings.append((
-                name, level, url, timeout, retry, additional_info, expect_code, expect_size, expect_regexp))
+            settings.append((name, level, url, timeout, retry, additional_info, expect_code, expect_size,
+                             expect_regexp, max_body_size, expect_latency))
 
-        super(HTTPWatcher, self).__init__(settings=settings)
+        super(HTTPWatcher, self).__init__(settings=settings, concurrency=concurrency, deadline=deadline, cache=cache,
+                                          print_only=print_only)
+
+        # runtime state (not a part of the settings)
+        self.connection_pool = HTTPConnectionPool(max_idle_per_host=concurrency)
 
     @staticmethod
     def __verify_url(url):
@@ -78,52 +133,127 @@ class HTTPWatcher(Watcher):
             raise SettingError('HTTPWatcher invalid level: %s' % level_str)
         return level[0]
 
-    @staticmethod
-    def _connect_url(url, timeout):
-        u = urllib2.urlopen(url, timeout=timeout)
-        data = u.read()
-        return u.getcode(), data
+    def _connect_url(self, url, timeout, consumer, timing, headers):
+        """
+        :param consumer: function(status code, response) which reads the body (see HTTPConnectionPool)
+        :param timing: RequestTiming instance to record the timings
+        :param headers: dict of the additional request headers
+        :return: tuple(status code, result of the consumer)
+        """
+        return self.connection_pool.urlopen(url, timeout, consumer, timing, headers)
 
     @staticmethod
-    def _should_alert(code, data, expect_code, expect_size, expect_regexp):
-        return any([
-            exists(expect_code, lambda x: x != code),
-            exists(expect_size, lambda x: not x.check(len(data))),
-            exists(expect_regexp, lambda x: not x.findall(data)),
-        ])
+    def _is_retryable(e):
+        if isinstance(e, urllib2.HTTPError):
+            return e.code >= 500 or e.code in [408, 429]
+        return not isinstance(e, BodyTooLarge)
+
+    def _check(self, setting, budget=None, cancel=None):
+        """
+        :param setting: tuple of the settings for one url
+        :param budget: absolute time when the retries should give up
+        :param cancel: threading.Event which stops the retries when set
+        :return: tuple(level, message) if it should alert, otherwise None
+        """
+        name, level, url, timeout, retry, additional_info, expect_code, expect_size, expect_regexp, max_body_size, \
+            expect_latency = setting
+
+        # the cached result is valid only for the same expectations of the body
+        expect = None
+        entry = None
+        if self.cache is not None and (expect_size is not None or expect_regexp is not None):
+            expect = '%s|%s' % (expect_size, expect_regexp.pattern if expect_regexp else None)
+            entry = self.cache.get(url, expect)
+        headers = ValidatorCache.get_request_headers(entry)
+
+        def connect():
+            checker = BodyChecker(expect_code, expect_size, expect_regexp, max_body_size)
+            validators = []
+
+            def consume(c, resp):
+                if expect is not None:
+                    validators[:] = [get_header(resp, 'etag'), get_header(resp, 'last-modified')]
+                if c == 304 and entry is not None:
+                    resp.read()
+                    return checker.restore(entry['body']), True
+                return checker(c, resp)
+
+            t = RequestTiming()
+            c, b = self._connect_url(url, timeout, consume, t, headers)
+            if c == 304 and entry is not None:
+                c = entry['code']
+                self.cache.update(url, expect, validators[0] or entry['etag'],
+                                  validators[1] or entry['last_modified'], c, entry['body'])
+            elif expect is not None and 200 <= c < 300:
+                self.cache.update(url, expect, validators[0], validators[1], c, b.to_dict())
+            return c, b, t
+
+        code, body, timing = retry.call(connect, budget, cancel)
+        millis = timing.to_millis()
+        if body.should_alert(code) or (expect_latency is not None and not expect_latency.check(millis['total'])):
+            mapping = {
+                'level': level.get_text(),
+                'name': name,
+                'url': url,
+                'code': code,
+                'size': body.get_size_text(),
+                'expect_code': expect_code,
+                'expect_size': expect_size,
+                'expect_regexp': expect_regexp.pattern if expect_regexp else None,
+                'expect_latency': expect_latency,
+                'additional_info': additional_info,
+            }
+            mapping.update(millis)
+            return level, MSG_HTTP_ALERT_FORMAT % mapping
+        return None
 
     def watch(self):
         """
         :return: list of Alert instances
         """
         start_time = datetime.now()
+        deadline = time.time() + self.deadline
+        cancel = threading.Event()
+        if self.cache is not None and not self.cache.loaded:
+            self.cache.load()
 
-        result = []
-        for name, level, url, timeout, retry, additional_info, expect_code, expect_size, expect_regexp in self.settings:
-            try:
-                code, data = with_retry(retry)(lambda: self._connect_url(url, timeout))
-                if self._should_alert(code, data, expect_code, expect_size, expect_regexp):
-                    message = MSG_HTTP_ALERT_FORMAT % {
-                        'level': level.get_text(),
-                        'name': name,
-                        'url': url,
-                        'code': code,
-                        'size': len(data),
-                        'expect_code': expect_code,
-                        'expect_size': expect_size,
-                        'expect_regexp': expect_regexp.pattern if expect_regexp else None,
-                        'additional_info': additional_info,
-                    }
-                    result.append((level, message))
-            except Exception as e:
+        # worker threads are daemonic, so the checks hanging after the deadline are just left behind
+        pool = WorkerPool(min(self.concurrency, max(1, len(self.settings))))
+        try:
+            futures = pool.map(lambda s: self._check(s, deadline, cancel), self.settings)
+            for future in futures:
+                future.wait(max(0.0, deadline - time.time()))
+
+            # the urls still in the queue are never fetched after the deadline
+            cancel.set()
+            pool.shutdown(cancel_pending=True)
+
+            result = []
+            for s, future in zip(self.settings, futures):
+                try:
+                    r = future.get(0)
+                    if r is not None:
+                        result.append(r)
+                    continue
+                except JobCancelled:
+                    error = MSG_HTTP_NOT_CHECKED % {'deadline': self.deadline}
+                except WorkerTimeout:
+                    error = 'WorkerTimeout: Job did not finish in %s sec' % self.deadline
+                except Exception as e:
+                    error = '%s: %s' % (e.__class__.__name__, e)
+
+                name, level, url, additional_info = s[0], s[1], s[2], s[5]
                 message = MSG_HTTP_ALERT_FORMAT_ERR % {
                     'level': level.get_text(),
                     'name': name,
                     'url': url,
-                    'error': '%s: %s' % (e.__class__.__name__,  e),
+                    'error': error,
                     'additional_info': additional_info,
                 }
                 result.append((level, message))
+        finally:
+            cancel.set()
+            pool.shutdown(cancel_pending=True)
 
         if result:
             max_level = max(r[0] for r in result)
@@ -131,3 +261,15 @@ class HTTPWatcher(Watcher):
             return [Alert(start_time, max_level, MSG_HTTP_ALERT_TITLE, message)]
         else:
             return []
+
+    def after_success(self):
+        """Save the cache after the notification."""
+
+        if self.cache is None:
+            return
+
+        self.cache.retain([s[2] for s in self.settings])
+        if self.print_only:
+            print('Would update cache: %s' % self.cache.path)
+        else:
+            self.cache.save()
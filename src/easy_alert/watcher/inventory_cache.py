@@ -0,0 +1,116 @@
+import json
+import time
+import threading
+from easy_alert.util import CaseClass, load_state_file, save_state_file
+
+
+class InventoryCache(CaseClass):
+    """
+    Parsed output of the dynamic inventory commands of SSHWatcher, saved as a JSON file
+
+    For each command string, the cache records
+      time : time when the command succeeded
+      hosts: list of [host, name]
+
+    An entry younger than `ttl` seconds is used without running the command.
+    When the command fails, an entry younger than `max_stale` seconds is used instead (stale-while-error).
+    """
+
+    DEFAULT_TTL = 300
+    DEFAULT_MAX_STALE = 86400
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_stale=DEFAULT_MAX_STALE, clock=time.time):
+        """
+        :param path: path to the cache file
+        :param ttl: seconds to use the entry without running the command
+        :param max_stale: seconds to use the entry when the command fails
+        :param clock: function which returns the current time in seconds
+        """
+        super(InventoryCache, self).__init__(['path', 'ttl', 'max_stale'])
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.clock = clock
+        self.entries = {}  # command -> dict
+        self.loaded = False
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load the cache file. A broken file only makes the commands run once more.
+
+        :return: self
+        """
+        entries = load_state_file(self.path, lambda data: json.loads(data)['entries'], {}, tolerant=True)
+        self.entries = entries if isinstance(entries, dict) else {}
+        self.loaded = True
+        self.dirty = False
+        return self
+
+    def save(self):
+        """Write the cache file only if any entry has changed."""
+
+        self._lock.acquire()
+        try:
+            if not self.dirty:
+                return
+            data = json.dumps({'entries': self.entries})
+            self.dirty = False
+        finally:
+            self._lock.release()
+        save_state_file(self.path, data)
+
+    def get(self, command, max_age):
+        """
+        :param command: command string
+        :param max_age: maximum age of the entry in seconds
+        :return: list of tuple(host, name) or None if not cached
+        """
+        self._lock.acquire()
+        try:
+            entry = self.entries.get(command)
+        finally:
+            self._lock.release()
+
+        try:
+            if entry is None or self.clock() - entry['time'] >= max_age:
+                return None
+            return [(host, name) for host, name in entry['hosts']]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def get_time(self, command):
+        """
+        :param command: command string
+        :return: time when the command succeeded, or None if not cached
+        """
+        self._lock.acquire()
+        try:
+            entry = self.entries.get(command)
+        finally:
+            self._lock.release()
+        return entry.get('time') if isinstance(entry, dict) else None
+
+    def update(self, command, hosts):
+        """
+        :param command: command string
+        :param hosts: list of tuple(host, name)
+        """
+        self._lock.acquire()
+        try:
+            self.entries[command] = {'time': self.clock(), 'hosts': [list(h) for h in hosts]}
+            self.dirty = True
+        finally:
+            self._lock.release()
+
+    def retain(self, commands):
+        """Forget the commands not in the list"""
+        self._lock.acquire()
+        try:
+            for command in list(self.entries.keys()):
+                if command not in commands:
+                    del self.entries[command]
+                    self.dirty = True
+        finally:
+            self._lock.release()
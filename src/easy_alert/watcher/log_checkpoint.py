@@ -0,0 +1,77 @@
+import os
+import json
+from easy_alert.util import CaseClass, load_state_file, save_state_file
+
+
+class Checkpoint(CaseClass):
+    """
+    Progress of the target files of LogWatcher, saved as a JSON file
+
+    For each target file, the checkpoint records
+      inode, size: identity of the file (the entry is ignored if they have changed)
+      offset     : number of the bytes which have been parsed
+      summary    : LogSummary of the parsed bytes (as a dict)
+      notified   : true if the alert for the file has been sent
+    """
+
+    def __init__(self, path):
+        super(Checkpoint, self).__init__(['path'])
+        self.path = path
+        self.files = {}  # path to the target file -> dict
+
+    def load(self):
+        """
+        Load the checkpoint file. A missing file means an empty checkpoint.
+
+        :return: self
+        """
+        self.files = load_state_file(self.path, lambda data: json.loads(data)['files'], {},
+                                     description='checkpoint file')
+        return self
+
+    def save(self):
+        """
+        Write the checkpoint file atomically, or remove it if there is nothing to record.
+        """
+        if not self.files:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        save_state_file(self.path, json.dumps({'files': self.files}))
+
+    def get(self, path, st):
+        """
+        :param path: path to the target file
+        :param st: result of os.stat() for the target file
+        :return: dict of the entry or None if not recorded
+        """
+        entry = self.files.get(path)
+        if entry is None or entry['inode'] != st.st_ino or entry['size'] != st.st_size:
+            return None
+        return entry
+
+    def update(self, path, st, offset, summary):
+        """
+        :param path: path to the target file
+        :param st: result of os.stat() for the target file
+        :param offset: number of the bytes which have been parsed
+        :param summary: LogSummary instance of the parsed bytes
+        """
+        self.files[path] = {
+            'inode': st.st_ino, 'size': st.st_size, 'offset': offset, 'summary': summary.to_dict(), 'notified': False
+        }
+
+    def set_notified(self, path):
+        entry = self.files.get(path)
+        if entry is not None:
+            entry['notified'] = True
+            entry['summary'] = None  # not needed any more
+
+    def remove(self, path):
+        self.files.pop(path, None)
+
+    def retain(self, paths):
+        """Forget the files not in the paths"""
+        for path in list(self.files.keys()):
+            if path not in paths:
+                del self.files[path]
@@ -0,0 +1,108 @@
+import re
+import random
+
+# the order matters: longer tokens first
+MASKS = [
+    (re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'), '<UUID>'),
+    (re.compile(r'\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*[0-9])(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b'), '<HEX>'),
+    (re.compile(r'\d+'), '<NUM>'),
+]
+
+
+def fingerprint(message):
+    """
+    Mask the variable parts of the message: UUIDs, hex IDs and numbers
+
+    e.g. u'Timeout after 30s: request=1f2e3d4c5b6a' -> u'Timeout after <NUM>s: request=<HEX>'
+
+    :param message: message string
+    :return: template string
+    """
+    for pattern, mask in MASKS:
+        message = pattern.sub(mask, message)
+    return message
+
+
+class TemplateCounter(object):
+    """
+    Count the messages for each template with bounded memory
+
+    At most `max_templates` templates are counted individually.
+    The messages of the other templates are only counted in total,
+    and a reservoir sample of `sample_size` of them is kept as the examples.
+    """
+
+    def __init__(self, max_templates, sample_size, rand=random.random):
+        """
+        :param max_templates: maximum number of the templates to count individually
+        :param sample_size: maximum number of the examples of the other templates
+        :param rand: function which returns a random float in [0.0, 1.0)
+        """
+        self.max_templates = max_templates
+        self.sample_size = sample_size
+        self.rand = rand
+        self.counts = {}  # template -> [count, order of appearance]
+        self.other_count = 0
+        self.samples = []
+
+    def add(self, template, count=1):
+        entry = self.counts.get(template)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counts) < self.max_templates:
+            self.counts[template] = [count, len(self.counts)]
+        else:
+            self._add_other(template, count)
+
+    def _add_other(self, template, count=1):
+        # algorithm R, weighted by the count: the template replaces a sample with probability
+        # min(1, sample_size * count / other_count) in constant time
+        self.other_count += count
+        if len(self.samples) < self.sample_size:
+            self.samples.append(template)
+        else:
+            i = int(self.rand() * self.other_count)
+            if i < self.sample_size * count:
+                self.samples[i % self.sample_size] = template
+
+    def merge(self, other):
+        """
+        Merge the counter of the messages which come after the messages of this counter.
+        The samples are merged approximately.
+        """
+        for template, (count, _) in sorted(other.counts.items(), key=lambda x: x[1][1]):
+            self.add(template, count)
+        for template in other.samples:
+            self._add_other(template)
+        self.other_count += other.other_count - len(other.samples)
+
+    def top(self, n):
+        """
+        :return: list of tuple(template, count) of the most frequent templates (ties in order of appearance)
+        """
+        xs = sorted(self.counts.items(), key=lambda x: (-x[1][0], x[1][1]))[:n]
+        return [(template, count) for template, (count, _) in xs]
+
+    def to_dict(self):
+        """
+        :return: dict which can be serialized as JSON
+        """
+        return {
+            'max_templates': self.max_templates,
+            'sample_size': self.sample_size,
+            'counts': self.counts,
+            'other_count': self.other_count,
+            'samples': self.samples,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        :param d: dict made by to_dict()
+        :return: TemplateCounter instance
+        """
+        counter = cls(d['max_templates'], d['sample_size'])
+        counter.counts = d['counts']
+        counter.other_count = d['other_count']
+        counter.samples = d['samples']
+        return counter
@@ -0,0 +1,348 @@
+import os
+import gzip
+import json
+import mmap
+from logging import WARN
+
+from easy_alert.entity import Level
+from log_fingerprint import fingerprint, TemplateCounter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# chunk size in bytes for scanning a file
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# characters removed to leave only the tabs and newlines of a chunk
+_NON_SEPARATORS = ''.join(chr(i) for i in range(256) if chr(i) not in '\t\n')
+
+
+class LogFormatError(Exception):
+    """Class for log format error"""
+
+
+class LogSummary(object):
+    """
+    Summary of the log lines for each tag: the number of lines and the first N messages
+
+    The JSON part of a line is decoded only when its message is kept,
+    i.e. the lines for the tags which have already reached `message_num_threshold` are only counted.
+
+    If `max_templates` is positive, the messages are grouped by their fingerprints instead of keeping the first N.
+    """
+
+    def __init__(self, message_num_threshold, message_len_threshold, max_templates=0):
+        self.message_num_threshold = message_num_threshold
+        self.message_len_threshold = message_len_threshold
+        self.max_templates = max_templates
+        self.tags = {}  # tag -> [count, list of messages]
+        self.templates = {}  # tag -> TemplateCounter (only if max_templates is positive)
+        self.full_tags = {}  # tag -> entry of the tag which has reached the threshold
+        self.max_level = Level(WARN)
+        self._levels = {}  # tag -> Level
+
+    def add(self, tag, line, offset=0):
+        """
+        :param tag: tag string (the last component should be the level keyword)
+        :param line: string which contains JSON text including the 'message' key
+        :param offset: start position of the JSON text in the line
+        """
+        entry = self.full_tags.get(tag)
+        if entry is not None:
+            entry[0] += 1
+            return
+
+        self._append(tag, json.loads(line[offset:].decode('utf-8', 'ignore'))['message'])
+
+    def add_message(self, tag, message):
+        """
+        :param tag: tag string (the last component should be the level keyword)
+        :param message: raw message string
+        """
+        entry = self.full_tags.get(tag)
+        if entry is not None:
+            entry[0] += 1
+            return
+
+        self._append(tag, message.decode('utf-8', 'ignore'))
+
+    def _append(self, tag, msg):
+        entry = self.tags.get(tag)
+        if entry is None:
+            entry = [0, []]
+
+        if self.max_templates > 0:
+            counter = self.templates.get(tag)
+            if counter is None:
+                counter = self.templates[tag] = TemplateCounter(self.max_templates, self.message_num_threshold)
+            counter.add(fingerprint(msg[:self.message_len_threshold]))
+        else:
+            entry[1].append(msg[:self.message_len_threshold])
+
+        if tag not in self._levels:
+            level = Level(tag.split('.')[-1])
+            self._levels[tag] = level
+            self.max_level = max(self.max_level, level)
+
+        entry[0] += 1
+        self.tags[tag] = entry
+        if self.max_templates <= 0 and entry[0] >= self.message_num_threshold:
+            self.full_tags[tag] = entry
+
+    def merge(self, other):
+        """
+        Merge the summary of the lines which come after the lines of this summary
+
+        :param other: LogSummary instance with the same thresholds
+        """
+        for tag, (cnt, msgs) in other.tags.iteritems():
+            self.merge_entry(tag, cnt, msgs)
+        for tag, counter in other.templates.iteritems():
+            if tag in self.templates:
+                self.templates[tag].merge(counter)
+            else:
+                self.templates[tag] = counter
+        self._levels.update(other._levels)
+        self.max_level = max(self.max_level, other.max_level)
+
+    def merge_entry(self, tag, cnt, msgs):
+        entry = self.tags.setdefault(tag, [0, []])
+        entry[0] += cnt
+        entry[1].extend(msgs[:max(0, self.message_num_threshold - len(entry[1]))])
+        if self.max_templates <= 0 and entry[0] >= self.message_num_threshold:
+            self.full_tags[tag] = entry
+
+    def to_dict(self):
+        """
+        :return: dict which can be serialized as JSON
+        """
+        return {
+            'tags': self.tags,
+            'templates': dict((tag, counter.to_dict()) for tag, counter in self.templates.iteritems()),
+        }
+
+    @classmethod
+    def from_dict(cls, d, message_num_threshold, message_len_threshold, max_templates=0):
+        """
+        :param d: dict made by to_dict()
+        :return: LogSummary instance
+        """
+        summary = cls(message_num_threshold, message_len_threshold, max_templates)
+        for tag, (cnt, msgs) in d['tags'].iteritems():
+            tag = str(tag)
+            level = Level(tag.split('.')[-1])
+            summary._levels[tag] = level
+            summary.max_level = max(summary.max_level, level)
+            summary.tags[tag] = [0, []]
+            summary.merge_entry(tag, cnt, msgs)
+        for tag, counter in d['templates'].iteritems():
+            summary.templates[str(tag)] = TemplateCounter.from_dict(counter)
+        return summary
+
+
+def parse_lines(path, lines, summary):
+    """
+    Parse the lines in the Fluentd output format and update the summary
+
+    :param path: file path for error messages
+    :param lines: iterable of the lines
+    :param summary: LogSummary instance
+    """
+    for line in lines:
+        try:
+            # equivalent to len(line.split('\t')) == 3, without splitting the message part
+            t1 = line.find('\t')
+            t2 = line.find('\t', t1 + 1) if t1 >= 0 else -1
+            if t2 < 0 or line.find('\t', t2 + 1) >= 0:
+                raise LogFormatError('LogWatcher parse error: file=%s, line=%s' % (path, line))
+            summary.add(line[t1 + 1:t2], line, t2 + 1)
+        except LogFormatError as e:
+            raise e
+        except Exception as e:
+            raise LogFormatError('LogWatcher parse error: %s: %s: file=%s, line=%s'
+                                 % (e.__class__.__name__, e, path, line))
+
+
+def parse_file(path, summary, chunk_size=CHUNK_SIZE, start=0, progress=None):
+    """
+    Parse the file and update the summary
+
+    Plain files are mapped in memory, and compressed files (.gz, .zst) are decompressed as a stream.
+    In both cases, the file is processed chunk by chunk, so the memory usage does not depend on the file size.
+
+    :param path: file path
+    :param summary: LogSummary instance
+    :param chunk_size: approximate chunk size in bytes
+    :param start: offset to resume parsing (should be at the beginning of a line, only for plain files)
+    :param progress: function called with the offset after each chunk is parsed (only for plain files)
+    """
+    if start > 0 and is_compressed(path):
+        raise ValueError('Cannot resume parsing a compressed file: %s' % path)
+
+    if path.endswith('.gz'):
+        chunks = _decompressed_chunks(path, gzip.open, chunk_size)
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise LogFormatError('LogWatcher cannot decompress the file without the zstandard module: file=%s' % path)
+        chunks = _decompressed_chunks(path, _ZstdReader, chunk_size)
+    else:
+        chunks = _mapped_chunks(path, chunk_size, start)
+
+    offset = start
+    for chunk in chunks:
+        if not count_chunk(chunk, summary):
+            scan_buffer(path, chunk, 0, len(chunk), summary)
+        offset += len(chunk)
+        if progress is not None and not is_compressed(path):
+            progress(offset)
+
+
+def is_compressed(path):
+    return path.endswith('.gz') or path.endswith('.zst')
+
+
+def _mapped_chunks(path, chunk_size, start=0):
+    """:return: generator of the chunks which consist of complete lines"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return  # nothing to read (empty file cannot be mapped)
+        buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            pos = start
+            while pos < size:
+                end = _find_chunk_end(buf, pos, size, chunk_size)
+                yield buf[pos:end]
+                pos = end
+        finally:
+            buf.close()
+
+
+def _decompressed_chunks(path, opener, chunk_size):
+    """:return: generator of the chunks which consist of complete lines"""
+    f = opener(path)
+    try:
+        rest = ''
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            nl = data.rfind('\n')
+            if nl < 0:
+                rest = data
+            else:
+                rest = data[nl + 1:]
+                yield data[:nl + 1]
+        if rest:
+            yield rest
+    finally:
+        f.close()
+
+
+class _ZstdReader(object):
+    """File-like object which reads the decompressed data of a zstd file"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._reader = zstandard.ZstdDecompressor().stream_reader(self._file)
+        except Exception:
+            self._file.close()
+            raise
+
+    def read(self, size):
+        return self._reader.read(size)
+
+    def close(self):
+        self._file.close()
+
+
+def summarize_file(args):
+    """
+    Parse the file in a child process
+
+    :param args: tuple(path, LogSummary instance to update, offset to resume parsing)
+    :return: updated LogSummary instance
+    """
+    path, summary, start = args
+    parse_file(path, summary, start=start)
+    return summary
+
+
+def _find_chunk_end(buf, start, size, chunk_size):
+    """:return: end position of the chunk which ends with a newline (or the end of the buffer)"""
+    end = start + chunk_size
+    if end >= size:
+        return size
+    nl = buf.rfind('\n', start, end)
+    if nl < 0:
+        nl = buf.find('\n', end, size)
+    return size if nl < 0 else nl + 1
+
+
+def count_chunk(chunk, summary):
+    """
+    Count the lines in the chunk at once when all of them belong to the tags which have reached the threshold
+
+    The format is verified by the tabs and newlines of the chunk, which should be exactly two tabs for each line.
+    Then the lines are counted by the tag column ('<TAB><TAG><TAB>'), which cannot span the lines.
+
+    :param chunk: string of the complete lines
+    :param summary: LogSummary instance
+    :return: true if the chunk has been counted, false if the chunk should be scanned line by line
+    """
+    if not summary.full_tags:
+        return False
+
+    lines = chunk.count('\n') + (0 if chunk.endswith('\n') else 1)
+    expected = '\t\t\n' * lines if chunk.endswith('\n') else '\t\t\n' * (lines - 1) + '\t\t'
+    if chunk.translate(None, _NON_SEPARATORS) != expected:
+        return False
+
+    counts = [(entry, chunk.count('\t%s\t' % tag)) for tag, entry in summary.full_tags.iteritems()]
+    if sum(c for _, c in counts) != lines:
+        return False
+
+    for entry, c in counts:
+        entry[0] += c
+    return True
+
+
+def scan_buffer(path, buf, start, end, summary):
+    """
+    Scan the lines in the buffer by searching tabs and newlines, without making a string for each line
+
+    Only the tag column is copied for each line, and the lines for the tags which have reached the threshold
+    are just counted.
+
+    :param path: file path for error messages
+    :param buf: str or mmap object
+    :param start: start position in the buffer
+    :param end: end position in the buffer
+    :param summary: LogSummary instance
+    """
+    find = buf.find
+    full = summary.full_tags
+    pos = start
+    while pos < end:
+        eol = find('\n', pos, end)
+        eol = end if eol < 0 else eol
+        t1 = find('\t', pos, eol)
+        t2 = find('\t', t1 + 1, eol) if t1 >= 0 else -1
+        if t2 < 0 or find('\t', t2 + 1, eol) >= 0:
+            raise LogFormatError('LogWatcher parse error: file=%s, line=%s' % (path, buf[pos:eol + 1]))
+
+        tag = buf[t1 + 1:t2]
+        entry = full.get(tag)
+        if entry is not None:
+            entry[0] += 1
+        else:
+            try:
+                summary.add(tag, buf[t2 + 1:eol + 1])
+            except Exception as e:
+                raise LogFormatError('LogWatcher parse error: %s: %s: file=%s, line=%s'
+                                     % (e.__class__.__name__, e, path, buf[pos:eol + 1]))
+        pos = eol + 1
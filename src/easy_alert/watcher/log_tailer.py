@@ -0,0 +1,141 @@
+import os
+import errno
+
+from log_parser import CHUNK_SIZE
+from easy_alert.util import CaseClass, MultiPatternMatcher, load_state_file, save_state_file
+
+
+class PositionFile(CaseClass):
+    """
+    Position of the log file which has been read, saved as '<inode><TAB><offset>'
+    """
+
+    def __init__(self, path):
+        super(PositionFile, self).__init__(['path'])
+        self.path = path
+
+    def load(self):
+        """
+        :return: tuple(inode, offset) or None if the position file does not exist
+        """
+        def parse(data):
+            inode, offset = data.split('\t')
+            return int(inode), int(offset)
+
+        return load_state_file(self.path, parse, description='position file')
+
+    def save(self, position):
+        """
+        :param position: tuple(inode, offset)
+        """
+        save_state_file(self.path, '%d\t%d' % position)
+
+
+class LogSource(CaseClass):
+    """
+    Log file to tail, with the severity rules
+
+    Each line is tagged as '<tag>.<level>' by the first rule whose pattern matches it.
+    Lines which match no rule are ignored.
+    All the patterns are compiled into one MultiPatternMatcher, so each line is scanned only once.
+    """
+
+    NOT_FOUND = (0, 0)  # position for the file which does not exist
+
+    def __init__(self, path, tag, rules, position_file):
+        """
+        :param path: path to the log file
+        :param tag: tag prefix
+        :param rules: list of tuple(compiled regular expression, Level)
+        :param position_file: PositionFile instance
+        """
+        super(LogSource, self).__init__(['path', 'tag', 'rules', 'position_file'])
+        self.path = path
+        self.tag = tag
+        self.rules = rules
+        self.position_file = position_file
+
+        self._matcher = MultiPatternMatcher([pattern for pattern, _ in rules])
+        self._tags = ['%s.%s' % (tag, level.get_keyword()) for _, level in rules]
+
+    def classify(self, line):
+        """
+        :return: tag for the line or None if no rule matches
+        """
+        matched = self._matcher.match(line)
+        return self._tags[min(matched)] if matched else None
+
+    def read(self, summary, read_from_head=False):
+        """
+        Read the lines appended since the saved position and update the summary.
+        The position file is not updated here.
+
+        When the inode has changed, the rest of the rotated file is read first if it is found in the same directory.
+        When the file has shrunk, it is read from the head.
+
+        :param summary: LogSummary instance
+        :param read_from_head: read the whole file if no position has been saved, otherwise start at the end
+        :return: new position as tuple(inode, offset)
+        """
+        try:
+            f = open(self.path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return self.NOT_FOUND  # the file created later will be read from the head
+            raise
+
+        with f:
+            st = os.fstat(f.fileno())
+            position = self.position_file.load()
+            if position is None:
+                offset = 0 if read_from_head else st.st_size
+            else:
+                inode, offset = position
+                if inode != st.st_ino:
+                    rotated = None if position == self.NOT_FOUND else self._find_rotated(inode)
+                    if rotated is not None:
+                        with open(rotated, 'rb') as g:
+                            self._read_lines(g, offset, os.fstat(g.fileno()).st_size, summary, True)
+                    offset = 0
+                elif st.st_size < offset:
+                    offset = 0
+            return st.st_ino, self._read_lines(f, offset, st.st_size, summary, False)
+
+    def _find_rotated(self, inode):
+        """:return: path to the file with the inode in the same directory, or None"""
+        dir_path = os.path.dirname(self.path) or '.'
+        for name in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, name)
+            try:
+                if os.stat(path).st_ino == inode:
+                    return path
+            except OSError:
+                pass  # removed while searching
+        return None
+
+    def _read_lines(self, f, offset, end, summary, final):
+        """
+        :param final: also read the last line without a newline if true
+        :return: offset right after the last line read
+        """
+        f.seek(offset)
+        pos = offset
+        rest = ''
+        while pos < end:
+            data = f.read(min(CHUNK_SIZE, end - pos))
+            if not data:
+                break
+            pos += len(data)
+            lines = (rest + data).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                self._add_line(line, summary)
+        if final and rest:
+            self._add_line(rest, summary)
+            rest = ''
+        return pos - len(rest)
+
+    def _add_line(self, line, summary):
+        tag = self.classify(line)
+        if tag is not None:
+            summary.add_message(tag, line.rstrip('\r'))
@@ -1,21 +1,22 @@
 import os
-import glob
-import json
+import re
+import time
+import threading
+import multiprocessing
 from datetime import datetime
-from collections import defaultdict
-from logging import WARN, ERROR
+from logging import WARN
 
 from watcher import Watcher
+from log_parser import LogFormatError, LogSummary, parse_file, summarize_file
+from log_tailer import LogSource, PositionFile
+from log_checkpoint import Checkpoint
+from dir_scanner import scan_files
 from easy_alert.entity import Alert, Level
 from easy_alert.util import get_server_id
 from easy_alert.i18n import *
 from easy_alert.setting.setting_error import SettingError
 
 
-class LogFormatError(Exception):
-    """Class for log format error"""
-
-
 class LogWatcher(Watcher):
     """
     Watch log files filtered by Fluentd (td-agent)
@@ -23,10 +24,22 @@ class LogWatcher(Watcher):
     configuration should be this dict
       watch_dir  [required]: path to the directory to watch
       target_pattern       : glob pattern for the target files (default:alert.????????_????_*.log)
+                             (compressed files *.gz and *.zst are also readable, e.g. alert.????????_????_*.log*)
       pending_pattern      : glob pattern for checking pending files (default:alert.????????_????*)
       message_num_threshold: maximum number of messages for each log level (default:15)
       message_len_threshold: maximum length for each message (default:1024)
       pending_threshold    : threshold number of files for checking pending files (default:3)
+      pending_age          : threshold age in minutes of the oldest pending file (default:0, disabled)
+      parse_workers        : number of processes for parsing the target files in parallel (default:1)
+                             (the processes are started once before the watchers run, and kept in the daemon mode)
+      fingerprint          : group the messages by their templates, masking numbers, hex IDs and UUIDs (default:false)
+      max_templates        : maximum number of the templates to count for each tag (default:1000)
+      checkpoint           : record the progress of the target files in <watch_dir>/checkpoint.json,
+                             so that a retry resumes parsing and never sends the notified alerts again (default:false)
+      archive_dir          : directory to move the finished files into, instead of removing them
+                             (should be on the same filesystem as watch_dir)
+      sources              : list of the log files to tail directly (enables the tail mode, see below)
+      read_from_head       : read the whole log file at the first run in the tail mode (default:false)
 
     The settings of td-agent.conf should be like this.
 
@@ -69,6 +82,25 @@ class LogWatcher(Watcher):
 
     e.g.
     2015-08-01T12:34:56.789<TAB>monitor.syslog.warn<TAB>{"message":"Alert message."}
+
+    In the tail mode, the log files are read without Fluentd. Each source should be this dict
+      path     [required]: path to the log file
+      tag      [required]: tag for the log file
+      rules    [required]: list of dict with the keys 'pattern' (regular expression) and 'level'
+                           (the first matching rule decides the level, and the lines matching no rule are ignored)
+      pos_file           : path to the position file (default:<watch_dir>/<tag>.pos)
+
+    e.g. (equivalent to the td-agent.conf above)
+      sources:
+        - path: /var/log/messages
+          tag: monitor.syslog
+          rules:
+            - pattern: ERROR
+              level: error
+            - pattern: WARN
+              level: warn
+
+    The position files are updated after the notification, and the rotation is detected by the inode.
     """
 
     DEFAULT_TARGET_PATTERN = 'alert.????????_????_*.log'
@@ -76,6 +108,11 @@ class LogWatcher(Watcher):
     DEFAULT_MESSAGE_NUM_THRESHOLD = 15
     DEFAULT_MESSAGE_LEN_THRESHOLD = 1024
     DEFAULT_PENDING_THRESHOLD = 3
+    DEFAULT_PENDING_AGE = 0
+    DEFAULT_PARSE_WORKERS = 1
+    DEFAULT_MAX_TEMPLATES = 1000
+    CHECKPOINT_FILE = 'checkpoint.json'
+    CHECKPOINT_BYTES = 64 * 1024 * 1024  # save the checkpoint while parsing a large file at this interval
 
     def __init__(self, alert_setting, print_only):
         if not isinstance(alert_setting, dict):
@@ -88,6 +125,20 @@ class LogWatcher(Watcher):
             nt = int(alert_setting.get('message_num_threshold') or self.DEFAULT_MESSAGE_NUM_THRESHOLD)
             lt = int(alert_setting.get('message_len_threshold') or self.DEFAULT_MESSAGE_LEN_THRESHOLD)
             pt = int(alert_setting.get('pending_threshold') or self.DEFAULT_PENDING_THRESHOLD)
+            pa = int(alert_setting.get('pending_age') or self.DEFAULT_PENDING_AGE)
+            pw = int(alert_setting.get('parse_workers') or self.DEFAULT_PARSE_WORKERS)
+            rh = self.__verify_bool(alert_setting.get('read_from_head', False))
+            fp = self.__verify_bool(alert_setting.get('fingerprint', False))
+            mt = int(alert_setting.get('max_templates') or self.DEFAULT_MAX_TEMPLATES)
+            cp = None
+            if self.__verify_bool(alert_setting.get('checkpoint', False)):
+                cp = Checkpoint(os.path.join(watch_dir, self.CHECKPOINT_FILE))
+            ad = alert_setting.get('archive_dir')
+            sources = None
+            if 'sources' in alert_setting:
+                sources = self._parse_sources(watch_dir, alert_setting['sources'])
+        except SettingError as e:
+            raise e
         except KeyError as e:
             raise SettingError('LogWatcher not found config key: %s' % e)
         except Exception as e:
@@ -95,77 +146,285 @@ class LogWatcher(Watcher):
 
         super(LogWatcher, self).__init__(
             watch_dir=watch_dir, target_pattern=tp, pending_pattern=pp, message_num_threshold=nt,
-            message_len_threshold=lt, pending_threshold=pt, print_only=print_only, target_paths=None
+            message_len_threshold=lt, pending_threshold=pt, pending_age=pa, parse_workers=pw, sources=sources,
+            read_from_head=rh, fingerprint=fp, max_templates=mt, checkpoint=cp, archive_dir=ad, print_only=print_only,
+            target_paths=None, positions=None
         )
 
+        # runtime state (not a part of the settings)
+        self.target_files = {}  # path -> ScannedFile of the target files found by the last scan
+        self.parse_pool = None  # process pool created by prepare()
+
+    @classmethod
+    def _parse_sources(cls, watch_dir, sources):
+        """
+        :return: list of LogSource instances
+        """
+        if not isinstance(sources, list):
+            raise SettingError('LogWatcher settings not a list: %s' % sources)
+
+        ret = []
+        for s in sources:
+            if not isinstance(s, dict):
+                raise SettingError('LogWatcher settings not a dict: %s' % s)
+            if not isinstance(s['rules'], list):
+                raise SettingError('LogWatcher settings not a list: %s' % s['rules'])
+
+            rules = []
+            for r in s['rules']:
+                if not isinstance(r, dict):
+                    raise SettingError('LogWatcher settings not a dict: %s' % r)
+                if r['level'] not in [l.get_keyword() for l in Level.seq]:
+                    raise SettingError('LogWatcher unknown level: %s' % r['level'])
+                rules.append((re.compile(r['pattern']), Level(r['level'])))
+
+            pos_file = s.get('pos_file') or os.path.join(watch_dir, '%s.pos' % s['tag'])
+            ret.append(LogSource(s['path'], s['tag'], rules, PositionFile(pos_file)))
+        return ret
+
+    @staticmethod
+    def __verify_bool(x):
+        if not isinstance(x, bool):
+            raise SettingError('LogWatcher value should be bool: %s' % x)
+        return x
+
     def watch(self):
         """
         :return: list of Alert instances
         """
         start_time = datetime.now()
 
+        if self.sources is not None:
+            return self._tail_sources(start_time)
+
         # get target paths
-        self.target_paths = glob.glob(self.target_pattern)
+        targets, pending = scan_files([self.target_pattern, self.pending_pattern])
+        self.target_paths = [f.path for f in targets]
+        self.target_files = dict((f.path, f) for f in targets)
         if not self.target_paths:
-            return self._check_pending(start_time)
+            return self._check_pending(start_time, pending)
 
         # parse files
-        result, max_level = self._parse_files(self.target_paths)
+        summary = self._parse_files(self.target_paths)
+        if summary is None:
+            return []  # all the files have been notified
 
         # make alert
-        message = MSG_LOG_ALERT % {'server_id': get_server_id(), 'result': self._make_result(result)}
-        return [Alert(start_time, max_level, MSG_LOG_ALERT_TITLE, message)]
+        message = MSG_LOG_ALERT % {'server_id': get_server_id(), 'result': self._make_result(summary)}
+        return [Alert(start_time, summary.max_level, MSG_LOG_ALERT_TITLE, message)]
 
     def after_success(self):
-        """Delete parsed files after the notification."""
+        """Delete or archive parsed files (or save the positions in the tail mode) after the notification."""
+
+        if self.sources is not None:
+            assert (self.positions is not None)
+            for source, position in zip(self.sources, self.positions):
+                if self.print_only:
+                    print('Would update position: %s: %d\t%d' % (source.position_file.path, position[0], position[1]))
+                else:
+                    source.position_file.save(position)
+            return
 
         assert (self.target_paths is not None)
 
+        if self.checkpoint is not None:
+            for path in self.target_paths:
+                self.checkpoint.set_notified(path)
+            self._save_checkpoint()
+
         for path in self.target_paths:
-            if self.print_only:
+            if self.archive_dir:
+                dest = os.path.join(self.archive_dir, os.path.basename(path))
+                if self.print_only:
+                    print('Would archive: %s -> %s' % (path, dest))
+                else:
+                    os.rename(path, dest)
+            elif self.print_only:
                 print('Would remove: %s' % path)
             else:
                 os.remove(path)
 
-    def _check_pending(self, start_time):
-        paths = glob.glob(self.pending_pattern)
+            if self.checkpoint is not None:
+                self.checkpoint.remove(path)
+
+        if self.checkpoint is not None:
+            self._save_checkpoint()
+
+    def watch_patterns(self):
+        if self.sources is not None:
+            return [(source.path, True) for source in self.sources]
+        return [(self.target_pattern, False)]
+
+    def _tail_sources(self, start_time):
+        summary = self._new_summary()
+        self.positions = [source.read(summary, self.read_from_head) for source in self.sources]
+        if not summary.tags:
+            return []
+
+        message = MSG_LOG_ALERT % {'server_id': get_server_id(), 'result': self._make_result(summary)}
+        return [Alert(start_time, summary.max_level, MSG_LOG_ALERT_TITLE, message)]
+
+    def _check_pending(self, start_time, pending):
+        """
+        :param pending: list of ScannedFile instances of the pending files
+        """
         ret = []
-        if len(paths) >= self.pending_threshold:
+        if len(pending) >= self.pending_threshold or self._has_old_file(pending):
+            paths = [f.path for f in pending]
             mapping = {'server_id': get_server_id(), 'pattern': self.pending_pattern, 'paths': '\n'.join(paths)}
             ret.append(Alert(start_time, Level(WARN), MSG_LOG_ALERT_PENDING_TITLE, MSG_LOG_ALERT_PENDING % mapping))
         return ret
 
+    def _has_old_file(self, files):
+        if self.pending_age <= 0:
+            return False
+
+        limit = time.time() - self.pending_age * 60
+        for f in files:
+            st = f.stat()
+            if st is not None and st.st_mtime <= limit:
+                return True
+        return False
+
     def _parse_files(self, paths):
-        d = defaultdict(lambda: (0, []))
-        max_level = Level(WARN)
+        """
+        :return: LogSummary instance, or None if all the files have been notified
+        """
+        if self.checkpoint is not None:
+            return self._parse_files_with_checkpoint(paths)
+
+        summary = self._new_summary()
+        if min(self.parse_workers, len(paths)) <= 1:
+            for path in paths:
+                parse_file(path, summary)
+            return summary
+
+        for partial in self._parse_in_pool([(path, self._new_summary(), 0) for path in paths]):
+            summary.merge(partial)
+        return summary
+
+    def _parse_files_with_checkpoint(self, paths):
+        checkpoint = self.checkpoint.load()
+        checkpoint.retain(paths)
+
+        jobs = []  # list of tuple(path, stat, offset to resume, LogSummary)
+        partials = {}  # path -> LogSummary of the whole file
+        for path in paths:
+            st = self.target_files[path].stat() if path in self.target_files else None
+            st = st or os.stat(path)
+            entry = checkpoint.get(path, st)
+            if entry is None:
+                jobs.append((path, st, 0, self._new_summary()))
+            elif not entry['notified']:
+                partial = LogSummary.from_dict(entry['summary'], self.message_num_threshold,
+                                               self.message_len_threshold, self._max_templates())
+                if entry['offset'] < st.st_size:
+                    jobs.append((path, st, entry['offset'], partial))
+                else:
+                    partials[path] = partial
+
+        if min(self.parse_workers, len(jobs)) <= 1:
+            for path, st, start, partial in jobs:
+                parse_file(path, partial, start=start, progress=self._checkpoint_progress(path, st, start, partial))
+                checkpoint.update(path, st, st.st_size, partial)
+                self._save_checkpoint()
+                partials[path] = partial
+        else:
+            for (path, st, _, _), partial in zip(jobs, self._parse_in_pool([(j[0], j[3], j[2]) for j in jobs])):
+                checkpoint.update(path, st, st.st_size, partial)
+                partials[path] = partial
+            self._save_checkpoint()
+
+        if not partials:
+            return None
+
+        # merge the results in the file order
+        summary = self._new_summary()
         for path in paths:
-            for line in open(path):
-                try:
-                    tokens = line.split('\t')
-                    if len(tokens) != 3:
-                        raise LogFormatError('LogWatcher parse error: file=%s, line=%s' % (path, line))
-                    tag = tokens[1]
-                    msg = json.loads(tokens[2].decode('utf-8', 'ignore'))['message']
-                    cnt, msgs = d[tag]
-                    cnt += 1
-                    # trim string
-                    msgs += [msg[:self.message_len_threshold]] if cnt <= self.message_num_threshold else []
-                    d[tag] = (cnt, msgs)
-                    level = Level(tag.split('.')[-1])
-                    max_level = max(max_level, level)
-                except LogFormatError as e:
-                    raise e
-                except Exception as e:
-                    raise LogFormatError('LogWatcher parse error: %s: %s: file=%s, line=%s'
-                                         % (e.__class__.__name__, e, path, line))
-        return d, max_level
-
-    def _make_result(self, result):
+            if path in partials:
+                summary.merge(partials[path])
+        return summary
+
+    def _checkpoint_progress(self, path, st, start, partial):
+        """:return: function to save the checkpoint periodically while parsing the file"""
+        last = [start]
+
+        def f(offset):
+            if offset - last[0] >= self.CHECKPOINT_BYTES and offset < st.st_size:
+                self.checkpoint.update(path, st, offset, partial)
+                self._save_checkpoint()
+                last[0] = offset
+
+        return f
+
+    def _save_checkpoint(self):
+        if not self.print_only:
+            self.checkpoint.save()
+
+    def prepare(self):
+        """
+        Create the process pool for parse_workers while the process has no other threads
+
+        Forking from a multithreaded process can deadlock the child on a lock held by another thread
+        (e.g. logging, the resolver cache or the HTTP pool), so the pool is never created in a watcher thread.
+        """
+        if self.parse_workers > 1 and self.sources is None and self.parse_pool is None:
+            self.parse_pool = multiprocessing.Pool(self.parse_workers)
+
+    def close(self):
+        if self.parse_pool is not None:
+            self.parse_pool.terminate()
+            self.parse_pool.join()
+            self.parse_pool = None
+
+    def _parse_in_pool(self, args):
+        """
+        Parse each file in a child process
+
+        Without prepare(), a temporary pool is created only if the process has no other threads.
+        Otherwise the files are parsed in this process.
+
+        :param args: list of tuple(path, LogSummary instance to update, offset to resume parsing)
+        :return: list of the updated LogSummary instances in the same order
+        """
+        if self.parse_pool is not None:
+            return self.parse_pool.map(summarize_file, args, chunksize=1)
+
+        if threading.active_count() > 1:
+            return [summarize_file(a) for a in args]
+
+        pool = multiprocessing.Pool(min(self.parse_workers, len(args)))
+        try:
+            return pool.map(summarize_file, args, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _max_templates(self):
+        return self.max_templates if self.fingerprint else 0
+
+    def _new_summary(self):
+        return LogSummary(self.message_num_threshold, self.message_len_threshold, self._max_templates())
+
+    def _make_result(self, summary):
         buf = []
-        for k in sorted(result.keys()):
-            cnt, msgs = result[k]
+        for k in sorted(summary.tags.keys()):
+            cnt, msgs = summary.tags[k]
             buf.append(MSG_LOG_SUMMARY % {'tag': k, 'count': cnt})
-            buf += msgs
-            buf += [MSG_LOG_SNIP] if cnt > self.message_num_threshold else []
+            if k in summary.templates:
+                buf += self._make_template_result(cnt, summary.templates[k])
+            else:
+                buf += msgs
+                buf += [MSG_LOG_SNIP] if cnt > self.message_num_threshold else []
             buf.append('')
         return '\n'.join(buf)
+
+    def _make_template_result(self, cnt, counter):
+        top = counter.top(self.message_num_threshold)
+        buf = [MSG_LOG_TEMPLATE % {'template': t, 'count': c} for t, c in top]
+
+        rest = cnt - sum(c for _, c in top)
+        if rest > 0:
+            buf.append(MSG_LOG_OTHER_TEMPLATES % {'count': rest})
+            buf += sorted(set(counter.samples), key=counter.samples.index)
+        return buf
@@ -1,11 +1,16 @@
+import os
 import re
+import time
+import errno
+import resource
+from array import array
 from collections import defaultdict
 import subprocess
 from datetime import datetime
 
 from watcher import Watcher
 from easy_alert.entity import Alert, Level
-from easy_alert.util import CaseClass, get_server_id, Matcher, apply_option
+from easy_alert.util import CaseClass, get_server_id, Matcher, MultiPatternMatcher, TickCache, apply_option
 from easy_alert.i18n import *
 from easy_alert.setting.setting_error import SettingError
 
@@ -15,6 +20,9 @@ class ProcessReader(object):
     Read process information from operating system
     """
 
+    # dict of process id -> tuple(RSS in bytes, CPU usage in percent or None) of the last read, if available
+    usage = None
+
     def read(self):
         """
         Get the running processes information
@@ -33,6 +41,125 @@ class ProcessReader(object):
         return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0]
 
 
+class ProcfsProcessReader(ProcessReader):
+    """
+    Read process information directly from the proc filesystem without forking /bin/ps
+
+    Falls back to /bin/ps when the proc filesystem is not available.
+
+    In the incremental mode, the args string of each process is kept until the next read, and the command line
+    is read again only for new processes, or processes whose start time or command name has changed
+    (i.e. the process id has been recycled, or the process has called exec).
+
+    The resource usage is also read from the same stat file. CPU usage is measured between two consecutive reads.
+    For the processes seen for the first time (e.g. every process in a one-shot run from cron), it is the average
+    over the lifetime of the process, using the system uptime. It is None only if the uptime is not available.
+    """
+
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = resource.getpagesize()
+
+    def __init__(self, proc_root='/proc', incremental=True, clock=time.time):
+        self.proc_root = proc_root
+        self.incremental = incremental
+        self.clock = clock
+        self.usage = None
+        self._snapshot = {}  # process id string -> tuple(start time, command name, args string, CPU time in ticks)
+        self._read_time = None
+
+    def is_available(self):
+        return os.path.isfile(os.path.join(self.proc_root, '1', 'stat'))
+
+    def read(self):
+        """
+        Get the running processes information
+        :return: dict of process id -> tuple(parent process id, args string)
+        """
+        if not self.is_available():
+            return super(ProcfsProcessReader, self).read()
+
+        now = self.clock()
+        elapsed = None if self._read_time is None else now - self._read_time
+        uptime = self._read_uptime()
+
+        ret, snapshot, usage = {}, {}, {}
+        for name in os.listdir(self.proc_root):
+            if name.isdigit():
+                entry = self._read_process(name, snapshot, usage, elapsed, uptime)
+                if entry is not None:
+                    ret[int(name)] = entry
+
+        self._snapshot = snapshot
+        self._read_time = now
+        self.usage = usage
+        return ret
+
+    def _read_process(self, pid, snapshot, usage, elapsed, uptime=None):
+        """
+        :param pid: process id string
+        :param snapshot: dict to store the entry for the next read
+        :param usage: dict to store the resource usage
+        :param elapsed: seconds from the last read, or None
+        :param uptime: seconds from the system boot, or None
+        :return: tuple(parent process id, args string), or None if the process has disappeared during the scan
+        """
+        try:
+            stat = self._read_file(pid, 'stat')
+            if not stat:
+                return None
+
+            # the command name may contain spaces and parentheses
+            l, r = stat.find('('), stat.rfind(')')
+            comm = stat[l + 1:r]
+            fields = stat[r + 2:].split()
+            ppid, start_time = int(fields[1]), fields[19]
+            cpu_ticks, rss = int(fields[11]) + int(fields[12]), int(fields[21]) * self.PAGE_SIZE
+
+            cached = self._snapshot.get(pid)
+            if cached is not None and cached[0] != start_time:
+                cached = None
+            if self.incremental and cached is not None and cached[1] == comm:
+                args = cached[2]
+            else:
+                args = self._read_args(pid, comm)
+        except (IOError, OSError) as e:
+            if e.errno in (errno.ENOENT, errno.ESRCH):
+                return None
+            raise
+
+        cpu = None
+        if cached is not None and elapsed:
+            cpu = max(0.0, (cpu_ticks - cached[3]) * 100.0 / self.CLOCK_TICKS / elapsed)
+        elif uptime is not None:
+            age = uptime - float(start_time) / self.CLOCK_TICKS
+            if age > 0:
+                cpu = cpu_ticks * 100.0 / self.CLOCK_TICKS / age
+
+        snapshot[pid] = (start_time, comm, args, cpu_ticks)
+        usage[int(pid)] = (rss, cpu)
+        return ppid, args
+
+    def _read_uptime(self):
+        """
+        :return: seconds from the system boot, or None if not available
+        """
+        try:
+            with open(os.path.join(self.proc_root, 'uptime')) as f:
+                return float(f.read().split()[0])
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    def _read_args(self, pid, comm):
+        cmdline = self._read_file(pid, 'cmdline')
+
+        # kernel threads and zombies have no command line, then /bin/ps shows the command name in brackets
+        return cmdline.rstrip('\0').replace('\0', ' ') or '[%s]' % comm
+
+    def _read_file(self, pid, name):
+        with open(os.path.join(self.proc_root, pid, name), 'rb') as f:
+            return f.read()
+
+
 class ProcessCounter(CaseClass):
     """
     Count the number of the processes
@@ -43,11 +170,94 @@ class ProcessCounter(CaseClass):
         self.process_dict = process_dict
         self.cache_distinct = None
         self.cache_aggregated = None
+        self._children = None  # parent process id -> set of child process ids
+
+    def update(self, process_dict):
+        """
+        Replace the process information, updating the cached counts only for the changed processes
+
+        :param process_dict: dict of process id -> tuple(parent process id, args string)
+        :return: self
+        """
+        old = self.process_dict
+        changed = set(pid for pid, _ in set(old.iteritems()).symmetric_difference(process_dict.iteritems()))
+
+        if self._children is None or len(changed) * 2 > len(process_dict):
+            # rebuild from scratch when it is cheaper
+            self.process_dict = process_dict
+            self.cache_distinct = None
+            self.cache_aggregated = None
+            self._build_caches()
+            return self
+
+        # the aggregated count of a process also depends on its parent
+        affected = set(changed)
+        for pid in changed:
+            affected.update(self._children.get(pid, ()))
+
+        for pid in affected:
+            if pid in old:
+                self._add_count(old, pid, -1)
+
+        for pid in changed:
+            if pid in old:
+                self._children[old[pid][0]].discard(pid)
+            if pid in process_dict:
+                self._children.setdefault(process_dict[pid][0], set()).add(pid)
+
+        self.process_dict = process_dict
+        for pid in affected:
+            if pid in process_dict:
+                self._add_count(process_dict, pid, 1)
+        return self
+
+    def _add_count(self, process_dict, pid, delta):
+        ppid, args = process_dict[pid]
+        for d, counted in [(self.cache_distinct, True), (self.cache_aggregated, self._is_root(process_dict, pid))]:
+            if counted:
+                d[args] += delta
+                if d[args] == 0:
+                    del d[args]
+
+    @staticmethod
+    def _is_root(process_dict, pid):
+        """:return: true if the process is not a fork of its parent"""
+        ppid, args = process_dict[pid]
+        parent = process_dict.get(ppid)
+        return parent is None or parent[1] != args
+
+    def _build_caches(self):
+        """Build all the caches so that the next update() can apply the difference"""
+
+        self._distinct()
+        self._aggregate()
+        children = {}
+        for pid, (ppid, args) in self.process_dict.iteritems():
+            children.setdefault(ppid, set()).add(pid)
+        self._children = children
 
     def count(self, pattern, aggregate=True):
         d = self._aggregate() if aggregate else self._distinct()
         return sum(x * bool(pattern.search(s)) for s, x in d.items())
 
+    def count_all(self, matcher, aggregates):
+        """
+        Count the processes for all the patterns, classifying each distinct args string only once
+
+        :param matcher: function which takes an args string and returns the indices of the matching patterns
+        :param aggregates: list of the aggregate flags for each pattern
+        :return: list of the number of the processes for each pattern
+        """
+        ret = [0] * len(aggregates)
+        aggregated = self._aggregate() if any(aggregates) else {}
+        distinct = self._distinct() if not all(aggregates) else {}
+
+        # keys of the distinct dict are the superset of the aggregated dict
+        for args in (distinct or aggregated):
+            for i in matcher(args):
+                ret[i] += aggregated.get(args, 0) if aggregates[i] else distinct[args]
+        return ret
+
     def _distinct(self):
         """
         :return: dict of args string -> count with default value (0)
@@ -68,9 +278,8 @@ class ProcessCounter(CaseClass):
         """
         if self.cache_aggregated is None:
             d = defaultdict(int)
-            for ppid, args in self.process_dict.values():
-                parent = self.process_dict.get(ppid)
-                if parent is None or parent[1] != args:
+            for pid, (ppid, args) in self.process_dict.iteritems():
+                if self._is_root(self.process_dict, pid):
                     d[args] += 1
             self.cache_aggregated = d
 
@@ -90,11 +299,29 @@ class ProcessWatcher(Watcher):
       warn          [*]: check the threshold then alert with warn level
       info          [*]: check the threshold then alert with info level
       debug         [*]: check the threshold then alert with debug level
+      rss           [*]: dict of level -> threshold for the total RSS of the matched processes in MB
+                         (e.g. {error: '< 2048', warn: '< 1024'})
+      cpu           [*]: dict of level -> threshold for the total CPU usage of the matched processes in percent
+                         (e.g. {warn: '< 150'})
 
-    * At least one of {critical, error, warn, info, debug} is required.
+    * At least one threshold is required.
+
+    The thresholds for `rss` and `cpu` are checked only if the process reader supports the resource usage
+    (i.e. the proc filesystem is available). CPU usage is measured between two consecutive runs in the daemon mode.
+    In a one-shot run (e.g. from cron), it is the average over the lifetime of each process.
+
+    The matching rules for each args string are memoized while the watcher lives (e.g. in the daemon mode),
+    and forgotten when the args string has not been seen for `cache_ticks` runs.
     """
 
-    def __init__(self, alert_setting, process_reader=ProcessReader()):
+    DEFAULT_CACHE_TICKS = 10
+
+    def __init__(self, alert_setting, process_reader=None, cache_ticks=DEFAULT_CACHE_TICKS):
+        """
+        :param alert_setting: list of the setting dicts
+        :param process_reader: ProcessReader instance (default: new ProcfsProcessReader for this watcher)
+        :param cache_ticks: number of the runs to keep the matching rules for an unseen args string
+        """
         if not isinstance(alert_setting, list):
             raise SettingError('ProcessWatcher settings not a list: %s' % alert_setting)
 
@@ -108,6 +335,10 @@ class ProcessWatcher(Watcher):
                 pattern = re.compile(s['regexp'])
                 aggregate = self.__verify_bool(s.get('aggregate', True))
                 conditions = self._parse_conditions(s)
+                rss_conditions = self._parse_conditions(self.__verify_dict(s.get('rss', {})))
+                cpu_conditions = self._parse_conditions(self.__verify_dict(s.get('cpu', {})))
+                if not any([conditions, rss_conditions, cpu_conditions]):
+                    raise SettingError('ProcessWatcher not found threshold: %s' % s)
             except SettingError as e:
                 raise e
             except KeyError as e:
@@ -115,9 +346,15 @@ class ProcessWatcher(Watcher):
             except Exception as e:
                 raise SettingError('ProcessWatcher settings syntax error: %s' % e)
 
-            settings.append((name, pattern, aggregate, conditions))
+            settings.append((name, pattern, aggregate, conditions, rss_conditions, cpu_conditions))
+
+        super(ProcessWatcher, self).__init__(settings=settings, matcher=MultiPatternMatcher([s[1] for s in settings]))
 
-        super(ProcessWatcher, self).__init__(settings=settings, process_reader=process_reader)
+        # runtime state (not a part of the settings)
+        # the reader keeps the snapshot for the incremental read and CPU usage, so it is never shared
+        self.process_reader = ProcfsProcessReader() if process_reader is None else process_reader
+        self.verdict_cache = TickCache(self.matcher.match, cache_ticks)  # args string -> indices of matching rules
+        self.process_counter = None  # counter of the last run
 
     @staticmethod
     def _parse_conditions(setting):
@@ -129,8 +366,6 @@ class ProcessWatcher(Watcher):
             v = setting.get(l.get_keyword())
             if v is not None:
                 ret.append((l, Matcher(v)))
-        if not ret:
-            raise SettingError('ProcessWatcher not found threshold: %s' % setting)
         return ret
 
     @staticmethod
@@ -139,18 +374,40 @@ class ProcessWatcher(Watcher):
             raise SettingError('ProcessWatcher value should be bool: %s' % x)
         return x
 
+    @staticmethod
+    def __verify_dict(x):
+        if not isinstance(x, dict):
+            raise SettingError('ProcessWatcher value should be dict: %s' % x)
+        return x
+
     def watch(self):
         """
         :return: list of Alert instances
         """
         start_time = datetime.now()
-        pc = ProcessCounter(self.process_reader.read())
+        process_dict = self.process_reader.read()
+        if self.process_counter is None:
+            self.process_counter = ProcessCounter(process_dict)
+        else:
+            self.process_counter.update(process_dict)
+
+        counts = self.process_counter.count_all(self.verdict_cache, [s[2] for s in self.settings])
+
+        usage = self.process_reader.usage
+        if usage is not None and any(s[4] or s[5] for s in self.settings):
+            rss_list, cpu_list = self._sum_usage(process_dict, usage)
+        else:
+            rss_list, cpu_list = None, None
+        self.verdict_cache.tick()
 
         result = []
-        for name, pattern, aggregate, conditions in self.settings:
-            st = self.ProcessStatus(name, pc.count(pattern, aggregate), conditions)
-            if st.level:
-                result.append(st)
+        for i, (name, pattern, aggregate, conditions, rss_conditions, cpu_conditions) in enumerate(self.settings):
+            statuses = [self.ProcessStatus(name, counts[i], conditions)]
+            if rss_list is not None:
+                statuses.append(self.ProcessUsageStatus(name, MSG_PROC_RSS_STATUS_FORMAT, rss_list[i], rss_conditions))
+            if cpu_list is not None:
+                statuses.append(self.ProcessUsageStatus(name, MSG_PROC_CPU_STATUS_FORMAT, cpu_list[i], cpu_conditions))
+            result.extend(st for st in statuses if st.level)
 
         if result:
             max_level = max(r.level for r in result)
@@ -159,6 +416,40 @@ class ProcessWatcher(Watcher):
         else:
             return []
 
+    def _sum_usage(self, process_dict, usage):
+        """
+        Sum up the resource usage of the matched processes for each rule.
+        The usage is first summed up by the args string in arrays, then added to the rules matching the args string.
+
+        :return: tuple(list of total RSS in MB, list of total CPU usage in percent or None if not sampled yet)
+        """
+        index = {}  # args string -> position in the arrays
+        rss, cpu = array('d'), array('d')
+        cpu_sampled = False
+
+        for pid, (r, c) in usage.iteritems():
+            entry = process_dict.get(pid)
+            if entry is None:
+                continue
+            i = index.get(entry[1])
+            if i is None:
+                i = index[entry[1]] = len(rss)
+                rss.append(0.0)
+                cpu.append(0.0)
+            rss[i] += r
+            if c is not None:
+                cpu[i] += c
+                cpu_sampled = True
+
+        n = len(self.settings)
+        rule_rss, rule_cpu = array('d', [0.0]) * n, array('d', [0.0]) * n
+        for args, i in index.iteritems():
+            for k in self.verdict_cache(args):
+                rule_rss[k] += rss[i]
+                rule_cpu[k] += cpu[i]
+
+        return [int(x) // (1024 * 1024) for x in rule_rss], [int(round(x)) for x in rule_cpu] if cpu_sampled else None
+
     class ProcessStatus(CaseClass):
         def __init__(self, name, count, conditions):
             super(ProcessWatcher.ProcessStatus, self).__init__(['name', 'count', 'level', 'condition'])
@@ -183,3 +474,16 @@ class ProcessWatcher(Watcher):
                 'count': count_msg,
                 'condition': self.condition
             }
+
+    class ProcessUsageStatus(ProcessStatus):
+        def __init__(self, name, message_format, value, conditions):
+            super(ProcessWatcher.ProcessUsageStatus, self).__init__(name, value, conditions)
+            self.message_format = message_format
+
+        def __str__(self):
+            return self.message_format % {
+                'level': self.level.get_text(),
+                'name': self.name,
+                'value': self.count,
+                'condition': self.condition
+            }
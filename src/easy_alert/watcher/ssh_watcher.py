@@ -1,13 +1,17 @@
+import os
 import logging
 import paramiko
 import subprocess
 import re
+import time
+import threading
 import itertools
 
 from datetime import datetime
 from watcher import Watcher
+from inventory_cache import InventoryCache
 from easy_alert.entity import Alert, Level
-from easy_alert.util import get_server_id
+from easy_alert.util import WorkerPool, WorkerTimeout, JobCancelled, apply_option, get_server_id, default_resolver
 from easy_alert.i18n import *
 from easy_alert.setting.setting_error import SettingError
 
@@ -16,7 +20,19 @@ class SSHWatcher(Watcher):
     """
     Check SSH connection to servers
 
-    configuration should be a list of this dict
+    configuration should be a list of the target dicts, or a dict with these keys
+      targets  [required]: list of the target dicts
+      concurrency        : maximum number of the hosts to check at the same time (default:10)
+      deadline           : maximum seconds to wait for all the checks (default:50)
+      cache              : path to the file to cache the output of the dynamic commands
+      cache_ttl          : seconds to use the cached output without running the command (default:300)
+      cache_max_stale    : seconds to use the cached output when the command fails (default:86400)
+
+    The hosts are checked concurrently, and the checks not finished by the deadline are reported as errors.
+    The hosts not started by the deadline are never checked afterwards, and reported in another alert (level WARN).
+    The results are always in the order of the configuration (and of the dynamic output).
+
+    target dict
       user [required]: user name to log in
       key  [required]: path to the SSH private key
       port           : SSH port number (default:22)
@@ -25,12 +41,36 @@ class SSHWatcher(Watcher):
       host        [*]: host name or IP address of the host to check connection [*required if not dynamic]
       name        [*]: short description of the host [*required if not dynamic]
 
-    The alert level is always ERR.
+    The alert level of the connection errors is always ERR.
+    Host names are resolved through the resolver cache shared with the other watchers.
+    A dynamic command which exits with non-zero status or prints an unexpected line is an error.
+    With the cache, the output is keyed by the command string, and the cache is saved after the alerts have been sent.
+    A failure of the command covered by the stale output is reported in another alert (level WARN).
     """
     DEFAULT_PORT = 22
     CONNECTION_TIMEOUT = 10  # seconds
+    DEFAULT_CONCURRENCY = 10
+    DEFAULT_DEADLINE = 50
+
+    def __init__(self, ssh_setting, print_only=False):
+        concurrency = self.DEFAULT_CONCURRENCY
+        deadline = self.DEFAULT_DEADLINE
+        cache = None
+        if isinstance(ssh_setting, dict) and 'targets' in ssh_setting:
+            try:
+                concurrency = int(ssh_setting.get('concurrency', self.DEFAULT_CONCURRENCY))
+                deadline = float(ssh_setting.get('deadline', self.DEFAULT_DEADLINE))
+                cache = apply_option(lambda p: InventoryCache(
+                    os.path.expanduser(p),
+                    float(ssh_setting.get('cache_ttl', InventoryCache.DEFAULT_TTL)),
+                    float(ssh_setting.get('cache_max_stale', InventoryCache.DEFAULT_MAX_STALE))
+                ), ssh_setting.get('cache'))
+            except Exception as e:
+                raise SettingError('SSHWatcher settings syntax error: %s' % e)
+            if concurrency < 1:
+                raise SettingError('SSHWatcher concurrency should be positive: %s' % concurrency)
+            ssh_setting = ssh_setting['targets']
 
-    def __init__(self, ssh_setting):
         if not isinstance(ssh_setting, list):
             raise SettingError('SSHWatcher settings not a list: %s' % ssh_setting)
 
@@ -53,10 +93,14 @@ class SSHWatcher(Watcher):
             except Exception as e:
                 raise SettingError('SSHWatcher settings syntax error: %s' % e)
 
-        super(SSHWatcher, self).__init__(settings=settings)
+        super(SSHWatcher, self).__init__(settings=settings, concurrency=concurrency, deadline=deadline, cache=cache,
+                                         print_only=print_only)
 
-    @staticmethod
-    def _build_target_list(s):
+        # runtime state (not a part of the settings)
+        self.inventory_errors = []  # failures of the dynamic commands covered by the cache in the current run
+        self.inventory_failures = []  # failures of the dynamic commands without the cache in the current run
+
+    def _build_target_list(self, s):
         """
         :param s: tuple (user, key, port, is_dynamic, name, host, dynamic_cmd)
         :return: list of the tuple (name, host, port, user, key)
@@ -66,13 +110,59 @@ class SSHWatcher(Watcher):
         if not is_dynamic:
             return [(name, host, port, user, key)]
 
+        return [(name, host, port, user, key) for host, name in self._get_inventory(dynamic_cmd)]
+
+    def _get_inventory(self, command):
+        """
+        :param command: dynamic command string
+        :return: list of tuple(host, name), or an empty list if the command failed without the cache
+        """
+        if self.cache is not None:
+            hosts = self.cache.get(command, self.cache.ttl)
+            if hosts is not None:
+                return hosts
+
+        try:
+            hosts = self._run_dynamic_command(command)
+        except Exception as e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+
+            # stale-while-error
+            hosts = None if self.cache is None else self.cache.get(command, self.cache.max_stale)
+            if hosts is None:
+                self.inventory_failures.append(MSG_SSH_INVENTORY_FAILED_FORMAT % {'command': command, 'error': error})
+                return []
+            self.inventory_errors.append(MSG_SSH_INVENTORY_FORMAT % {
+                'command': command,
+                'error': error,
+                'cached_at': datetime.fromtimestamp(self.cache.get_time(command)).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            return hosts
+
+        if self.cache is not None:
+            self.cache.update(command, hosts)
+        return hosts
+
+    @staticmethod
+    def _run_dynamic_command(command):
+        """
+        :param command: command string which prints '<host> <name>' for each line
+        :return: list of tuple(host, name)
+        """
+        p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = p.communicate()
+        if p.returncode != 0:
+            raise RuntimeError('Dynamic command failed with exit status %d: %s' % (p.returncode, stderr.strip()))
+
+        r = re.compile(r'^\s*(\S+)\s+(.+?)\s*$')
         ret = []
-        p = subprocess.Popen(dynamic_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        for line in p.stdout:
-            r = re.compile('^\s*(.+)\s+(.+)\s*$')
+        for line in stdout.splitlines():
+            if not line.strip():
+                continue
             m = r.match(line)
-            host, name = m.group(1, 2)
-            ret.append((name, host, port, user, key))
+            if m is None:
+                raise ValueError('Unexpected output of the dynamic command: %r' % line)
+            ret.append(m.group(1, 2))
         return ret
 
     def watch(self):
@@ -80,21 +170,71 @@ class SSHWatcher(Watcher):
         :return: list of Alert instances
         """
         start_time = datetime.now()
+        if self.cache is not None and not self.cache.loaded:
+            self.cache.load()
+        self.inventory_errors = []
+        self.inventory_failures = []
 
         target = list(itertools.chain.from_iterable(self._build_target_list(s) for s in self.settings))
+        deadline = time.time() + self.deadline
+        cancel = threading.Event()
+
+        def check(t):
+            if cancel.is_set():
+                raise JobCancelled('Cancelled before the check')
+            return self._check_ssh_connection(*t[1:])
+
+        # worker threads are daemonic, so the checks hanging after the deadline are just left behind
+        pool = WorkerPool(min(self.concurrency, max(1, len(target))))
+        try:
+            futures = pool.map(check, target)
+            for future in futures:
+                future.wait(max(0.0, deadline - time.time()))
 
-        errors = []
-        for name, host, port, user, key in target:
-            is_success, msg = self._check_ssh_connection(host, port, user, key)
-            if not is_success:
-                m = MSG_SSH_STATUS_FORMAT % {'name': name, 'user': user, 'host': host, 'port': port, 'msg': msg}
-                errors.append(m)
+            # the hosts still in the queue are never checked after the deadline
+            cancel.set()
+            pool.shutdown(cancel_pending=True)
 
+            errors = []
+            not_checked = []
+            for (name, host, port, user, key), future in zip(target, futures):
+                mapping = {'name': name, 'user': user, 'host': host, 'port': port}
+                try:
+                    is_success, msg = future.get(0)
+                except JobCancelled:
+                    not_checked.append(MSG_SSH_NOT_CHECKED_FORMAT % mapping)
+                    continue
+                except WorkerTimeout:
+                    is_success, msg = False, 'WorkerTimeout: Job did not finish in %s sec' % self.deadline
+                except Exception as e:
+                    is_success, msg = False, '%s: %s' % (e.__class__.__name__, e)
+                if not is_success:
+                    mapping['msg'] = msg
+                    errors.append(MSG_SSH_STATUS_FORMAT % mapping)
+        finally:
+            cancel.set()
+            pool.shutdown(cancel_pending=True)
+
+        alerts = []
         if errors:
             message = MSG_SSH_ALERT % {'server_id': get_server_id(), 'result': '\n'.join('%s' % s for s in errors)}
-            return [Alert(start_time, Level(logging.ERROR), MSG_SSH_ALERT_TITLE, message)]
-        else:
-            return []
+            alerts.append(Alert(start_time, Level(logging.ERROR), MSG_SSH_ALERT_TITLE, message))
+        if not_checked:
+            message = MSG_SSH_NOT_CHECKED % {
+                'server_id': get_server_id(), 'deadline': self.deadline, 'result': '\n'.join(not_checked)
+            }
+            alerts.append(Alert(start_time, Level(logging.WARN), MSG_SSH_NOT_CHECKED_TITLE, message))
+        if self.inventory_failures:
+            message = MSG_SSH_INVENTORY_FAILED_ALERT % {
+                'server_id': get_server_id(), 'result': '\n'.join(self.inventory_failures)
+            }
+            alerts.append(Alert(start_time, Level(logging.ERROR), MSG_SSH_INVENTORY_FAILED_TITLE, message))
+        if self.inventory_errors:
+            message = MSG_SSH_INVENTORY_ALERT % {
+                'server_id': get_server_id(), 'result': '\n'.join(self.inventory_errors)
+            }
+            alerts.append(Alert(start_time, Level(logging.WARN), MSG_SSH_INVENTORY_TITLE, message))
+        return alerts
 
     @staticmethod
     def _check_ssh_connection(host, port, user, key):
@@ -104,10 +244,28 @@ class SSHWatcher(Watcher):
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
+        sock = None
         try:
-            client.connect(host, port, user, key_filename=key, timeout=10)
+            sock = default_resolver.create_connection((host, port), SSHWatcher.CONNECTION_TIMEOUT)
+            client.connect(host, port, user, key_filename=key, timeout=SSHWatcher.CONNECTION_TIMEOUT, sock=sock)
             return True, None
         except Exception as e:
             return False, '%s: %s' % (e.__class__.__name__, str(e))
         finally:
             client.close()
+            if sock is not None:
+                sock.close()
+
+    def after_success(self):
+        """Save the cache after the notification."""
+
+        if self.cache is None:
+            return
+
+        self.cache.retain([s[6] for s in self.settings if s[3]])
+        if not self.cache.dirty:
+            return
+        if self.print_only:
+            print('Would update cache: %s' % self.cache.path)
+        else:
+            self.cache.save()
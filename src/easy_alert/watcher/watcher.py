@@ -16,3 +16,21 @@ class Watcher(CaseClass):
 
     def after_success(self):
         """do nothing in default"""
+
+    def prepare(self):
+        """
+        Set up the resources kept across the runs, e.g. child processes
+
+        Called in the main thread before any watcher thread starts. Do nothing in default.
+        """
+
+    def close(self):
+        """Release the resources set up by prepare(). Do nothing in default."""
+
+    def watch_patterns(self):
+        """
+        Files whose changes should trigger watch() right away in the daemon mode
+
+        :return: list of tuple(glob pattern, true if the file grows in place)
+        """
+        return []
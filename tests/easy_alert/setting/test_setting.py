@@ -90,6 +90,20 @@ class TestSetting(unittest.TestCase):
         s2 = Setting().parse_args(['easy-alert', 'process', 'ssh', '--config', '/etc/easy-alert.yml', '--check'])
         self.assertEqual(s2, Setting(['process', 'ssh'], '/etc/easy-alert.yml', True, logger=PrintLogger()))
 
+    def test_parse_args_workers(self):
+        s1 = Setting().parse_args(['easy-alert', 'process', '--workers', '8'])
+        self.assertEqual(s1, Setting(['process'], '/etc/easy-alert/easy-alert.yml', False, workers=8))
+        self.assertEqual(Setting().parse_args(['easy-alert', 'process']).workers, 4)
+
+        with captured_output() as (out, err):
+            self._assert_system_exit(2, lambda: Setting().parse_args(['easy-alert', 'process', '--workers', '0']))
+        self.assertIn('Usage: ', err.getvalue().splitlines())
+
+    def test_parse_args_daemon(self):
+        s1 = Setting().parse_args(['easy-alert', 'process', 'log', '--daemon'])
+        self.assertEqual(s1, Setting(['process', 'log'], '/etc/easy-alert/easy-alert.yml', False, daemon=True))
+        self.assertEqual(Setting().parse_args(['easy-alert', 'process']).daemon, False)
+
     def test_load_config_assertion(self):
         with self.assertRaises(AssertionError) as cm:
             Setting().load_config()
@@ -213,3 +227,38 @@ class TestSetting(unittest.TestCase):
             Setting(['log'], 'tests/resources/easy-alert-test-055.yml', False).load_config()
         self.assertEqual(cm.exception.args[0],
                          "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+
+    def test_load_config_schedule(self):
+        s = Setting(['process', 'log'], 'tests/resources/easy-alert-test-101.yml', False).load_config()
+        self.assertEqual(s.intervals, {'process': 5, 'log': 0.5})
+        self.assertEqual(s.get_interval('process'), 5)
+        self.assertEqual(s.get_interval('log'), 0.5)
+        self.assertEqual(s.get_interval('ssh'), 60)
+
+        s = Setting(['process'], 'tests/resources/easy-alert-test-100.yml', False).load_config()
+        self.assertEqual(s.intervals, {})
+        self.assertEqual(s.get_interval('process'), 60)
+        self.assertEqual(s.get_debounce('log'), 10)
+
+        s = Setting(['process', 'log'], 'tests/resources/easy-alert-test-102.yml', False).load_config()
+        self.assertEqual(s.intervals, {'process': 5, 'log': 30, 'ssh': 60})
+        self.assertEqual(s.debounces, {'log': 0, 'ssh': 2.5})
+        self.assertEqual(s.get_debounce('process'), 10)
+        self.assertEqual(s.get_debounce('log'), 0)
+
+    def test_load_config_schedule_error(self):
+        with self.assertRaises(SettingError) as cm:
+            Setting(['process'], 'tests/resources/easy-alert-test-060.yml', False).load_config()
+        self.assertEqual(cm.exception.args[0], 'Syntax error: tests/resources/easy-alert-test-060.yml')
+        with self.assertRaises(SettingError) as cm:
+            Setting(['process'], 'tests/resources/easy-alert-test-061.yml', False).load_config()
+        self.assertEqual(cm.exception.args[0], 'Unsupported watcher type in "schedule": xxx')
+        with self.assertRaises(SettingError) as cm:
+            Setting(['process'], 'tests/resources/easy-alert-test-062.yml', False).load_config()
+        self.assertEqual(cm.exception.args[0], 'Invalid interval for "process": 0')
+        with self.assertRaises(SettingError) as cm:
+            Setting(['process'], 'tests/resources/easy-alert-test-063.yml', False).load_config()
+        self.assertEqual(cm.exception.args[0], 'Invalid debounce for "process": -1')
+        with self.assertRaises(SettingError) as cm:
+            Setting(['process'], 'tests/resources/easy-alert-test-064.yml', False).load_config()
+        self.assertEqual(cm.exception.args[0], 'Unknown schedule key for "process": xxx')
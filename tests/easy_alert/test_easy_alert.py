@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import syslog
+import tempfile
+import threading
+from easy_alert import easy_alert
+from easy_alert.easy_alert import run_watchers, run_daemon
+from easy_alert.setting.setting import Setting
+from easy_alert.util import Scheduler, Inotify
+from easy_alert.watcher.watcher import Watcher
+from tests.easy_alert.util.system_logger_mock import SystemLoggerMock
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class FakeWatcher(Watcher):
+    def __init__(self, name, events, delay=0.0, alerts=None, error=None, patterns=None):
+        super(FakeWatcher, self).__init__(name=name, delay=delay, alerts=alerts, error=error, patterns=patterns)
+        self.events = events
+
+    def watch(self):
+        self.events.append(('start', self.name))
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.events.append(('end', self.name))
+        return self.alerts or ['%s-%d' % (self.name, i) for i in range(2)]
+
+    def after_success(self):
+        self.events.append(('after_success', self.name))
+
+    def prepare(self):
+        self.events.append(('prepare', self.name))
+        self.events.append(('prepare_threads', threading.active_count()))
+
+    def close(self):
+        self.events.append(('close', self.name))
+
+    def watch_patterns(self):
+        return self.patterns or []
+
+
+class FakeNotifier(object):
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+        self.lock = threading.Lock()
+
+    def notify(self, alert):
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            self.events.append(('notify', alert))
+
+
+class TestRunWatchers(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.log = []
+
+    def _setting(self, watchers, notifiers=None, workers=4):
+        return Setting([w.name for w in watchers], None, False, watchers,
+                       [FakeNotifier(self.events)] if notifiers is None else notifiers,
+                       SystemLoggerMock(buffer=self.log), workers)
+
+    def _events(self, kind):
+        return [x for k, x in self.events if k == kind]
+
+    def test_run_watchers_concurrent(self):
+        watchers = [FakeWatcher('a', self.events, 0.3), FakeWatcher('b', self.events, 0.1),
+                    FakeWatcher('c', self.events, 0.2)]
+        t = time.time()
+        run_watchers(self._setting(watchers))
+        elapsed = time.time() - t
+
+        # the watchers overlap
+        self.assertTrue(elapsed < 0.5, elapsed)
+        self.assertEqual(sorted(self._events('start')), ['a', 'b', 'c'])
+        self.assertEqual(self._events('end'), ['b', 'c', 'a'])
+
+        # the alerts are sent in the order of the watchers
+        self.assertEqual(self._events('notify'), ['a-0', 'a-1', 'b-0', 'b-1', 'c-0', 'c-1'])
+
+        # after_success runs only after the alerts of the watcher have been sent
+        for name in ['a', 'b', 'c']:
+            self.assertTrue(self.events.index(('after_success', name)) > self.events.index(('notify', name + '-1')))
+        self.assertEqual(sorted(self._events('after_success')), ['a', 'b', 'c'])
+        self.assertEqual(self.log, [])
+
+        # prepared before any watcher thread starts, and closed at the end
+        self.assertEqual(self.events[:6:2], [('prepare', 'a'), ('prepare', 'b'), ('prepare', 'c')])
+        self.assertEqual(self._events('prepare_threads'), [threading.active_count()] * 3)
+        self.assertEqual(self.events[-3:], [('close', 'a'), ('close', 'b'), ('close', 'c')])
+
+    def test_run_watchers_single_worker(self):
+        watchers = [FakeWatcher('a', self.events, 0.1), FakeWatcher('b', self.events)]
+        run_watchers(self._setting(watchers, workers=1))
+        self.assertEqual(self._events('end'), ['a', 'b'])
+        self.assertEqual(self._events('notify'), ['a-0', 'a-1', 'b-0', 'b-1'])
+
+    def test_run_watchers_error(self):
+        watchers = [FakeWatcher('a', self.events, 0.1), FakeWatcher('b', self.events, error=RuntimeError('oops')),
+                    FakeWatcher('c', self.events)]
+        with self.assertRaises(RuntimeError) as cm:
+            run_watchers(self._setting(watchers))
+        self.assertEqual(cm.exception.args[0], 'oops')
+
+        # the other watchers are not affected
+        self.assertEqual(self._events('notify'), ['a-0', 'a-1', 'c-0', 'c-1'])
+        self.assertEqual(sorted(self._events('after_success')), ['a', 'c'])
+        self.assertEqual(self.log, [(syslog.LOG_ERR, 'Watcher b ended with error: RuntimeError: oops')])
+
+    def test_run_watchers_notifier_error(self):
+        watchers = [FakeWatcher('a', self.events), FakeWatcher('b', self.events)]
+        with self.assertRaises(IOError):
+            run_watchers(self._setting(watchers, [FakeNotifier(self.events, IOError('failed to send'))]))
+
+        # nothing is marked as done without the notification
+        self.assertEqual(self._events('after_success'), [])
+
+
+class ImmediateScheduler(Scheduler):
+    """Scheduler without jitter, which runs every job right after the start"""
+
+    instances = []
+
+    def __init__(self, pool, logger):
+        super(ImmediateScheduler, self).__init__(pool, logger, jitter=0.0)
+        ImmediateScheduler.instances.append(self)
+
+
+class TestRunDaemon(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.log = []
+        ImmediateScheduler.instances = []
+        self.scheduler, easy_alert.Scheduler = easy_alert.Scheduler, ImmediateScheduler
+
+    def tearDown(self):
+        easy_alert.Scheduler = self.scheduler
+
+    def _setting(self, watchers, intervals, debounces=None):
+        return Setting([w.name for w in watchers], None, False, watchers, [FakeNotifier(self.events)],
+                       SystemLoggerMock(buffer=self.log), 4, True, intervals, debounces or {})
+
+    def _events(self, kind, name):
+        return [x for k, x in self.events if k == kind and x.startswith(name)]
+
+    def _wait_for(self, condition, timeout=5.0):
+        t = time.time() + timeout
+        while not condition() and time.time() < t:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_run_daemon(self):
+        watchers = [FakeWatcher('a', self.events, error=RuntimeError('oops')), FakeWatcher('b', self.events)]
+        setting = self._setting(watchers, {'a': 0.1, 'b': 0.1})
+
+        handler = signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.55, os.kill, [os.getpid(), signal.SIGTERM])
+        timer.start()
+        try:
+            run_daemon(setting)
+        finally:
+            timer.cancel()
+
+        # the watcher raising every time never stops the others
+        errors = [m for _, m in self.log if m == 'Watcher a ended with error: RuntimeError: oops']
+        self.assertTrue(4 <= len(errors) <= 7, self.log)
+        self.assertTrue(4 <= len(self._events('after_success', 'b')) <= 7, self.events)
+        self.assertEqual(len(self._events('notify', 'b')), 2 * len(self._events('after_success', 'b')))
+        self.assertEqual(self._events('after_success', 'a'), [])
+
+        # clean shutdown: nothing runs after the stop, and the signal handler is restored
+        self.assertTrue(ImmediateScheduler.instances[0].is_stopped())
+        self.assertTrue('Received signal: %d' % signal.SIGTERM in [m for _, m in self.log])
+        self.assertTrue(signal.getsignal(signal.SIGTERM) is handler)
+        n = len(self.events)
+        time.sleep(0.2)
+        self.assertEqual(len(self.events), n)
+
+    def test_run_daemon_stop(self):
+        watchers = [FakeWatcher('a', self.events, delay=0.2)]
+        setting = self._setting(watchers, {'a': 100})
+        threading.Timer(0.1, lambda: ImmediateScheduler.instances[0].stop()).start()
+
+        # the running watcher finishes before the exit
+        run_daemon(setting)
+        self.assertEqual(self._events('after_success', 'a'), ['a'])
+
+    @unittest.skipUnless(Inotify.is_available(), 'inotify is not available')
+    def test_run_daemon_file_monitor(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pattern = os.path.join(temp_dir, '*.log')
+            watchers = [FakeWatcher('a', self.events, patterns=[(pattern, False)]), FakeWatcher('b', self.events)]
+            setting = self._setting(watchers, {'a': 100, 'b': 100}, {'a': 0})
+
+            def write_files():
+                # the first run at the start, then woken up by the file
+                self._wait_for(lambda: len(self._events('after_success', 'a')) == 1)
+                with open(os.path.join(temp_dir, 'x.log'), 'w') as f:
+                    f.write('x')
+                self._wait_for(lambda: len(self._events('after_success', 'a')) == 2)
+                ImmediateScheduler.instances[0].stop()
+
+            t = threading.Thread(target=write_files)
+            t.start()
+            run_daemon(setting)
+            t.join()
+
+            self.assertEqual(self._events('after_success', 'a'), ['a', 'a'])
+            self.assertEqual(self._events('after_success', 'b'), ['b'])
+            self.assertTrue('Watching files for watcher: a' in [m for _, m in self.log])
+        finally:
+            shutil.rmtree(temp_dir)
@@ -5,7 +5,7 @@ from easy_alert.logger.system_logger import SystemLogger
 
 class SystemLoggerMock(SystemLogger):
     def __init__(self, print_only=False, buffer=list()):
-        super(SystemLoggerMock, self).__init__(print_only)
+        super(SystemLoggerMock, self).__init__()
         self.buffer = buffer
 
     def info(self, message):
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from easy_alert.util.file_monitor import Inotify, FileMonitor
+from tests.easy_alert.util.system_logger_mock import SystemLoggerMock
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class SchedulerMock(object):
+    def __init__(self):
+        self.triggered = []
+        self.stopped = False
+
+    def trigger(self, name):
+        self.triggered.append(name)
+
+    def is_stopped(self):
+        return self.stopped
+
+
+@unittest.skipUnless(Inotify.is_available(), 'inotify is not available')
+class TestFileMonitor(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, name, text, mode='a'):
+        with open(os.path.join(self.temp_dir, name), mode) as f:
+            f.write(text)
+
+    def test_inotify(self):
+        ino = Inotify()
+        try:
+            wd = ino.add_watch(self.temp_dir, Inotify.IN_CREATE | Inotify.IN_CLOSE_WRITE)
+            self.assertEqual(ino.read_events(0.01), [])
+
+            self._write('a.log', 'x')
+            self.assertEqual(ino.read_events(1.0), [
+                (wd, Inotify.IN_CREATE, 'a.log'),
+                (wd, Inotify.IN_CLOSE_WRITE, 'a.log'),
+            ])
+        finally:
+            ino.close()
+
+    def test_inotify_error(self):
+        ino = Inotify()
+        try:
+            self.assertRaises(OSError, ino.add_watch, os.path.join(self.temp_dir, 'xxx'), Inotify.IN_CREATE)
+        finally:
+            ino.close()
+
+    def test_dispatch(self):
+        scheduler = SchedulerMock()
+        buf = []
+        monitor = FileMonitor(scheduler, SystemLoggerMock(buffer=buf))
+        try:
+            self.assertEqual(monitor.add('log', [(os.path.join(self.temp_dir, 'alert.*.log'), False)]), 1)
+            self.assertEqual(monitor.add('tail', [(os.path.join(self.temp_dir, 'messages'), True),
+                                                  (os.path.join(self.temp_dir, 'xxx', 'messages'), True)]), 1)
+            self.assertEqual(len(buf), 1)
+            self.assertTrue(buf[0][1].startswith('Failed to watch files: %s' % os.path.join(self.temp_dir, 'xxx')))
+
+            wd = list(monitor.rules.keys())[0]
+            self.assertEqual(monitor._dispatch([]), set())
+            self.assertEqual(monitor._dispatch([(wd, Inotify.IN_CLOSE_WRITE, 'alert.1.log')]), set(['log']))
+            self.assertEqual(monitor._dispatch([(wd, Inotify.IN_MODIFY, 'alert.1.log')]), set())
+            self.assertEqual(monitor._dispatch([(wd, Inotify.IN_CLOSE_WRITE, 'alert.1.tmp')]), set())
+            self.assertEqual(monitor._dispatch([(wd, Inotify.IN_MODIFY, 'messages')]), set(['tail']))
+            self.assertEqual(monitor._dispatch([(wd, Inotify.IN_MOVED_TO, 'messages'),
+                                                (wd, Inotify.IN_MOVED_TO, 'alert.1.log')]), set(['log', 'tail']))
+            self.assertEqual(monitor._dispatch([(wd + 1, Inotify.IN_MODIFY, 'messages')]), set())
+            self.assertEqual(monitor._dispatch([(-1, Inotify.IN_Q_OVERFLOW, '')]), set(['log', 'tail']))
+        finally:
+            monitor.inotify.close()
+
+    def test_run(self):
+        scheduler = SchedulerMock()
+        monitor = FileMonitor(scheduler, SystemLoggerMock(buffer=[]))
+        monitor.add('tail', [(os.path.join(self.temp_dir, 'messages'), True)])
+        monitor.start()
+        try:
+            self._write('other', 'x')
+            self._write('messages', 'x')
+            for _ in range(100):
+                if scheduler.triggered:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(scheduler.triggered[:1], ['tail'])
+            self.assertEqual(set(scheduler.triggered), set(['tail']))
+        finally:
+            scheduler.stopped = True
+            monitor.join()
@@ -0,0 +1,151 @@
+import sys
+import time
+import errno
+import socket
+import httplib
+import urllib2
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from easy_alert.util.http_pool import HTTPConnectionPool, RequestTiming, _is_closed_by_peer
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self._respond(302, '', [('Location', '/ok?x=1')])
+        elif self.path == '/close':
+            self._respond(200, 'bye', [('Connection', 'close')])
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self._respond(200, 'slow')
+        elif self.path.startswith('/ok'):
+            self._respond(200, 'ok:' + self.path)
+        else:
+            self._respond(404, 'not found')
+
+    def _respond(self, code, body, headers=()):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.connections = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        self.pool = HTTPConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_urlopen_keep_alive(self):
+        for i in range(3):
+            self.assertEqual(self.pool.urlopen(self.base + '/ok', 5), (200, 'ok:/ok'))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.pool.stats, {'created': 1, 'reused': 2})
+
+    def test_urlopen_without_scheme(self):
+        self.assertEqual(self.pool.urlopen(self.base[len('http://'):] + '/ok', 5), (200, 'ok:/ok'))
+
+    def test_urlopen_redirect(self):
+        self.assertEqual(self.pool.urlopen(self.base + '/redirect', 5), (200, 'ok:/ok?x=1'))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_urlopen_error(self):
+        with self.assertRaises(urllib2.HTTPError) as cm:
+            self.pool.urlopen(self.base + '/xxx', 5)
+        self.assertEqual(cm.exception.code, 404)
+
+        # the connection is still reusable
+        self.assertEqual(self.pool.urlopen(self.base + '/ok', 5), (200, 'ok:/ok'))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_urlopen_connection_close(self):
+        self.assertEqual(self.pool.urlopen(self.base + '/close', 5), (200, 'bye'))
+        self.assertEqual(self.pool.urlopen(self.base + '/ok', 5), (200, 'ok:/ok'))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_urlopen_stale(self):
+        self.pool.urlopen(self.base + '/ok', 5)
+
+        # close the idle connection from the client side
+        (conn, _), = self.pool.idle.values()[0]
+        conn.sock.shutdown(2)
+
+        self.assertEqual(self.pool.urlopen(self.base + '/ok', 5), (200, 'ok:/ok'))
+        self.assertEqual(self.pool.stats, {'created': 2, 'reused': 1})
+
+    def test_urlopen_timeout_reused(self):
+        self.pool.urlopen(self.base + '/ok', 5)
+
+        # the timeout on the reused connection is not retried
+        t = time.time()
+        with self.assertRaises(socket.timeout):
+            self.pool.urlopen(self.base + '/slow', 0.2)
+        self.assertTrue(time.time() - t < 0.4)
+        self.assertEqual(self.pool.stats, {'created': 1, 'reused': 1})
+
+    def test_is_closed_by_peer(self):
+        self.assertTrue(_is_closed_by_peer(httplib.BadStatusLine("''")))
+        self.assertTrue(_is_closed_by_peer(socket.error(errno.ECONNRESET, 'Connection reset by peer')))
+        self.assertTrue(_is_closed_by_peer(socket.error(errno.EPIPE, 'Broken pipe')))
+        self.assertFalse(_is_closed_by_peer(socket.timeout('timed out')))
+        self.assertFalse(_is_closed_by_peer(socket.error(errno.ECONNREFUSED, 'Connection refused')))
+        self.assertFalse(_is_closed_by_peer(httplib.IncompleteRead('')))
+
+    def test_urlopen_expired(self):
+        now = [0]
+        self.pool.clock = lambda: now[0]
+        self.pool.urlopen(self.base + '/ok', 5)
+        now[0] = 60
+        self.pool.urlopen(self.base + '/ok', 5)
+        self.assertEqual(self.pool.stats, {'created': 2, 'reused': 0})
+
+    def test_urlopen_consumer(self):
+        def consumer(code, resp):
+            return resp.read(2), False
+
+        self.assertEqual(self.pool.urlopen(self.base + '/ok', 5, consumer), (200, 'ok'))
+        self.assertEqual(self.pool.urlopen(self.base + '/ok', 5), (200, 'ok:/ok'))
+
+        # the connection read partially is not reused
+        self.assertEqual(self.pool.stats, {'created': 2, 'reused': 0})
+
+    def test_urlopen_timing(self):
+        timing = RequestTiming()
+        self.pool.urlopen(self.base + '/ok', 5, timing=timing)
+        self.assertTrue(timing.dns >= 0)
+        self.assertTrue(timing.connect >= 0)
+        self.assertEqual(timing.tls, 0)
+        self.assertTrue(timing.ttfb > 0)
+        self.assertTrue(timing.total >= timing.dns + timing.connect + timing.ttfb)
+
+        # reused connection
+        timing = RequestTiming()
+        self.pool.urlopen(self.base + '/ok', 5, timing=timing)
+        self.assertEqual((timing.dns, timing.connect, timing.tls), (0, 0, 0))
+        self.assertTrue(timing.ttfb > 0)
+        self.assertEqual(sorted(timing.to_millis().keys()), ['connect', 'dns', 'tls', 'total', 'ttfb'])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import sys
+import re
+from easy_alert.util.multi_matcher import MultiPatternMatcher
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestMultiPatternMatcher(unittest.TestCase):
+    def test_required_literal(self):
+        def assert_literal(pattern, expected):
+            self.assertEqual(MultiPatternMatcher._required_literal(re.compile(pattern)), expected)
+
+        assert_literal('^/usr/sbin/syslogd', (True, '/usr/sbin/syslogd'))
+        assert_literal(r'\A/usr/sbin/syslogd$', (True, '/usr/sbin/syslogd'))
+        assert_literal('^/usr/.*/syslogd', (True, '/usr/'))
+        assert_literal('^.*/syslogd', (False, '/syslogd'))
+        assert_literal('(?m)^/usr/sbin', (False, '/usr/sbin'))
+        assert_literal('awesome[-]?app', (False, 'awesome'))
+        assert_literal('abc?de', (False, 'ab'))
+        assert_literal('(?i)abc', (False, None))
+        assert_literal('abc|def', (False, None))
+        assert_literal('a.b', (False, None))
+        assert_literal('.*', (False, None))
+        assert_literal('', (False, None))
+        assert_literal(u'^/usr/bin/あいう', (True, '/usr/bin/'))
+
+    def test_match(self):
+        patterns = [re.compile(p) for p in [
+            '.*', '^/usr/sbin/syslogd', '^/usr/', 'awesome[-]?app', '(?i)AWESOME', 'arg1|arg9', '^/sbin/launchd$',
+            'zzz',
+        ]]
+        m = MultiPatternMatcher(patterns)
+
+        def assert_match(s):
+            self.assertEqual(m.match(s), frozenset(i for i, p in enumerate(patterns) if p.search(s)))
+
+        self.assertEqual(m.match('/usr/sbin/syslogd'), frozenset([0, 1, 2]))
+        self.assertEqual(m.match('your-awesome-app arg1 arg2'), frozenset([0, 3, 4, 5]))
+        self.assertEqual(m.match('/sbin/launchd'), frozenset([0, 6]))
+        self.assertEqual(m.match(''), frozenset([0]))
+
+        for s in ['/usr/sbin/syslogd', '/usr/sbin/sys', '/usr', 'x /usr/sbin/syslogd', 'awesomeapp', 'AwEsOmE',
+                  '/sbin/launchd -x', 'zz', 'zzzz', '/usr/libexec/UserEventAgent (System)']:
+            assert_match(s)
+
+    def test_match_empty(self):
+        self.assertEqual(MultiPatternMatcher([]).match('abc'), frozenset())
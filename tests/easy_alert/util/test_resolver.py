@@ -0,0 +1,88 @@
+import sys
+import socket
+from easy_alert.util.resolver import Resolver
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.calls = []
+        self.resolver = Resolver(ttl=60, negative_ttl=10, max_entries=3, clock=lambda: self.now,
+                                 getaddrinfo=self._getaddrinfo)
+
+    def _getaddrinfo(self, host, port, family, socktype):
+        self.calls.append(host)
+        if host == 'unknown':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        if host == 'again':
+            raise socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.%d' % len(self.calls), port))]
+
+    def test_getaddrinfo(self):
+        r = self.resolver
+        a = r.getaddrinfo('h1', 80)
+        self.assertEqual(a[0][4], ('192.0.2.1', 80))
+        self.assertEqual(r.getaddrinfo('h1', 80), a)
+        self.assertEqual(r.getaddrinfo('h1', 443)[0][4], ('192.0.2.2', 443))
+        self.assertEqual(self.calls, ['h1', 'h1'])
+
+        # expired
+        self.now = 60
+        self.assertEqual(r.getaddrinfo('h1', 80)[0][4], ('192.0.2.3', 80))
+        self.assertEqual(r.get_stats(), {'hits': 1, 'negative_hits': 0, 'misses': 3, 'entries': 2})
+
+    def test_getaddrinfo_negative(self):
+        r = self.resolver
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror) as cm:
+                r.getaddrinfo('unknown', 80)
+            self.assertEqual(cm.exception.args[0], socket.EAI_NONAME)
+        self.assertEqual(self.calls, ['unknown'])
+
+        self.now = 10
+        with self.assertRaises(socket.gaierror):
+            r.getaddrinfo('unknown', 80)
+        self.assertEqual(self.calls, ['unknown', 'unknown'])
+        self.assertEqual(r.get_stats(), {'hits': 0, 'negative_hits': 1, 'misses': 2, 'entries': 1})
+
+    def test_getaddrinfo_temporary_failure(self):
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                self.resolver.getaddrinfo('again', 80)
+        self.assertEqual(self.calls, ['again', 'again'])
+
+    def test_purge(self):
+        r = self.resolver
+        r.getaddrinfo('h1', 80)
+        r.getaddrinfo('h2', 80)
+        self.now = 30
+        r.getaddrinfo('h3', 80)
+        self.now = 61
+        r.getaddrinfo('h4', 80)
+        self.assertEqual(sorted(r._entries.keys()), [('h3', 80), ('h4', 80)])
+
+        r.clear()
+        self.assertEqual(r.get_stats()['entries'], 0)
+
+    def test_create_connection(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        try:
+            r = Resolver()
+            for _ in range(2):
+                sock = r.create_connection(('127.0.0.1', port), 5)
+                self.assertEqual(sock.getpeername(), ('127.0.0.1', port))
+                sock.close()
+            self.assertEqual((r.hits, r.misses), (1, 1))
+        finally:
+            server.close()
+
+        with self.assertRaises(socket.error):
+            r.create_connection(('127.0.0.1', port), 5)
@@ -0,0 +1,130 @@
+import sys
+import threading
+from easy_alert.util.retry_policy import RetryPolicy
+from easy_alert.util.worker_pool import JobCancelled
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class _FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.clock = _FakeClock()
+        self.waits = []
+
+    def _policy(self, count, **kwargs):
+        return RetryPolicy(count, clock=self.clock, rand=lambda: 0.5, sleep=self._sleep, **kwargs)
+
+    def _sleep(self, sec):
+        self.waits.append(sec)
+        self.clock.now += sec
+
+    def _failing(self, n, exc=IOError('xxx')):
+        """Function which fails n times, then returns the number of the calls"""
+        calls = []
+
+        def f():
+            calls.append(self.clock.now)
+            if len(calls) <= n:
+                raise exc
+            return len(calls)
+        return f, calls
+
+    def test_init_error(self):
+        with self.assertRaises(ValueError) as cm:
+            RetryPolicy(-1)
+        self.assertEqual(cm.exception.args[0], 'Retry count should not be negative: -1')
+
+    def test_get_wait(self):
+        p = self._policy(5, backoff=1, max_backoff=5)
+        self.assertEqual([p.get_wait(n) for n in range(5)], [0.5, 1.0, 2.0, 2.5, 2.5])
+
+        p = self._policy(5, backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([p.get_wait(n) for n in range(5)], [1, 2, 4, 5, 5])
+
+        p = self._policy(5, backoff=3, max_backoff=3, multiplier=1, jitter=False)
+        self.assertEqual([p.get_wait(n) for n in range(5)], [3, 3, 3, 3, 3])
+
+    def test_call(self):
+        f, calls = self._failing(2)
+        self.assertEqual(self._policy(3).call(f), 3)
+        self.assertEqual(self.waits, [0.5, 1.0])
+
+    def test_call_error(self):
+        f, calls = self._failing(10)
+        with self.assertRaises(IOError) as cm:
+            self._policy(3).call(f)
+        self.assertEqual(cm.exception.args[0], 'xxx')
+        self.assertEqual(len(calls), 4)
+
+    def test_call_not_retryable(self):
+        f, calls = self._failing(10, ValueError('yyy'))
+        with self.assertRaises(ValueError):
+            self._policy(3, retryable=lambda e: not isinstance(e, ValueError)).call(f)
+        self.assertEqual(len(calls), 1)
+
+    def test_call_deadline(self):
+        f, calls = self._failing(10)
+        with self.assertRaises(IOError):
+            self._policy(10, jitter=False, deadline=5).call(f)
+
+        # waits 1, 2, then 4 would pass the deadline
+        self.assertEqual(calls, [0.0, 1.0, 3.0])
+
+    def test_call_budget(self):
+        f, calls = self._failing(10)
+        with self.assertRaises(IOError):
+            self._policy(10, jitter=False, deadline=100).call(f, budget=2.5)
+        self.assertEqual(calls, [0.0, 1.0])
+
+    def test_call_cancel(self):
+        cancel = threading.Event()
+        calls = []
+
+        def f():
+            calls.append(1)
+            cancel.set()
+            raise IOError('xxx')
+
+        with self.assertRaises(IOError):
+            RetryPolicy(10, backoff=60).call(f, cancel=cancel)
+        self.assertEqual(len(calls), 1)
+
+        # cancelled before the first attempt
+        with self.assertRaises(JobCancelled):
+            RetryPolicy(10, backoff=60).call(f, cancel=cancel)
+        self.assertEqual(len(calls), 1)
+
+    def test_from_config(self):
+        self.assertEqual(RetryPolicy.from_config(3), RetryPolicy(3))
+        self.assertEqual(RetryPolicy.from_config('3'), RetryPolicy(3))
+        self.assertEqual(RetryPolicy.from_config({}), RetryPolicy(0))
+        self.assertEqual(
+            RetryPolicy.from_config({'count': 2, 'backoff': 0.5, 'max_backoff': 4, 'multiplier': 3, 'jitter': False,
+                                     'deadline': 10}),
+            RetryPolicy(2, backoff=0.5, max_backoff=4.0, multiplier=3.0, jitter=False, deadline=10.0))
+
+        def retryable(e):
+            return False
+        self.assertTrue(RetryPolicy.from_config({'count': 1}, retryable).retryable is retryable)
+
+    def test_from_config_error(self):
+        def assert_err(value, expected):
+            with self.assertRaises(ValueError) as cm:
+                RetryPolicy.from_config(value)
+            self.assertEqual(cm.exception.args[0], expected)
+
+        assert_err('a', "invalid literal for int() with base 10: 'a'")
+        assert_err({'count': 1, 'xxx': 2, 'abc': 3}, 'Unknown retry key: abc, xxx')
+        assert_err({'jitter': 'yes'}, 'Retry jitter should be bool: yes')
+        assert_err({'deadline': 'a'}, 'could not convert string to float: a')
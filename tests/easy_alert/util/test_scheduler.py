@@ -0,0 +1,127 @@
+import sys
+import time
+import threading
+from easy_alert.util.scheduler import Scheduler
+from easy_alert.util.worker_pool import WorkerPool
+from tests.easy_alert.util.system_logger_mock import SystemLoggerMock
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestScheduler(unittest.TestCase):
+    def _run(self, scheduler, duration):
+        threading.Timer(duration, scheduler.stop).start()
+        scheduler.run()
+
+    def test_add_error(self):
+        s = Scheduler(WorkerPool(1), SystemLoggerMock(buffer=[]))
+        self.assertRaises(ValueError, s.add, 'x', 0, lambda: None)
+        self.assertRaises(ValueError, s.add, 'x', 1, lambda: None, -1)
+
+    def test_run(self):
+        counter = {'a': 0, 'b': 0}
+
+        def f(key):
+            counter[key] += 1
+
+        with WorkerPool(2) as pool:
+            s = Scheduler(pool, SystemLoggerMock(buffer=[]), jitter=0.0)
+            s.add('a', 0.1, lambda: f('a'))
+            s.add('b', 10, lambda: f('b'))
+            self._run(s, 0.55)
+
+        self.assertTrue(s.is_stopped())
+        self.assertTrue(4 <= counter['a'] <= 7)
+        self.assertEqual(counter['b'], 1)
+
+    def test_run_skip_busy(self):
+        counter = {'a': 0}
+
+        def f():
+            counter['a'] += 1
+            time.sleep(0.35)
+
+        buf = []
+        with WorkerPool(2) as pool:
+            s = Scheduler(pool, SystemLoggerMock(buffer=buf), jitter=0.0)
+            s.add('a', 0.1, f)
+            self._run(s, 0.55)
+
+        self.assertEqual(counter['a'], 2)
+        self.assertTrue(s.jobs[0].skipped >= 2)
+        self.assertIn('Skipped the tick for a: previous run is still busy.', [m for _, m in buf])
+
+    def test_trigger(self):
+        counter = {'a': 0, 'b': 0}
+
+        def f(key):
+            counter[key] += 1
+
+        with WorkerPool(2) as pool:
+            s = Scheduler(pool, SystemLoggerMock(buffer=[]), jitter=0.0)
+            s.add('a', 10, lambda: f('a'))
+            s.add('b', 10, lambda: f('b'))
+            for t in [0.1, 0.2, 0.3]:
+                threading.Timer(t, s.trigger, ['a']).start()
+            self._run(s, 0.45)
+
+        self.assertEqual(counter, {'a': 4, 'b': 1})
+        self.assertAlmostEqual(s.jobs[0].base_time, s.jobs[1].base_time, places=2)
+
+    def test_trigger_busy(self):
+        times = []
+
+        def f():
+            times.append(time.time())
+            time.sleep(0.2)
+
+        buf = []
+        with WorkerPool(2) as pool:
+            s = Scheduler(pool, SystemLoggerMock(buffer=buf), jitter=0.0)
+            s.add('a', 10, f)
+            threading.Timer(0.05, s.trigger, ['a']).start()
+            threading.Timer(0.1, s.trigger, ['a']).start()
+            self._run(s, 0.6)
+
+        # triggers during the run are merged into one run, which starts right after the previous run
+        self.assertEqual(len(times), 2)
+        self.assertTrue(0.2 <= times[1] - times[0] < 0.3)
+        self.assertEqual(buf, [])
+
+    def test_trigger_debounce(self):
+        times = []
+
+        def f():
+            times.append(time.time())
+
+        with WorkerPool(2) as pool:
+            s = Scheduler(pool, SystemLoggerMock(buffer=[]), jitter=0.0)
+            s.add('a', 10, f, debounce=0.3)
+            for i in range(10):
+                threading.Timer(0.05 + 0.05 * i, s.trigger, ['a']).start()
+            self._run(s, 0.8)
+
+        # the burst of triggers is merged into one run after the debounce window
+        self.assertEqual(len(times), 3)
+        self.assertTrue(0.3 <= times[1] - times[0] < 0.4, times[1] - times[0])
+        self.assertTrue(0.3 <= times[2] - times[1] < 0.4, times[2] - times[1])
+
+    def test_jitter(self):
+        now = [100.0]
+        s = Scheduler(WorkerPool(1), SystemLoggerMock(buffer=[]), jitter=0.5, clock=lambda: now[0], rand=lambda: 0.5)
+        s.add('a', 10, lambda: None)
+        self.assertEqual(s.jobs[0].next_time, 102.5)
+        self.assertEqual(s._time_to_wait(), 1.0)
+
+        now[0] = 103.0
+        s._fire(s.jobs[0], now[0])
+        self.assertEqual(s.jobs[0].base_time, 110.0)
+        self.assertEqual(s.jobs[0].next_time, 112.5)
+
+        # never catch up with the missed ticks
+        now[0] = 200.0
+        s._fire(s.jobs[0], now[0])
+        self.assertEqual(s.jobs[0].base_time, 210.0)
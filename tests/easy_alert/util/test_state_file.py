@@ -0,0 +1,40 @@
+import os
+import sys
+import shutil
+import tempfile
+from easy_alert.util.state_file import load_state_file, save_state_file
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestStateFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_load(self):
+        save_state_file(self.path, '123')
+        save_state_file(self.path, '456')
+        self.assertEqual(os.listdir(self.temp_dir), ['state'])
+        self.assertEqual(load_state_file(self.path, int), 456)
+
+    def test_load_missing(self):
+        self.assertEqual(load_state_file(self.path, int), None)
+        self.assertEqual(load_state_file(self.path, int, {}), {})
+
+    def test_load_broken(self):
+        save_state_file(self.path, 'xxx')
+        self.assertEqual(load_state_file(self.path, int, 0, tolerant=True), 0)
+        with self.assertRaises(ValueError) as cm:
+            load_state_file(self.path, int, description='test file')
+        self.assertEqual(cm.exception.args[0], 'Broken test file: %s' % self.path)
+
+    def test_load_error(self):
+        os.mkdir(self.path)
+        self.assertRaises(IOError, load_state_file, self.path, int)
@@ -0,0 +1,45 @@
+import sys
+from easy_alert.util.tick_cache import TickCache
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestTickCache(unittest.TestCase):
+    def test_init_error(self):
+        self.assertRaises(ValueError, TickCache, len, 0)
+
+    def test_call(self):
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return x * 2
+
+        c = TickCache(f, 2)
+        self.assertEqual(c('a'), 'aa')
+        self.assertEqual(c('a'), 'aa')
+        self.assertEqual(c('b'), 'bb')
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual((c.hits, c.misses), (1, 2))
+        self.assertEqual(len(c), 2)
+
+    def test_tick(self):
+        c = TickCache(lambda x: x, 2)
+        c('a')
+        c('b')
+        c.tick()
+        c('a')
+        c.tick()
+        self.assertTrue('a' in c)
+        self.assertTrue('b' in c)
+
+        # 'b' has not been used for 2 ticks
+        c.tick()
+        self.assertTrue('a' in c)
+        self.assertFalse('b' in c)
+
+        c.tick()
+        self.assertEqual(len(c), 0)
@@ -0,0 +1,139 @@
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+from easy_alert.util.worker_pool import WorkerPool, WorkerTimeout, JobCancelled
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_init_error(self):
+        self.assertRaises(ValueError, WorkerPool, 0)
+
+    def test_submit(self):
+        with WorkerPool(2) as pool:
+            futures = pool.map(lambda x: x * 2, range(10))
+            self.assertEqual([f.get() for f in futures], [x * 2 for x in range(10)])
+
+    def test_submit_concurrently(self):
+        t = datetime.now()
+        with WorkerPool(4) as pool:
+            futures = pool.map(time.sleep, [0.5] * 4)
+            for f in futures:
+                f.get()
+        self.assertTrue(datetime.now() - t < timedelta(seconds=1.5))
+
+    def test_bounded_workers(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def f(x):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+            return x
+
+        with WorkerPool(3) as pool:
+            self.assertEqual([r.get() for r in pool.map(f, range(12))], range(12))
+        self.assertTrue(state['max'] <= 3)
+
+    def test_get_error(self):
+        def f():
+            raise KeyError('xxx')
+
+        with WorkerPool(1) as pool:
+            future = pool.submit(f)
+            with self.assertRaises(KeyError) as cm:
+                future.get()
+            self.assertEqual(cm.exception.args[0], 'xxx')
+            self.assertTrue(future.done())
+
+    def test_get_timeout(self):
+        with WorkerPool(1) as pool:
+            future = pool.submit(time.sleep, 0.5)
+            self.assertRaises(WorkerTimeout, future.get, 0.01)
+            self.assertEqual(future.get(), None)
+
+    def test_add_done_callback(self):
+        done = []
+        with WorkerPool(1) as pool:
+            future = pool.submit(time.sleep, 0.2)
+            future.add_done_callback(lambda f: done.append(f.done()))
+            self.assertEqual(done, [])
+            future.get()
+            time.sleep(0.05)
+            self.assertEqual(done, [True])
+
+            # called right away if the job has finished
+            future.add_done_callback(lambda f: done.append(f.done()))
+            self.assertEqual(done, [True, True])
+
+    def test_shutdown_wait(self):
+        pool = WorkerPool(2)
+        futures = pool.map(time.sleep, [0.2, 0.2, 0.2])
+        pool.shutdown(wait=True)
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(pool._threads, [])
+
+    def test_shutdown_wait_timeout(self):
+        pool = WorkerPool(1)
+        future = pool.submit(time.sleep, 0.5)
+        t = datetime.now()
+        pool.shutdown(wait=True, timeout=0.1)
+        self.assertTrue(datetime.now() - t < timedelta(seconds=0.4))
+        self.assertFalse(future.done())
+
+    def test_shutdown_cancel_pending(self):
+        event = threading.Event()
+        started = []
+
+        def job(x):
+            started.append(x)
+            event.wait(5)
+            return x
+
+        pool = WorkerPool(2)
+        futures = pool.map(job, range(5))
+        time.sleep(0.1)
+        pool.shutdown(cancel_pending=True)
+        event.set()
+
+        self.assertEqual([f.get(5) for f in futures[:2]], [0, 1])
+        for f in futures[2:]:
+            self.assertTrue(f.done())
+            with self.assertRaises(JobCancelled) as cm:
+                f.get()
+            self.assertEqual(cm.exception.args[0], 'Job was cancelled before it started')
+        time.sleep(0.1)
+        self.assertEqual(sorted(started), [0, 1])
+
+    def test_cancel(self):
+        with WorkerPool(1) as pool:
+            running = pool.submit(time.sleep, 0.2)
+            pending = pool.submit(time.sleep, 0.2)
+            time.sleep(0.05)
+            self.assertFalse(running.cancel())
+            self.assertTrue(pending.cancel())
+            self.assertFalse(pending.cancel())
+            self.assertTrue(pending.wait(0))
+            self.assertFalse(running.wait(0))
+            self.assertEqual(running.get(), None)
+            self.assertRaises(JobCancelled, pending.get)
+
+    def test_shutdown_twice(self):
+        pool = WorkerPool(2)
+        futures = pool.map(time.sleep, [0.1, 0.1, 0.1])
+        threads = list(pool._threads)
+        pool.shutdown(cancel_pending=True)
+        pool.shutdown(cancel_pending=True)
+        for t in threads:
+            t.join(1)
+            self.assertFalse(t.is_alive())
+        self.assertRaises(JobCancelled, futures[2].get)
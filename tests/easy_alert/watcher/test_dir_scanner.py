@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+from easy_alert.watcher import dir_scanner
+from easy_alert.watcher.dir_scanner import scan_files
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestDirScanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for name in ['alert.20150801_1234_2.log', 'alert.20150801_1234_1.log', 'alert.20150801_1235.b123.log',
+                     '.alert.20150801_1234_3.log', 'other.log']:
+            with open(os.path.join(self.temp_dir, name), 'w') as f:
+                f.write(name)
+        os.mkdir(os.path.join(self.temp_dir, 'sub'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _paths(self, result):
+        return [[os.path.basename(f.path) for f in r] for r in result]
+
+    def _check_scan(self):
+        patterns = [os.path.join(self.temp_dir, p) for p in ['alert.????????_????_*.log', 'alert.????????_????*']]
+        result = scan_files(patterns)
+        self.assertEqual(self._paths(result), [
+            ['alert.20150801_1234_1.log', 'alert.20150801_1234_2.log'],
+            ['alert.20150801_1234_1.log', 'alert.20150801_1234_2.log', 'alert.20150801_1235.b123.log'],
+        ])
+        self.assertEqual(result[0][0].stat().st_size, len('alert.20150801_1234_1.log'))
+        self.assertTrue(result[0][0] is result[1][0])
+
+        # same as glob
+        self.assertEqual(self._paths(result), self._paths([dir_scanner._glob_files(p) for p in patterns]))
+
+        # removed after the scan
+        os.remove(result[1][2].path)
+        self.assertEqual(result[1][2].stat(), None)
+
+        # hidden files
+        self.assertEqual(self._paths(scan_files([os.path.join(self.temp_dir, '.*.log')])),
+                         [['.alert.20150801_1234_3.log']])
+
+        # not found
+        self.assertEqual(scan_files([os.path.join(self.temp_dir, 'xxx', '*')]), [[]])
+
+    def test_scan(self):
+        self._check_scan()
+
+    def test_scan_different_dirs(self):
+        with open(os.path.join(self.temp_dir, 'sub', 'x.log'), 'w') as f:
+            f.write('x')
+        result = scan_files([os.path.join(self.temp_dir, 'sub', '*.log'), os.path.join(self.temp_dir, 'other.*')])
+        self.assertEqual(self._paths(result), [['x.log'], ['other.log']])
+        self.assertEqual(self._paths(scan_files([os.path.join(self.temp_dir, 's*', '*.log')])), [['x.log']])
+
+    def test_scan_relative(self):
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            result = scan_files(['other.*'])
+            self.assertEqual(self._paths(result), [['other.log']])
+            self.assertEqual(result[0][0].path, 'other.log')
+            self.assertEqual(result[0][0].stat(), os.stat('other.log'))
+        finally:
+            os.chdir(cwd)
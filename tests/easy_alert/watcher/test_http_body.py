@@ -0,0 +1,110 @@
+import sys
+import re
+from StringIO import StringIO
+from easy_alert.watcher.http_body import BodyChecker, BodyTooLarge
+from easy_alert.util import Matcher, apply_option
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class _Reader(StringIO):
+    """Return the body in small chunks"""
+
+    def read(self, n=-1):
+        n = min(n, 10)
+        return StringIO.read(self, n)
+
+
+class TestBodyChecker(unittest.TestCase):
+    def _check(self, data, expect_code=None, expect_size=None, expect_regexp=None, max_body_size=1000, code=200,
+               drain_size=0):
+        checker = BodyChecker(expect_code, apply_option(Matcher, expect_size), apply_option(re.compile, expect_regexp),
+                              max_body_size, overlap=5, drain_size=drain_size)
+        resp = _Reader(data)
+        result, complete = checker(code, resp)
+        self.assertTrue(result is checker)
+        return checker.should_alert(code), checker.get_size_text(), complete
+
+    def test_code(self):
+        # no need to read the body
+        self.assertEqual(self._check('x' * 100, expect_code=200), (False, '>=0', False))
+        self.assertEqual(self._check('x' * 100, expect_code=200, code=500), (True, '>=0', False))
+
+    def test_size(self):
+        data = 'x' * 100
+        self.assertEqual(self._check(data, expect_size='=100'), (False, '100', True))
+        self.assertEqual(self._check(data, expect_size='=50'), (True, '>=60', False))
+        self.assertEqual(self._check(data, expect_size='!=50'), (False, '>=60', False))
+        self.assertEqual(self._check(data, expect_size='<50'), (True, '>=50', False))
+        self.assertEqual(self._check(data, expect_size='<=50'), (True, '>=60', False))
+        self.assertEqual(self._check(data, expect_size='>50'), (False, '>=60', False))
+        self.assertEqual(self._check(data, expect_size='>=50'), (False, '>=50', False))
+        self.assertEqual(self._check(data, expect_size='>=200'), (True, '100', True))
+        self.assertEqual(self._check(data, expect_size='<200'), (False, '100', True))
+
+    def test_regexp(self):
+        data = 'x' * 30 + 'OK' + 'x' * 68
+        self.assertEqual(self._check(data, expect_regexp='OK'), (False, '>=40', False))
+        self.assertEqual(self._check(data, expect_regexp='NG'), (True, '100', True))
+
+        # across the chunks
+        self.assertEqual(self._check('x' * 9 + 'OK' + 'x' * 89, expect_regexp='OK'), (False, '>=20', False))
+
+        # longer than the overlap
+        self.assertEqual(self._check('x' * 5 + 'abcdefghijklmno' + 'x' * 80, expect_regexp='abc[a-z]+o'),
+                         (False, '100', True))
+
+        # anchors
+        self.assertEqual(self._check('x' * 10 + 'OK' + 'x' * 88, expect_regexp='^OK'), (True, '100', True))
+        self.assertEqual(self._check('x' * 8 + 'OK' + 'x' * 90, expect_regexp='OK$'), (True, '100', True))
+        self.assertEqual(self._check('x' * 98 + 'OK', expect_regexp='OK$'), (False, '100', True))
+        self.assertEqual(self._check('x' * 8 + 'OKx', expect_regexp=r'OK\b'), (True, '11', True))
+
+        # chunk ending with a newline
+        self.assertEqual(self._check('x' * 7 + 'OK\n' + 'more text', expect_regexp='OK$'), (True, '19', True))
+        self.assertEqual(self._check('x' * 7 + 'OK\n', expect_regexp='OK$'), (False, '10', True))
+        self.assertEqual(self._check('x' * 7 + 'OK\n' + 'more text', expect_regexp=r'OK\Z'), (True, '19', True))
+
+        # lookahead depending on the next chunk
+        self.assertEqual(self._check('x' * 7 + 'OKERR' + 'x' * 88, expect_regexp='OK(?!ERR)'), (True, '100', True))
+        self.assertEqual(self._check('x' * 7 + 'OKER' + 'x' * 89, expect_regexp='OK(?!ERR)'), (False, '100', True))
+
+    def test_all(self):
+        data = 'x' * 30 + 'OK' + 'x' * 68
+        self.assertEqual(self._check(data, expect_code=200, expect_size='>10', expect_regexp='OK'),
+                         (False, '>=40', False))
+        self.assertEqual(self._check(data, expect_code=200, expect_size='<10', expect_regexp='OK'),
+                         (True, '>=10', False))
+
+    def test_max_body_size(self):
+        data = 'x' * 30 + 'OK' + 'x' * 68
+        self.assertEqual(self._check(data, expect_regexp='OK', max_body_size=35), (False, '>=36', False))
+        self.assertEqual(self._check(data, expect_size='>20', max_body_size=25), (False, '>=26', False))
+        with self.assertRaises(BodyTooLarge) as cm:
+            self._check(data, expect_regexp='OK', max_body_size=20)
+        self.assertEqual(cm.exception.args[0], 'Response body exceeds max_body_size: 20 bytes')
+        with self.assertRaises(BodyTooLarge):
+            self._check(data, expect_size='=100', max_body_size=99)
+        self.assertEqual(self._check(data, expect_size='=100', max_body_size=100), (False, '100', True))
+
+    def test_drain(self):
+        data = 'x' * 30 + 'OK' + 'x' * 68
+        self.assertEqual(self._check(data, expect_code=200, drain_size=100), (False, '100', True))
+        self.assertEqual(self._check(data, expect_code=200, code=500, drain_size=100), (True, '100', True))
+        self.assertEqual(self._check(data, expect_regexp='OK', drain_size=60), (False, '100', True))
+        self.assertEqual(self._check(data, expect_regexp='NG', expect_size='<10', drain_size=100),
+                         (True, '100', True))
+
+        # too large to drain
+        self.assertEqual(self._check(data, expect_code=200, drain_size=99), (False, '>=100', False))
+        self.assertEqual(self._check(data, expect_regexp='OK', drain_size=50), (False, '>=91', False))
+
+        # Content-Length left to read
+        checker = BodyChecker(200, None, None, 1000, drain_size=50)
+        resp = _Reader(data)
+        resp.length = 100
+        self.assertEqual(checker(200, resp), (checker, False))
+        self.assertEqual(checker.size, 0)
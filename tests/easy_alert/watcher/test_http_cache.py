@@ -0,0 +1,51 @@
+import os
+import sys
+import shutil
+import tempfile
+from easy_alert.watcher.http_cache import ValidatorCache
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestValidatorCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_save(self):
+        c = ValidatorCache(self.path).load()
+        self.assertEqual(c.entries, {})
+
+        c.update('http://a', 'x', '"v1"', None, 200, {'size': 1})
+        c.update('http://b', 'x', None, 'Wed, 21 Oct 2015 07:28:00 GMT', 200, {'size': 2})
+        c.update('http://c', 'x', None, None, 200, {'size': 3})  # no validators
+        c.save()
+
+        c = ValidatorCache(self.path).load()
+        self.assertEqual(sorted(c.entries.keys()), ['http://a', 'http://b'])
+        self.assertEqual(c.get('http://a', 'x'), {
+            'expect': 'x', 'etag': '"v1"', 'last_modified': None, 'code': 200, 'body': {'size': 1}})
+        self.assertEqual(c.get('http://a', 'y'), None)
+        self.assertEqual(c.get('http://c', 'x'), None)
+        self.assertEqual(os.listdir(self.temp_dir), ['cache.json'])
+
+        c.retain(['http://b'])
+        self.assertEqual(c.entries.keys(), ['http://b'])
+
+    def test_load_broken(self):
+        with open(self.path, 'w') as f:
+            f.write('xxx')
+        self.assertEqual(ValidatorCache(self.path).load().entries, {})
+
+    def test_get_request_headers(self):
+        self.assertEqual(ValidatorCache.get_request_headers(None), {})
+        self.assertEqual(ValidatorCache.get_request_headers({'etag': '"v1"', 'last_modified': 'xxx'}),
+                         {'If-None-Match': '"v1"', 'If-Modified-Since': 'xxx'})
+        self.assertEqual(ValidatorCache.get_request_headers({'etag': None, 'last_modified': 'xxx'}),
+                         {'If-Modified-Since': 'xxx'})
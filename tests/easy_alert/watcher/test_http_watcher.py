@@ -1,10 +1,20 @@
+import os
 import sys
+import time
+import json
+import shutil
+import tempfile
+import threading
 import logging
 import re
+import urllib2
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 from easy_alert.setting.setting_error import SettingError
 from easy_alert.watcher.http_watcher import HTTPWatcher
+from easy_alert.watcher.http_body import BodyTooLarge
 from easy_alert.entity.level import Level
-from easy_alert.util import Matcher
+from easy_alert.util import Matcher, RetryPolicy
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -27,7 +37,7 @@ class TestHTTPWatcher(unittest.TestCase):
         assert_err([{'name': 'name', 'level': 'error'}], "HTTPWatcher not found config key: 'url'")
         assert_err([{'name': 'name', 'level': 'xxx', 'url': 'localhost'}], "HTTPWatcher invalid level: xxx")
         assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost'}],
-                   "HTTPWatcher any of expect_code, expect_size or expect_regexp should be set.")
+                   "HTTPWatcher any of expect_code, expect_size, expect_regexp or expect_latency should be set.")
         assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost', 'timeout': 'a'}],
                    "HTTPWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
         assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost', 'retry': 'a'}],
@@ -42,6 +52,18 @@ class TestHTTPWatcher(unittest.TestCase):
                    "HTTPWatcher settings syntax error: unexpected end of regular expression")
         assert_err([{'name': 'name', 'level': 'error', 'url': 'xxx://localhost', 'expect_code': 200}],
                    "HTTPWatcher unsupported scheme: xxx")
+        assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost', 'max_body_size': 'a'}],
+                   "HTTPWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost', 'expect_latency': 'a'}],
+                   "HTTPWatcher settings syntax error: Invalid matcher string: a")
+        assert_err([{'name': 'name', 'level': 'error', 'url': 'localhost', 'retry': {'count': 2, 'xxx': 1}}],
+                   "HTTPWatcher settings syntax error: Unknown retry key: xxx")
+        assert_err({'targets': 'xxx'}, 'HTTPWatcher settings not a list: xxx')
+        assert_err({'targets': [], 'concurrency': 'a'},
+                   "HTTPWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'targets': [], 'deadline': 'a'},
+                   "HTTPWatcher settings syntax error: could not convert string to float: a")
+        assert_err({'targets': [], 'concurrency': 0}, 'HTTPWatcher concurrency should be positive: 0')
 
     def test_init_normal(self):
         s = [
@@ -54,14 +76,301 @@ class TestHTTPWatcher(unittest.TestCase):
             {'name': 'n6', 'level': 'warn', 'url': 'localhost', 'expect_code': 0},
             {'name': 'n7', 'level': 'warn', 'url': 'localhost', 'expect_size': '=0'},
             {'name': 'n8', 'level': 'warn', 'url': 'localhost', 'expect_regexp': ''},
+            {'name': 'n9', 'level': 'warn', 'url': 'localhost', 'expect_latency': '< 500',
+             'retry': {'count': 3, 'backoff': 0.5, 'jitter': False, 'deadline': 20}},
         ]
+        r2 = RetryPolicy(2)
         self.assertEqual(HTTPWatcher(s).settings, [
-            ('n1', Level(logging.DEBUG), 'example.com', 10, 2, '', 200, None, None),
-            ('n2', Level(logging.DEBUG), 'http://example.com', 10, 2, '', 200, None, None),
-            ('n3', Level(logging.DEBUG), 'https://example.com', 10, 2, '', 200, None, None),
-            ('n4', Level(logging.DEBUG), 'HTTP://EXAMPLE.COM', 10, 2, '', 200, None, None),
-            ('n5', Level(logging.CRITICAL), 'localhost', 60, 5, 'abc', 200, Matcher('>=100'), re.compile('.*')),
-            ('n6', Level(logging.WARN), 'localhost', 10, 2, '', 0, None, None),
-            ('n7', Level(logging.WARN), 'localhost', 10, 2, '', None, Matcher('=0'), None),
-            ('n8', Level(logging.WARN), 'localhost', 10, 2, '', None, None, re.compile('')),
+            ('n1', Level(logging.DEBUG), 'example.com', 10, r2, '', 200, None, None, 10485760, None),
+            ('n2', Level(logging.DEBUG), 'http://example.com', 10, r2, '', 200, None, None, 10485760, None),
+            ('n3', Level(logging.DEBUG), 'https://example.com', 10, r2, '', 200, None, None, 10485760, None),
+            ('n4', Level(logging.DEBUG), 'HTTP://EXAMPLE.COM', 10, r2, '', 200, None, None, 10485760, None),
+            ('n5', Level(logging.CRITICAL), 'localhost', 60, RetryPolicy(5), 'abc', 200, Matcher('>=100'),
+             re.compile('.*'), 10485760, None),
+            ('n6', Level(logging.WARN), 'localhost', 10, r2, '', 0, None, None, 10485760, None),
+            ('n7', Level(logging.WARN), 'localhost', 10, r2, '', None, Matcher('=0'), None, 10485760, None),
+            ('n8', Level(logging.WARN), 'localhost', 10, r2, '', None, None, re.compile(''), 10485760, None),
+            ('n9', Level(logging.WARN), 'localhost', 10, RetryPolicy(3, backoff=0.5, jitter=False, deadline=20), '',
+             None, None, None, 10485760, Matcher('<500')),
         ])
+
+    def test_init_dict(self):
+        s = [{'name': 'n1', 'level': 'debug', 'url': 'example.com', 'expect_code': 200}]
+        w = HTTPWatcher({'targets': s, 'concurrency': 3, 'deadline': 5})
+        self.assertEqual(w.settings, [
+            ('n1', Level(logging.DEBUG), 'example.com', 10, RetryPolicy(2), '', 200, None, None, 10485760, None)
+        ])
+        self.assertEqual((w.concurrency, w.deadline, w.cache), (3, 5.0, None))
+
+        w = HTTPWatcher({'targets': s, 'cache': '/path/to/cache.json'})
+        self.assertEqual(w.cache.path, '/path/to/cache.json')
+
+        w = HTTPWatcher({'targets': s})
+        self.assertEqual((w.concurrency, w.deadline), (10, 50.0))
+        self.assertEqual(HTTPWatcher(s), w)
+
+    def test_watch(self):
+        responses = {
+            'http://a': (0.3, 200, 'ok'),
+            'http://b': (0.0, 500, 'ng'),
+            'http://c': (0.1, None, None),
+            'http://d': (0.0, 200, 'ok'),
+        }
+
+        def connect_url(url, timeout, consumer, timing, headers):
+            delay, code, data = responses[url]
+            time.sleep(delay)
+            if code is None:
+                raise IOError('connection refused')
+            return code, consumer(code, StringIO(data))[0]
+
+        w = HTTPWatcher({'targets': [
+            {'name': 'n%d' % i, 'level': 'error', 'url': 'http://%s' % x, 'retry': 0, 'expect_code': 200}
+            for i, x in enumerate('abcd')
+        ], 'concurrency': 4})
+        w._connect_url = connect_url
+
+        t = time.time()
+        alerts = w.watch()
+        self.assertLess(time.time() - t, 0.35)
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0].level, Level(logging.ERROR))
+
+        # in the order of the configuration
+        message = alerts[0].message
+        self.assertTrue(0 <= message.find('http://b') < message.find('http://c'))
+        self.assertTrue('IOError: connection refused' in message)
+        self.assertFalse('http://a' in message)
+        self.assertFalse('http://d' in message)
+
+    def test_watch_deadline(self):
+        def connect_url(url, timeout, consumer, timing, headers):
+            time.sleep(1.0 if url == 'http://slow' else 0.0)
+            return 200, consumer(200, StringIO(''))[0]
+
+        w = HTTPWatcher({'targets': [
+            {'name': 'n1', 'level': 'warn', 'url': 'http://slow', 'retry': 0, 'expect_code': 200},
+            {'name': 'n2', 'level': 'error', 'url': 'http://fast', 'retry': 0, 'expect_code': 404},
+        ], 'deadline': 0.2})
+        w._connect_url = connect_url
+
+        t = time.time()
+        alerts = w.watch()
+        self.assertLess(time.time() - t, 0.5)
+        self.assertEqual(alerts[0].level, Level(logging.ERROR))
+        message = alerts[0].message
+        self.assertTrue(0 <= message.find('http://slow') < message.find('http://fast'))
+        self.assertTrue('WorkerTimeout: Job did not finish in' in message)
+
+    def test_watch_deadline_pending(self):
+        lock = threading.Lock()
+        started = []
+
+        def connect_url(url, timeout, consumer, timing, headers):
+            with lock:
+                started.append(url)
+            time.sleep(0.2)
+            return 200, consumer(200, StringIO(''))[0]
+
+        w = HTTPWatcher({'targets': [
+            {'name': 'n%d' % i, 'level': 'error', 'url': 'http://h%d' % i, 'retry': 0, 'expect_code': 200}
+            for i in range(20)
+        ], 'concurrency': 2, 'deadline': 0.3})
+        w._connect_url = connect_url
+
+        alerts = w.watch()
+        n = len(started)
+        self.assertTrue(2 <= n <= 6, n)
+
+        # the pending urls are not fetched after the deadline
+        time.sleep(0.5)
+        self.assertEqual(len(started), n)
+
+        message = alerts[0].message
+        self.assertTrue(message.count('Not checked before the deadline (0.3 sec)') >= 14, message)
+        self.assertTrue('http://h19' in message)
+
+    def test_watch_body(self):
+        def connect_url(url, timeout, consumer, timing, headers):
+            return 200, consumer(200, StringIO('x' * 100 + 'OK' + 'x' * 100))[0]
+
+        def check(expect_size, expect_regexp, max_body_size=10485760):
+            s = {'name': 'n1', 'level': 'error', 'url': 'http://a', 'retry': 0, 'expect_code': 200}
+            if expect_size is not None:
+                s['expect_size'] = expect_size
+            if expect_regexp is not None:
+                s['expect_regexp'] = expect_regexp
+            s['max_body_size'] = max_body_size
+            w = HTTPWatcher([s])
+            w._connect_url = connect_url
+            alerts = w.watch()
+            return alerts[0].message if alerts else None
+
+        self.assertEqual(check('=202', 'OK'), None)
+        # the small body is read to the end after the check is decided
+        self.assertTrue('size:202}' in check('=201', 'OK'))
+        self.assertTrue('size:202}' in check('<=100', None))
+        self.assertTrue('size:202}' in check(None, 'NG'))
+        self.assertEqual(check(None, 'OK', 150), None)
+        self.assertTrue('BodyTooLarge: Response body exceeds max_body_size: 50 bytes' in check(None, 'OK', 50))
+
+    def test_watch_keep_alive(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write('ok')
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/' % server.server_port
+            for expect in [{'expect_code': 200}, {'expect_regexp': 'o'}, {'expect_size': '>0'}]:
+                s = {'name': 'n1', 'level': 'error', 'url': url, 'retry': 0}
+                s.update(expect)
+                w = HTTPWatcher([s])
+                for i in range(5):
+                    self.assertEqual(w.watch(), [])
+                self.assertEqual(w.connection_pool.stats, {'created': 1, 'reused': 4})
+                w.connection_pool.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_watch_latency(self):
+        def connect_url(url, timeout, consumer, timing, headers):
+            timing.dns, timing.connect, timing.tls, timing.ttfb, timing.total = 0.0015, 0.002, 0.01, 0.4, 0.6
+            return 200, consumer(200, StringIO('ok'))[0]
+
+        def check(expect_latency):
+            w = HTTPWatcher([
+                {'name': 'n1', 'level': 'warn', 'url': 'http://a', 'retry': 0, 'expect_latency': expect_latency}
+            ])
+            w._connect_url = connect_url
+            alerts = w.watch()
+            return alerts[0].message if alerts else None
+
+        self.assertEqual(check('< 1000'), None)
+        message = check('< 500')
+        self.assertTrue('timing : {dns:2ms, connect:2ms, tls:10ms, ttfb:400ms, total:600ms}' in message)
+        self.assertTrue('expect : {code:None, size:None, regexp:None, latency:"< 500"}' in message)
+
+    def test_is_retryable(self):
+        def http_error(code):
+            return urllib2.HTTPError('http://a', code, 'reason', {}, None)
+
+        self.assertTrue(HTTPWatcher._is_retryable(http_error(500)))
+        self.assertTrue(HTTPWatcher._is_retryable(http_error(503)))
+        self.assertTrue(HTTPWatcher._is_retryable(http_error(408)))
+        self.assertTrue(HTTPWatcher._is_retryable(http_error(429)))
+        self.assertFalse(HTTPWatcher._is_retryable(http_error(404)))
+        self.assertTrue(HTTPWatcher._is_retryable(IOError('connection refused')))
+        self.assertFalse(HTTPWatcher._is_retryable(BodyTooLarge('too large')))
+
+    def test_watch_retry_deadline(self):
+        attempts = []
+
+        def connect_url(url, timeout, consumer, timing, headers):
+            attempts.append(url)
+            raise IOError('connection refused')
+
+        w = HTTPWatcher({'targets': [
+            {'name': 'n1', 'level': 'error', 'url': 'http://a', 'expect_code': 200,
+             'retry': {'count': 10, 'backoff': 0.1, 'jitter': False}},
+        ], 'deadline': 0.5})
+        w._connect_url = connect_url
+
+        t = time.time()
+        alerts = w.watch()
+        self.assertLess(time.time() - t, 0.5)
+        self.assertTrue('IOError: connection refused' in alerts[0].message)
+
+        # waits 0.1, 0.2, then 0.4 exceeds the deadline
+        self.assertEqual(len(attempts), 3)
+
+
+class _ETagHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPWatcherCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, 'cache.json')
+        self.server = HTTPServer(('127.0.0.1', 0), _ETagHandler)
+        self.server.requests = []
+        self.server.etag = '"v1"'
+        self.server.body = 'x' * 1000 + 'OK'
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def _watch(self, expect_regexp='OK'):
+        w = HTTPWatcher({'targets': [
+            {'name': 'n1', 'level': 'error', 'url': self.url, 'retry': 0, 'expect_regexp': expect_regexp},
+        ], 'cache': self.cache_path})
+        alerts = w.watch()
+        w.after_success()
+        return alerts
+
+    def test_watch_cache(self):
+        self.assertEqual(self._watch(), [])
+        with open(self.cache_path) as f:
+            entry = json.load(f)['entries'][self.url]
+        self.assertEqual(entry['etag'], '"v1"')
+        self.assertEqual(entry['body'], {'size': 1002, 'complete': True, 'matched': True})
+
+        # not modified
+        self.assertEqual(self._watch(), [])
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+
+        # the expectation has changed
+        self.assertEqual(len(self._watch('NG')), 1)
+        self.assertEqual(self.server.requests[-1], None)
+
+        # the result is reused also for the alert
+        alerts = self._watch('NG')
+        self.assertEqual(len(alerts), 1)
+        self.assertTrue('size:1002}' in alerts[0].message)
+        self.assertEqual(self.server.requests[-1], '"v1"')
+
+        # modified
+        self.assertEqual(self._watch(), [])
+        self.server.etag = '"v2"'
+        self.server.body = 'changed'
+        alerts = self._watch()
+        self.assertEqual(len(alerts), 1)
+        self.assertTrue('size:7}' in alerts[0].message)
+        self.assertEqual(self.server.requests[-1], '"v1"')
+        self.assertEqual(len(self._watch()), 1)
+        self.assertEqual(self.server.requests[-1], '"v2"')
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+from easy_alert.watcher.inventory_cache import InventoryCache
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestInventoryCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'inventory.json')
+        self.now = [1000.0]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _cache(self):
+        return InventoryCache(self.path, 300, 3600, clock=lambda: self.now[0])
+
+    def test_load_save(self):
+        c = self._cache().load()
+        self.assertEqual(c.entries, {})
+        self.assertFalse(c.dirty)
+
+        c.update('cmd1', [('10.0.0.1', 'web-1'), ('10.0.0.2', 'web-2')])
+        c.update('cmd2', [])
+        self.assertTrue(c.dirty)
+        c.save()
+        self.assertFalse(c.dirty)
+        self.assertEqual(os.listdir(self.temp_dir), ['inventory.json'])
+
+        c = self._cache().load()
+        self.assertEqual(c.get('cmd1', 300), [('10.0.0.1', 'web-1'), ('10.0.0.2', 'web-2')])
+        self.assertEqual(c.get('cmd2', 300), [])
+        self.assertEqual(c.get('cmd3', 300), None)
+
+        c.retain(['cmd2'])
+        self.assertEqual(c.entries.keys(), ['cmd2'])
+        self.assertTrue(c.dirty)
+
+    def test_save_not_dirty(self):
+        self._cache().load().save()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_get_expired(self):
+        c = self._cache().load()
+        c.update('cmd', [('h', 'n')])
+
+        self.assertEqual(c.get_time('cmd'), 1000.0)
+        self.assertEqual(c.get_time('xxx'), None)
+
+        self.now[0] += 299
+        self.assertEqual(c.get('cmd', c.ttl), [('h', 'n')])
+        self.now[0] += 1
+        self.assertEqual(c.get('cmd', c.ttl), None)
+        self.assertEqual(c.get('cmd', c.max_stale), [('h', 'n')])
+        self.now[0] += 3300
+        self.assertEqual(c.get('cmd', c.max_stale), None)
+
+    def test_load_broken(self):
+        with open(self.path, 'w') as f:
+            f.write('xxx')
+        self.assertEqual(self._cache().load().entries, {})
+
+        with open(self.path, 'w') as f:
+            f.write('{"entries": {"cmd": {"time": 1000}}}')
+        self.assertEqual(self._cache().load().get('cmd', 300), None)
@@ -0,0 +1,73 @@
+import os
+import sys
+import shutil
+import tempfile
+from easy_alert.watcher.log_checkpoint import Checkpoint
+from easy_alert.watcher.log_parser import LogSummary
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'checkpoint.json')
+        self.target = os.path.join(self.temp_dir, 'alert.log')
+        with open(self.target, 'w') as f:
+            f.write('2015-08-01T12:34:56.789\tmonitor.syslog.warn\t{"message":"Alert message."}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_save(self):
+        st = os.stat(self.target)
+        summary = LogSummary(15, 1024)
+        summary.add('monitor.syslog.warn', '{"message":"Alert message."}')
+
+        c = Checkpoint(self.path).load()
+        self.assertEqual(c.files, {})
+        self.assertEqual(c.get(self.target, st), None)
+
+        c.update(self.target, st, 10, summary)
+        c.save()
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['alert.log', 'checkpoint.json'])
+
+        entry = Checkpoint(self.path).load().get(self.target, st)
+        self.assertEqual(entry['offset'], 10)
+        self.assertEqual(entry['notified'], False)
+        self.assertEqual(LogSummary.from_dict(entry['summary'], 15, 1024).tags, summary.tags)
+
+        c.set_notified(self.target)
+        c.save()
+        entry = Checkpoint(self.path).load().get(self.target, st)
+        self.assertEqual(entry['notified'], True)
+
+        # nothing to record
+        c.remove(self.target)
+        c.save()
+        self.assertEqual(os.listdir(self.temp_dir), ['alert.log'])
+
+    def test_get_changed(self):
+        c = Checkpoint(self.path)
+        c.update(self.target, os.stat(self.target), 10, LogSummary(15, 1024))
+        with open(self.target, 'a') as f:
+            f.write('x')
+        self.assertEqual(c.get(self.target, os.stat(self.target)), None)
+
+    def test_retain(self):
+        c = Checkpoint(self.path)
+        st = os.stat(self.target)
+        c.update('a', st, 0, LogSummary(15, 1024))
+        c.update('b', st, 0, LogSummary(15, 1024))
+        c.retain(['b', 'c'])
+        self.assertEqual(list(c.files.keys()), ['b'])
+
+    def test_load_error(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        with self.assertRaises(ValueError) as cm:
+            Checkpoint(self.path).load()
+        self.assertEqual(cm.exception.args[0], 'Broken checkpoint file: %s' % self.path)
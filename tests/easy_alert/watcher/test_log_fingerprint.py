@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import sys
+from easy_alert.watcher.log_fingerprint import fingerprint, TemplateCounter
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(u''), u'')
+        self.assertEqual(fingerprint(u'Alert message.'), u'Alert message.')
+        self.assertEqual(fingerprint(u'Alert message 123.'), u'Alert message <NUM>.')
+        self.assertEqual(fingerprint(u'Timeout after 30s: retry=2'), u'Timeout after <NUM>s: retry=<NUM>')
+        self.assertEqual(fingerprint(u'req 123e4567-e89b-12d3-a456-426614174000 failed'), u'req <UUID> failed')
+        self.assertEqual(fingerprint(u'addr=0x7ffd1234 id=deadbeef01 sha=5d41402abc4b2a76b9719d911017c592'),
+                         u'addr=<HEX> id=<HEX> sha=<HEX>')
+        self.assertEqual(fingerprint(u'deadbeefcafe and abc1'), u'deadbeefcafe and abc<NUM>')
+        self.assertEqual(fingerprint(u'エラー 1件'), u'エラー <NUM>件')
+
+
+class TestTemplateCounter(unittest.TestCase):
+    def test_add(self):
+        c = TemplateCounter(3, 2, rand=lambda: 0.0)
+        for t in ['a', 'b', 'a', 'c', 'd', 'a', 'e', 'b', 'f']:
+            c.add(t)
+        self.assertEqual(c.top(10), [('a', 3), ('b', 2), ('c', 1)])
+        self.assertEqual(c.top(2), [('a', 3), ('b', 2)])
+        self.assertEqual(c.other_count, 3)
+        self.assertEqual(c.samples, ['f', 'e'])
+
+    def test_add_bounded(self):
+        c = TemplateCounter(100, 10)
+        for i in range(100000):
+            c.add('template %d' % (i % 5000))
+        self.assertEqual(len(c.counts), 100)
+        self.assertEqual(len(c.samples), 10)
+        self.assertEqual(sum(n for n, _ in c.counts.values()) + c.other_count, 100000)
+
+    def test_top_order(self):
+        c = TemplateCounter(10, 10)
+        for t in ['x', 'y', 'z', 'z', 'y']:
+            c.add(t)
+        self.assertEqual(c.top(10), [('y', 2), ('z', 2), ('x', 1)])
+
+    def test_merge(self):
+        c1 = TemplateCounter(3, 2, rand=lambda: 0.99)
+        c2 = TemplateCounter(3, 2, rand=lambda: 0.99)
+        for t in ['a', 'b', 'a']:
+            c1.add(t)
+        for t in ['c', 'd', 'a', 'e', 'f', 'g']:
+            c2.add(t)
+        c1.merge(c2)
+        self.assertEqual(c1.top(10), [('a', 3), ('b', 1), ('c', 1)])
+        self.assertEqual(c1.other_count, 4)
+        self.assertEqual(c1.samples, ['d', 'e'])
+
+    def test_add_weighted(self):
+        c = TemplateCounter(1, 2, rand=lambda: 0.5)
+        c.add('a')
+        c.add('b', 3)
+        c.add('c', 5000000)
+        self.assertEqual(c.other_count, 5000003)
+        self.assertEqual(c.samples, ['b', 'c'])
+
+        # replaced with probability min(1, sample_size * count / other_count)
+        c.add('d', 10)
+        self.assertEqual(c.samples, ['b', 'c'])
+        c.add('e', 5000000)
+        self.assertEqual(c.samples, ['e', 'c'])
+
+    def test_merge_large_count(self):
+        c1 = TemplateCounter(1, 2)
+        c2 = TemplateCounter(2, 2)
+        c1.add('a')
+        c2.add('b', 5000000)
+        c2.add('c', 5000000)
+        c1.merge(c2)
+        self.assertEqual(c1.other_count, 10000000)
+        self.assertEqual(sorted(c1.samples), ['b', 'c'])
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import gzip
+import json
+import tempfile
+import logging
+from easy_alert.watcher import log_parser
+from easy_alert.watcher.log_parser import LogFormatError, LogSummary, parse_lines, parse_file, count_chunk
+from easy_alert.entity.level import Level
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def parse_reference(lines, message_num_threshold, message_len_threshold):
+    """Straightforward implementation which decodes every line"""
+    d = {}
+    max_level = Level(logging.WARN)
+    for line in lines:
+        tokens = line.split('\t')
+        tag = tokens[1]
+        msg = json.loads(tokens[2].decode('utf-8', 'ignore'))['message']
+        cnt, msgs = d.get(tag, (0, []))
+        cnt += 1
+        msgs += [msg[:message_len_threshold]] if cnt <= message_num_threshold else []
+        d[tag] = (cnt, msgs)
+        max_level = max(max_level, Level(tag.split('.')[-1]))
+    return dict((k, list(v)) for k, v in d.items()), max_level
+
+
+class TestLogSummary(unittest.TestCase):
+    def test_add(self):
+        s = LogSummary(2, 5)
+        s.add('monitor.syslog.warn', '{"message":"Alert message 1."}')
+        s.add('monitor.syslog.warn', 'xxx\t{"message":"Alert message 2."}', 4)
+        s.add('monitor.syslog.error', u'{"message":"あいうえおか"}'.encode('utf-8'))
+        self.assertEqual(s.tags, {
+            'monitor.syslog.warn': [2, [u'Alert', u'Alert']],
+            'monitor.syslog.error': [1, [u'あいうえお']],
+        })
+        self.assertEqual(s.max_level, Level(logging.ERROR))
+
+    def test_add_over_threshold(self):
+        s = LogSummary(1, 1024)
+        s.add('monitor.syslog.warn', '{"message":"Alert message 1."}')
+
+        # not decoded any more
+        s.add('monitor.syslog.warn', '[')
+        s.add('monitor.syslog.warn', '{}')
+        self.assertEqual(s.tags, {'monitor.syslog.warn': [3, [u'Alert message 1.']]})
+
+    def test_merge(self):
+        lines = []
+        for i in range(300):
+            level = ['warn', 'error', 'critical'][i % 3 if i < 200 else 0]
+            lines.append('2015-08-01T12:34:56.789\tmonitor.app%d.%s\t{"message":"Alert message %d."}\n'
+                         % (i % 2, level, i))
+
+        for nt, lt in [(15, 1024), (1, 10), (1000, 30)]:
+            for n in [1, 7, 100, 300]:
+                s = LogSummary(nt, lt)
+                for i in range(0, len(lines), n):
+                    partial = LogSummary(nt, lt)
+                    parse_lines('path', lines[i:i + n], partial)
+                    s.merge(partial)
+                self.assertEqual((s.tags, s.max_level), parse_reference(lines, nt, lt))
+
+                # the merged summary keeps working
+                s.add('monitor.app9.warn', '{"message":"x"}')
+                self.assertEqual(s.tags['monitor.app9.warn'], [1, [u'x']])
+
+    def test_add_fingerprint(self):
+        s = LogSummary(2, 15, 3)
+        for i in range(5):
+            s.add('monitor.app.warn', '{"message":"Request %d timed out after %ds."}' % (i, i * 10))
+        s.add_message('monitor.app.warn', 'Disk full: /dev/sda1')
+        s.add_message('monitor.app.error', 'Disk full: /dev/sdb1')
+        self.assertEqual(s.tags, {'monitor.app.warn': [6, []], 'monitor.app.error': [1, []]})
+        self.assertEqual(s.full_tags, {})
+        self.assertEqual(s.templates['monitor.app.warn'].top(10),
+                         [(u'Request <NUM> timed', 5), (u'Disk full: /dev', 1)])
+        self.assertEqual(s.templates['monitor.app.error'].top(10), [(u'Disk full: /dev', 1)])
+        self.assertEqual(s.max_level, Level(logging.ERROR))
+
+    def test_merge_fingerprint(self):
+        s1 = LogSummary(2, 1024, 10)
+        s2 = LogSummary(2, 1024, 10)
+        s1.add_message('monitor.app.warn', 'message 1')
+        s2.add_message('monitor.app.warn', 'message 2')
+        s2.add_message('monitor.app.warn', 'other')
+        s2.add_message('monitor.app.error', 'message 3')
+        s1.merge(s2)
+        self.assertEqual(s1.tags, {'monitor.app.warn': [3, []], 'monitor.app.error': [1, []]})
+        self.assertEqual(s1.templates['monitor.app.warn'].top(10), [(u'message <NUM>', 2), (u'other', 1)])
+        self.assertEqual(s1.templates['monitor.app.error'].top(10), [(u'message <NUM>', 1)])
+
+    def test_to_dict(self):
+        for mt in [0, 2]:
+            s = LogSummary(2, 1024, mt)
+            for i in range(5):
+                s.add_message('monitor.app%d.warn' % (i % 2), 'message %d' % i)
+            s.add_message('monitor.app.error', 'other')
+
+            d = json.loads(json.dumps(s.to_dict()))
+            t = LogSummary.from_dict(d, 2, 1024, mt)
+            self.assertEqual(t.tags, s.tags)
+            self.assertEqual(t.max_level, Level(logging.ERROR))
+            self.assertEqual(sorted(t.full_tags.keys()), sorted(s.full_tags.keys()))
+            self.assertEqual(dict((k, v.top(10)) for k, v in t.templates.items()),
+                             dict((k, v.top(10)) for k, v in s.templates.items()))
+
+            # keep working after restored
+            t.add_message('monitor.app0.warn', 'message 9')
+            self.assertEqual(t.tags['monitor.app0.warn'][0], 4)
+
+    def test_add_error(self):
+        s = LogSummary(1, 1024)
+        self.assertRaises(KeyError, s.add, 'monitor.syslog.war', '{"message":"x"}')
+        self.assertRaises(KeyError, s.add, 'monitor.syslog.warn', '{}')
+        self.assertRaises(ValueError, s.add, 'monitor.syslog.warn', '[')
+        self.assertEqual(s.tags, {})
+
+
+class TestParseLines(unittest.TestCase):
+    def test_parse_lines(self):
+        lines = []
+        for i in range(1000):
+            level = ['warn', 'error', 'critical', 'info'][i % 4 if i < 900 else 0]
+            lines.append('2015-08-01T12:34:56.789\tmonitor.app%d.%s\t{"message":"Alert message %d. %s"}\n'
+                         % (i % 3, level, i, 'x' * (i % 50)))
+
+        for nt, lt in [(15, 1024), (1, 10), (1000, 30)]:
+            s = LogSummary(nt, lt)
+            parse_lines('path', lines, s)
+            self.assertEqual((s.tags, s.max_level), parse_reference(lines, nt, lt))
+
+    def test_parse_lines_error(self):
+        def assert_err(line, expected):
+            with self.assertRaises(LogFormatError) as cm:
+                parse_lines('path', [line], LogSummary(15, 1024))
+            self.assertEqual(cm.exception.args[0], expected)
+
+        assert_err('a', 'LogWatcher parse error: file=path, line=a')
+        assert_err('a\tb', 'LogWatcher parse error: file=path, line=a\tb')
+        assert_err('a\tb\tc\td', 'LogWatcher parse error: file=path, line=a\tb\tc\td')
+        assert_err('a\tb.warn\t{}', "LogWatcher parse error: KeyError: 'message': file=path, line=a\tb.warn\t{}")
+
+
+class TestCountChunk(unittest.TestCase):
+    def _summary(self):
+        s = LogSummary(1, 1024)
+        s.add('mon.a.error', '{"message":"x"}')
+        s.add('mon.b.warn', '{"message":"x"}')
+        return s
+
+    def test_count_chunk(self):
+        s = self._summary()
+        self.assertTrue(count_chunk('a\tmon.a.error\t{}\n' * 3 + 'a\tmon.b.warn\t{}\n', s))
+        self.assertTrue(count_chunk('a\tmon.a.error\t{}', s))
+        self.assertEqual(s.tags, {'mon.a.error': [5, [u'x']], 'mon.b.warn': [2, [u'x']]})
+
+    def test_count_chunk_not_counted(self):
+        s = self._summary()
+        for chunk in [
+            'a\tmon.a.error\t{}\n' + 'a\tmon.c.warn\t{}\n',  # tag not counted yet
+            'a\tmon.a.error\t\tmon.a.error\tb\n' + 'no tabs here\n',  # same number of tabs and tags in total
+            'a\tmon.a.error\t{}\tmon.a.error\t\n' + '\n',
+            'a\tmon.a.error\t{}\n' + 'a\tmon.a.error',
+            '',
+        ]:
+            self.assertFalse(count_chunk(chunk, s), chunk)
+        self.assertEqual(s.tags, {'mon.a.error': [1, [u'x']], 'mon.b.warn': [1, [u'x']]})
+        self.assertFalse(count_chunk('a\tmon.a.error\t{}\n', LogSummary(1, 1024)))
+
+
+class TestParseFile(unittest.TestCase):
+    suffix = ''
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=self.suffix)
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _write(self, lines):
+        with open(self.path, 'wb') as f:
+            f.write(''.join(lines))
+
+    def test_parse_file(self):
+        lines = []
+        for i in range(1000):
+            level = ['warn', 'error', 'critical', 'info'][i % 4 if i < 900 else 0]
+            lines.append('2015-08-01T12:34:56.789\tmonitor.app%d.%s\t{"message":"Alert message %d. %s"}\n'
+                         % (i % 3, level, i, 'x' * (i % 50)))
+        self._write(lines)
+
+        for nt, lt in [(15, 1024), (1, 10), (1000, 30)]:
+            for chunk_size in [1, 100, 4096, 1024 * 1024]:
+                s = LogSummary(nt, lt)
+                parse_file(self.path, s, chunk_size)
+                self.assertEqual((s.tags, s.max_level), parse_reference(lines, nt, lt))
+
+    def test_parse_file_fingerprint(self):
+        self._write(['a\tb.warn\t{"message":"x %d"}\n' % i for i in range(100)] + ['a\tb.warn\t{"message":"y"}\n'])
+        for chunk_size in [1, 100, 1024 * 1024]:
+            s = LogSummary(1, 1024, 10)
+            parse_file(self.path, s, chunk_size)
+            self.assertEqual(s.tags, {'b.warn': [101, []]})
+            self.assertEqual(s.templates['b.warn'].top(10), [(u'x <NUM>', 100), (u'y', 1)])
+
+    def test_parse_file_resume(self):
+        lines = ['a\tb.warn\t{"message":"x %d"}\n' % i for i in range(100)]
+        self._write(lines)
+        for chunk_size in [1, 100, 1024 * 1024]:
+            offsets = []
+            s = LogSummary(15, 1024)
+            parse_file(self.path, s, chunk_size, start=len(''.join(lines[:40])), progress=offsets.append)
+            self.assertEqual(s.tags, parse_reference(lines[40:], 15, 1024)[0])
+            if not log_parser.is_compressed(self.path):
+                self.assertEqual(offsets[-1], len(''.join(lines)))
+                self.assertEqual(offsets, sorted(offsets))
+
+    def test_parse_file_without_last_newline(self):
+        self._write(['a\tb.warn\t{"message":"x"}\n'] * 5 + ['a\tb.warn\t{"message":"y"}'])
+        for chunk_size in [1, 10, 1024]:
+            s = LogSummary(1, 1024)
+            parse_file(self.path, s, chunk_size)
+            self.assertEqual(s.tags, {'b.warn': [6, [u'x']]})
+
+    def test_parse_file_empty(self):
+        self._write([])
+        s = LogSummary(15, 1024)
+        parse_file(self.path, s)
+        self.assertEqual(s.tags, {})
+
+    def test_parse_file_error(self):
+        def assert_err(lines, expected):
+            self._write(lines)
+            for chunk_size in [1, 10, 1024]:
+                with self.assertRaises(LogFormatError) as cm:
+                    parse_file(self.path, LogSummary(1, 1024), chunk_size)
+                self.assertEqual(cm.exception.args[0], expected)
+
+        ok = 'a\tb.warn\t{"message":"x"}\n'
+        assert_err([ok, 'a\n', ok], 'LogWatcher parse error: file=%s, line=a\n' % self.path)
+        assert_err([ok, ok, 'a\tb\n'], 'LogWatcher parse error: file=%s, line=a\tb\n' % self.path)
+        assert_err([ok, ok, 'a\tb.warn\tc\td'], 'LogWatcher parse error: file=%s, line=a\tb.warn\tc\td' % self.path)
+        assert_err([ok, 'a\tc.warn\t{}\n'],
+                   "LogWatcher parse error: KeyError: 'message': file=%s, line=a\tc.warn\t{}\n" % self.path)
+
+        # broken lines which keep the number of tabs are still detected
+        assert_err([ok, ok, 'a\tb.warn\tc\td\n', 'e\n'],
+                   'LogWatcher parse error: file=%s, line=a\tb.warn\tc\td\n' % self.path)
+
+    def test_parse_file_error_counted_tag(self):
+        # the broken lines are in the chunk after the tag has reached the threshold
+        self._write(['a\tb.warn\t{"message":"x"}\n', 'a\tb.warn\t\tb.warn\tb\n', 'no tabs here\n'])
+        for chunk_size in [1, 40, 1024]:
+            with self.assertRaises(LogFormatError) as cm:
+                parse_file(self.path, LogSummary(1, 1024), chunk_size)
+            self.assertEqual(cm.exception.args[0],
+                             'LogWatcher parse error: file=%s, line=a\tb.warn\t\tb.warn\tb\n' % self.path)
+
+
+class TestParseFileGzip(TestParseFile):
+    suffix = '.gz'
+
+    def test_parse_file_resume(self):
+        self._write(['a\tb.warn\t{"message":"x"}\n'])
+        self.assertRaises(ValueError, parse_file, self.path, LogSummary(15, 1024), start=1)
+
+    def _write(self, lines):
+        f = gzip.open(self.path, 'wb')
+        try:
+            f.write(''.join(lines))
+        finally:
+            f.close()
+
+    def test_parse_file_empty(self):
+        self._write([])
+        s = LogSummary(15, 1024)
+        parse_file(self.path, s)
+        self.assertEqual(s.tags, {})
+
+    def test_parse_file_broken(self):
+        with open(self.path, 'wb') as f:
+            f.write('xxx')
+        self.assertRaises(IOError, parse_file, self.path, LogSummary(15, 1024))
+
+
+@unittest.skipIf(log_parser.zstandard is None, 'zstandard is not installed')
+class TestParseFileZstd(TestParseFile):
+    suffix = '.zst'
+
+    def test_parse_file_resume(self):
+        self._write(['a\tb.warn\t{"message":"x"}\n'])
+        self.assertRaises(ValueError, parse_file, self.path, LogSummary(15, 1024), start=1)
+
+    def _write(self, lines):
+        with open(self.path, 'wb') as f:
+            f.write(log_parser.zstandard.ZstdCompressor().compress(''.join(lines)))
+
+
+class TestParseFileZstdNotInstalled(unittest.TestCase):
+    def test_parse_file(self):
+        zstandard, log_parser.zstandard = log_parser.zstandard, None
+        try:
+            with self.assertRaises(LogFormatError) as cm:
+                parse_file('path.zst', LogSummary(15, 1024))
+            self.assertEqual(cm.exception.args[0],
+                             'LogWatcher cannot decompress the file without the zstandard module: file=path.zst')
+        finally:
+            log_parser.zstandard = zstandard
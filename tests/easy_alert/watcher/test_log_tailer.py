@@ -0,0 +1,141 @@
+import os
+import re
+import sys
+import shutil
+import logging
+import tempfile
+from easy_alert.watcher.log_tailer import LogSource, PositionFile
+from easy_alert.watcher.log_parser import LogSummary
+from easy_alert.entity.level import Level
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestPositionFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.pos')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_save(self):
+        p = PositionFile(self.path)
+        self.assertEqual(p.load(), None)
+        p.save((12345, 678))
+        self.assertEqual(p.load(), (12345, 678))
+        p.save((12346, 0))
+        self.assertEqual(p.load(), (12346, 0))
+        self.assertEqual(os.listdir(self.temp_dir), ['test.pos'])
+
+    def test_load_error(self):
+        with open(self.path, 'w') as f:
+            f.write('xxx')
+        with self.assertRaises(ValueError) as cm:
+            PositionFile(self.path).load()
+        self.assertEqual(cm.exception.args[0], 'Broken position file: %s' % self.path)
+
+
+class TestLogSource(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'messages')
+        self.source = LogSource(self.path, 'monitor.syslog', [
+            (re.compile('ERROR'), Level(logging.ERROR)),
+            (re.compile('WARN'), Level(logging.WARN)),
+            (re.compile('^[a-z]+ CRIT'), Level(logging.CRITICAL)),
+        ], PositionFile(os.path.join(self.temp_dir, 'monitor.syslog.pos')))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _append(self, path, text):
+        with open(path, 'a') as f:
+            f.write(text)
+
+    def _read(self, read_from_head=False):
+        summary = LogSummary(15, 1024)
+        position = self.source.read(summary, read_from_head)
+        self.source.position_file.save(position)
+        return summary.tags
+
+    def test_classify(self):
+        self.assertEqual(self.source.classify('xxx ERROR WARN'), 'monitor.syslog.error')
+        self.assertEqual(self.source.classify('xxx WARN'), 'monitor.syslog.warn')
+        self.assertEqual(self.source.classify('abc CRIT'), 'monitor.syslog.critical')
+        self.assertEqual(self.source.classify('abc CRIT WARN'), 'monitor.syslog.warn')
+        self.assertEqual(self.source.classify('ABC CRIT'), None)
+        self.assertEqual(self.source.classify(''), None)
+
+    def test_read(self):
+        # start at the end at the first run
+        self._append(self.path, 'line 1 ERROR\n')
+        self.assertEqual(self._read(), {})
+
+        self._append(self.path, 'line 2 ERROR\nline 3 INFO\nline 4 WARN\r\nline 5 ERR')
+        self.assertEqual(self._read(), {
+            'monitor.syslog.error': [1, [u'line 2 ERROR']],
+            'monitor.syslog.warn': [1, [u'line 4 WARN']],
+        })
+
+        # incomplete line is read after it is completed
+        self._append(self.path, 'OR\n')
+        self.assertEqual(self._read(), {'monitor.syslog.error': [1, [u'line 5 ERROR']]})
+        self.assertEqual(self._read(), {})
+
+    def test_read_not_found(self):
+        self.assertEqual(self._read(), {})
+        self.assertEqual(self.source.position_file.load(), (0, 0))
+
+        # the file created later is read from the head
+        self._append(self.path, 'line 1 ERROR\n')
+        self.assertEqual(self._read(), {'monitor.syslog.error': [1, [u'line 1 ERROR']]})
+        self.assertEqual(self._read(), {})
+
+    def test_read_from_head(self):
+        self._append(self.path, 'line 1 ERROR\n')
+        self.assertEqual(self._read(True), {'monitor.syslog.error': [1, [u'line 1 ERROR']]})
+        self.assertEqual(self._read(True), {})
+
+    def test_read_not_saved(self):
+        self._append(self.path, 'line 1 ERROR\n')
+        self._read(True)
+        self._append(self.path, 'line 2 ERROR\n')
+
+        # the same lines are read until the position is saved
+        for _ in range(2):
+            summary = LogSummary(15, 1024)
+            self.source.read(summary)
+            self.assertEqual(summary.tags, {'monitor.syslog.error': [1, [u'line 2 ERROR']]})
+
+    def test_read_truncated(self):
+        self._append(self.path, 'line 1 ERROR\nline 2 ERROR\n')
+        self._read(True)
+
+        with open(self.path, 'w') as f:
+            f.write('line 3 WARN\n')
+        self.assertEqual(self._read(), {'monitor.syslog.warn': [1, [u'line 3 WARN']]})
+
+    def test_read_rotated(self):
+        self._append(self.path, 'line 1 ERROR\n')
+        self._read(True)
+
+        self._append(self.path, 'line 2 ERROR\nline 3 WARN')
+        os.rename(self.path, self.path + '.1')
+        self._append(self.path, 'line 4 ERROR\n')
+        self.assertEqual(self._read(), {
+            'monitor.syslog.error': [2, [u'line 2 ERROR', u'line 4 ERROR']],
+            'monitor.syslog.warn': [1, [u'line 3 WARN']],
+        })
+
+        # rotated file has been removed
+        self._append(self.path, 'line 5 ERROR\n')
+        os.remove(self.path + '.1')
+        os.rename(self.path, self.path + '.1')
+        self._append(self.path, 'line 6 ERROR\n')
+        self._append(self.path + '.1', 'line 7 ERROR\n')
+        os.remove(self.path + '.1')
+        self.assertEqual(self._read(), {'monitor.syslog.error': [1, [u'line 6 ERROR']]})
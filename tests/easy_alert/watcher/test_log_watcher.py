@@ -1,8 +1,15 @@
 import sys
 import os
+import time
+import shutil
 import logging
+import tempfile
+import threading
+import multiprocessing
 from easy_alert.setting.setting_error import SettingError
 from easy_alert.watcher.log_watcher import LogWatcher
+from easy_alert.watcher.log_checkpoint import Checkpoint
+from easy_alert.watcher.log_parser import LogSummary
 from easy_alert.entity.level import Level
 from tests.easy_alert.util.util_for_test import captured_output
 
@@ -28,6 +35,34 @@ class TestLogWatcher(unittest.TestCase):
                    "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
         assert_err({'watch_dir': '.', 'pending_threshold': 'a'},
                    "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'watch_dir': '.', 'pending_age': 'a'},
+                   "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'watch_dir': '.', 'parse_workers': 'a'},
+                   "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'watch_dir': '.', 'read_from_head': 'a'}, 'LogWatcher value should be bool: a')
+        assert_err({'watch_dir': '.', 'fingerprint': 'a'}, 'LogWatcher value should be bool: a')
+        assert_err({'watch_dir': '.', 'checkpoint': 'a'}, 'LogWatcher value should be bool: a')
+        assert_err({'watch_dir': '.', 'max_templates': 'a'},
+                   "LogWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'watch_dir': '.', 'sources': {}}, 'LogWatcher settings not a list: {}')
+        assert_err({'watch_dir': '.', 'sources': ['a']}, 'LogWatcher settings not a dict: a')
+        assert_err({'watch_dir': '.', 'sources': [{'tag': 'x', 'rules': []}]},
+                   "LogWatcher not found config key: 'path'")
+        assert_err({'watch_dir': '.', 'sources': [{'path': 'x', 'rules': []}]},
+                   "LogWatcher not found config key: 'tag'")
+        assert_err({'watch_dir': '.', 'sources': [{'path': 'x', 'tag': 'x'}]},
+                   "LogWatcher not found config key: 'rules'")
+
+        def rules(r):
+            return {'watch_dir': '.', 'sources': [{'path': 'x', 'tag': 'x', 'rules': r}]}
+
+        assert_err(rules({}), 'LogWatcher settings not a list: {}')
+        assert_err(rules(['a']), 'LogWatcher settings not a dict: a')
+        assert_err(rules([{'level': 'warn'}]), "LogWatcher not found config key: 'pattern'")
+        assert_err(rules([{'pattern': 'a'}]), "LogWatcher not found config key: 'level'")
+        assert_err(rules([{'pattern': 'a', 'level': 'x'}]), 'LogWatcher unknown level: x')
+        assert_err(rules([{'pattern': '(', 'level': 'warn'}]),
+                   'LogWatcher settings syntax error: unbalanced parenthesis')
 
     def test_init_normal(self):
         s1 = LogWatcher({'watch_dir': 'watch_dir'}, True)
@@ -37,6 +72,14 @@ class TestLogWatcher(unittest.TestCase):
         self.assertEqual(s1.message_num_threshold, 15)
         self.assertEqual(s1.message_len_threshold, 1024)
         self.assertEqual(s1.pending_threshold, 3)
+        self.assertEqual(s1.pending_age, 0)
+        self.assertEqual(s1.parse_workers, 1)
+        self.assertEqual(s1.sources, None)
+        self.assertEqual(s1.read_from_head, False)
+        self.assertEqual(s1.fingerprint, False)
+        self.assertEqual(s1.max_templates, 1000)
+        self.assertEqual(s1.checkpoint, None)
+        self.assertEqual(s1.archive_dir, None)
         self.assertEqual(s1.print_only, True)
         self.assertEqual(s1.target_paths, None)
 
@@ -47,6 +90,8 @@ class TestLogWatcher(unittest.TestCase):
                             'message_num_threshold': 100,
                             'message_len_threshold': 100,
                             'pending_threshold': 100,
+                            'pending_age': 100,
+                            'parse_workers': 100,
                         }, False)
         self.assertEqual(s2.watch_dir, 'watch_dir')
         self.assertEqual(s2.target_pattern, os.path.join('watch_dir', '*.log'))
@@ -54,6 +99,8 @@ class TestLogWatcher(unittest.TestCase):
         self.assertEqual(s2.message_num_threshold, 100)
         self.assertEqual(s2.message_len_threshold, 100)
         self.assertEqual(s2.pending_threshold, 100)
+        self.assertEqual(s2.pending_age, 100)
+        self.assertEqual(s2.parse_workers, 100)
         self.assertEqual(s2.print_only, False)
         self.assertEqual(s2.target_paths, None)
 
@@ -64,6 +111,8 @@ class TestLogWatcher(unittest.TestCase):
                             'message_num_threshold': 0,
                             'message_len_threshold': 0,
                             'pending_threshold': 0,
+                            'pending_age': 0,
+                            'parse_workers': 0,
                         }, False)
         self.assertEqual(s3.watch_dir, 'watch_dir')
         self.assertEqual(s3.target_pattern, os.path.join('watch_dir', 'alert.????????_????_*.log'))
@@ -71,9 +120,36 @@ class TestLogWatcher(unittest.TestCase):
         self.assertEqual(s3.message_num_threshold, 15)
         self.assertEqual(s3.message_len_threshold, 1024)
         self.assertEqual(s3.pending_threshold, 3)
+        self.assertEqual(s3.pending_age, 0)
+        self.assertEqual(s3.parse_workers, 1)
         self.assertEqual(s3.print_only, False)
         self.assertEqual(s3.target_paths, None)
 
+        s5 = LogWatcher({'watch_dir': 'watch_dir', 'checkpoint': True, 'archive_dir': '/tmp/archive'}, True)
+        self.assertEqual(s5.checkpoint, Checkpoint(os.path.join('watch_dir', 'checkpoint.json')))
+        self.assertEqual(s5.archive_dir, '/tmp/archive')
+
+        s4 = LogWatcher({
+                            'watch_dir': 'watch_dir',
+                            'read_from_head': True,
+                            'sources': [
+                                {'path': '/var/log/messages', 'tag': 'monitor.syslog',
+                                 'rules': [{'pattern': 'ERROR', 'level': 'error'},
+                                           {'pattern': 'WARN', 'level': 'warn'}]},
+                                {'path': '/var/log/app.log', 'tag': 'monitor.app', 'pos_file': '/tmp/app.pos',
+                                 'rules': []},
+                            ]
+                        }, False)
+        self.assertEqual(s4.read_from_head, True)
+        self.assertEqual(len(s4.sources), 2)
+        self.assertEqual(s4.sources[0].path, '/var/log/messages')
+        self.assertEqual(s4.sources[0].tag, 'monitor.syslog')
+        self.assertEqual([(p.pattern, l) for p, l in s4.sources[0].rules],
+                         [('ERROR', Level(logging.ERROR)), ('WARN', Level(logging.WARN))])
+        self.assertEqual(s4.sources[0].position_file.path, os.path.join('watch_dir', 'monitor.syslog.pos'))
+        self.assertEqual(s4.sources[1].rules, [])
+        self.assertEqual(s4.sources[1].position_file.path, '/tmp/app.pos')
+
     def test_watch(self):
         w = LogWatcher({'watch_dir': 'tests/resources/log_watcher'}, True)
         result = w.watch()
@@ -85,6 +161,112 @@ class TestLogWatcher(unittest.TestCase):
             'tests/resources/log_watcher/alert.20150801_1234_3.log'
         ])
 
+    def test_watch_parallel(self):
+        expected = LogWatcher({'watch_dir': 'tests/resources/log_watcher'}, True).watch()
+        for workers in [2, 3, 4]:
+            for nt in [1, 2, 15]:
+                w1 = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'message_num_threshold': nt}, True)
+                w2 = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'message_num_threshold': nt,
+                                 'parse_workers': workers}, True)
+                r1, r2 = w1.watch(), w2.watch()
+                self.assertEqual(len(r2), 1)
+                self.assertEqual(r2[0].level, expected[0].level)
+                self.assertEqual(r2[0].message, r1[0].message)
+
+    def test_watch_parallel_prepared(self):
+        expected = LogWatcher({'watch_dir': 'tests/resources/log_watcher'}, True).watch()
+        w = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'parse_workers': 2}, True)
+        w.prepare()
+        try:
+            pool = w.parse_pool
+            self.assertTrue(pool is not None)
+            for _ in range(2):
+                self.assertEqual([(a.level, a.message) for a in w.watch()], [(expected[0].level, expected[0].message)])
+            self.assertTrue(w.parse_pool is pool)
+        finally:
+            w.close()
+        self.assertEqual(w.parse_pool, None)
+
+        # not needed for a single worker or the tail mode
+        for setting in [{'watch_dir': 'tests/resources/log_watcher'},
+                        {'watch_dir': 'tests/resources/log_watcher', 'parse_workers': 2,
+                         'sources': [{'path': 'x.log', 'tag': 'x', 'rules': []}]}]:
+            w = LogWatcher(setting, True)
+            w.prepare()
+            self.assertEqual(w.parse_pool, None)
+            w.close()
+
+    def test_watch_parallel_in_thread(self):
+        expected = LogWatcher({'watch_dir': 'tests/resources/log_watcher'}, True).watch()
+        w = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'parse_workers': 2}, True)
+        result = []
+
+        def fail(*args):
+            raise AssertionError('forked in a thread')
+
+        # without prepare(), the files are parsed in the thread instead of forking
+        pool_class, multiprocessing.Pool = multiprocessing.Pool, fail
+        try:
+            t = threading.Thread(target=lambda: result.append(w.watch()))
+            t.start()
+            t.join()
+        finally:
+            multiprocessing.Pool = pool_class
+        self.assertEqual([(a.level, a.message) for a in result[0]], [(expected[0].level, expected[0].message)])
+
+    def test_watch_parallel_error(self):
+        w = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'target_pattern': '*.20150801_1234_1.log',
+                        'parse_workers': 2}, True)
+        with self.assertRaises(Exception) as cm:
+            w.watch()
+        self.assertEqual(cm.exception.args[0],
+                         'LogWatcher parse error: file=tests/resources/log_watcher/err.20150801_1234_1.log, '
+                         'line=2015-08-01T12:34:56.789')
+
+    def test_watch_fingerprint(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(temp_dir, 'alert.20150801_1234_1.log'), 'w') as f:
+                for i in range(20):
+                    f.write('2015-08-01T12:34:56.789\tmonitor.app.error\t{"message":"Request %d timed out."}\n' % i)
+                f.write('2015-08-01T12:34:56.789\tmonitor.app.error\t{"message":"Disk full."}\n')
+                for i in range(5):
+                    f.write('2015-08-01T12:34:56.789\tmonitor.app.warn\t{"message":"Retry %d."}\n' % i)
+                f.write('2015-08-01T12:34:56.789\tmonitor.app.warn\t{"message":"Slow query."}\n')
+                f.write('2015-08-01T12:34:56.789\tmonitor.app.warn\t{"message":"Bad request."}\n')
+
+            for workers in [1, 2]:
+                w = LogWatcher({'watch_dir': temp_dir, 'fingerprint': True, 'message_num_threshold': 2,
+                                'max_templates': 2, 'parse_workers': workers}, True)
+                result = w.watch()
+                self.assertEqual(len(result), 1)
+                self.assertEqual(result[0].level, Level(logging.ERROR))
+                self.assertEqual(result[0].message.split('\n')[2:], [
+                    u'[monitor.app.error]: 21 messages',
+                    u'Request <NUM> timed out. \u00d7 20',
+                    u'Disk full. \u00d7 1',
+                    u'',
+                    u'[monitor.app.warn]: 7 messages',
+                    u'Retry <NUM>. \u00d7 5',
+                    u'Slow query. \u00d7 1',
+                    u'(1 messages of other patterns)',
+                    u'Bad request.',
+                    u'',
+                    u'==',
+                ])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_watch_patterns(self):
+        w1 = LogWatcher({'watch_dir': 'watch_dir'}, True)
+        self.assertEqual(w1.watch_patterns(), [(os.path.join('watch_dir', 'alert.????????_????_*.log'), False)])
+
+        w2 = LogWatcher({'watch_dir': 'watch_dir', 'sources': [
+            {'path': '/var/log/messages', 'tag': 'monitor.syslog', 'rules': []},
+            {'path': '/var/log/app.log', 'tag': 'monitor.app', 'rules': []},
+        ]}, True)
+        self.assertEqual(w2.watch_patterns(), [('/var/log/messages', True), ('/var/log/app.log', True)])
+
     def test_watch_pending(self):
         w = LogWatcher({'watch_dir': 'tests/resources/log_watcher', 'target_pattern': 'xxx'}, True)
         result = w.watch()
@@ -92,6 +274,28 @@ class TestLogWatcher(unittest.TestCase):
         self.assertEqual(result[0].level, Level(logging.WARN))
         self.assertEqual(w.target_paths, [])
 
+    def test_watch_pending_age(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'alert.20150801_1234.b123.log')
+            with open(path, 'w') as f:
+                f.write('x')
+
+            w1 = LogWatcher({'watch_dir': temp_dir}, True)
+            w2 = LogWatcher({'watch_dir': temp_dir, 'pending_age': 10}, True)
+            self.assertEqual(w1.watch(), [])
+            self.assertEqual(w2.watch(), [])
+
+            t = time.time() - 600
+            os.utime(path, (t, t))
+            self.assertEqual(w1.watch(), [])
+            result = w2.watch()
+            self.assertEqual(len(result), 1)
+            self.assertEqual(result[0].level, Level(logging.WARN))
+            self.assertIn(path, result[0].message)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_watch_error(self):
         def assert_err(setting, expected):
             with self.assertRaises(Exception) as cm:
@@ -159,3 +363,179 @@ class TestLogWatcher(unittest.TestCase):
         finally:
             if os.path.exists(path):
                 os.remove(path)
+
+    def test_watch_tail(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            log1 = os.path.join(temp_dir, 'messages')
+            log2 = os.path.join(temp_dir, 'app.log')
+            with open(log1, 'w') as f:
+                f.write('old ERROR\n')
+
+            for print_only in [True, False]:
+                w = LogWatcher({
+                    'watch_dir': temp_dir,
+                    'message_num_threshold': 2,
+                    'sources': [
+                        {'path': log1, 'tag': 'monitor.syslog',
+                         'rules': [{'pattern': 'ERROR', 'level': 'error'}, {'pattern': 'WARN', 'level': 'warn'}]},
+                        {'path': log2, 'tag': 'monitor.app', 'rules': [{'pattern': 'FATAL', 'level': 'critical'}]},
+                    ]}, print_only)
+
+                # first run starts at the end
+                self.assertEqual(w.watch(), [])
+                with captured_output() as (out, err):
+                    w.after_success()
+                if print_only:
+                    self.assertEqual(out.getvalue(), 'Would update position: %s: %d\t10\n'
+                                                     'Would update position: %s: 0\t0\n' % (
+                        os.path.join(temp_dir, 'monitor.syslog.pos'), os.stat(log1).st_ino,
+                        os.path.join(temp_dir, 'monitor.app.pos')))
+                    self.assertFalse(os.path.exists(os.path.join(temp_dir, 'monitor.syslog.pos')))
+                else:
+                    self.assertEqual(out.getvalue(), '')
+                    self.assertTrue(os.path.exists(os.path.join(temp_dir, 'monitor.syslog.pos')))
+
+            with open(log1, 'a') as f:
+                f.write('1 ERROR\n2 WARN\n3 INFO\n4 ERROR\n5 ERROR\n')
+            with open(log2, 'w') as f:
+                f.write('6 FATAL\n')
+
+            # log2 has been created after the first run, so it is read from the head
+            result = w.watch()
+            self.assertEqual(len(result), 1)
+            self.assertEqual(result[0].level, Level(logging.CRITICAL))
+            self.assertEqual(result[0].message.split('\n')[2:], [
+                '[monitor.app.critical]: 1 messages',
+                '6 FATAL',
+                '',
+                '[monitor.syslog.error]: 3 messages',
+                '1 ERROR',
+                '4 ERROR',
+                '(snip)',
+                '',
+                '[monitor.syslog.warn]: 1 messages',
+                '2 WARN',
+                '',
+                '==',
+            ])
+            w.after_success()
+
+            self.assertEqual(w.watch(), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestLogWatcherCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive_dir = os.path.join(self.temp_dir, 'archive')
+        os.mkdir(self.archive_dir)
+        self.paths = [os.path.join(self.temp_dir, 'alert.20150801_1234_%d.log' % i) for i in [1, 2]]
+        for i, path in enumerate(self.paths):
+            with open(path, 'w') as f:
+                f.write('2015-08-01T12:34:56.789\tmonitor.syslog.warn\t{"message":"Alert message %d."}\n' % (2 * i))
+                f.write('2015-08-01T12:34:56.789\tmonitor.syslog.warn\t{"message":"Alert message %d."}\n'
+                        % (2 * i + 1))
+        self.checkpoint_path = os.path.join(self.temp_dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _watcher(self, print_only=False, **kwargs):
+        setting = {'watch_dir': self.temp_dir, 'checkpoint': True}
+        setting.update(kwargs)
+        return LogWatcher(setting, print_only)
+
+    def _messages(self, result):
+        self.assertEqual(len(result), 1)
+        return [l for l in result[0].message.split('\n') if l.startswith('Alert')]
+
+    def _test_retry(self, workers):
+        w = self._watcher(parse_workers=workers)
+        expected = ['Alert message 0.', 'Alert message 1.', 'Alert message 2.', 'Alert message 3.']
+        self.assertEqual(sorted(self._messages(w.watch())), expected)
+        self.assertTrue(os.path.exists(self.checkpoint_path))
+
+        # notification failed, and the file has been changed in place (not parsed again)
+        with open(self.paths[0], 'r+') as f:
+            f.write('2015-08-01T12:34:56.789\tmonitor.syslog.warn\t{"message":"Changed message."}')
+        self.assertEqual(sorted(self._messages(w.watch())), expected)
+
+        w.after_success()
+        self.assertEqual(os.listdir(self.temp_dir), ['archive'])
+
+    def test_retry(self):
+        self._test_retry(1)
+
+    def test_retry_parallel(self):
+        self._test_retry(2)
+
+    def test_resume(self):
+        w = self._watcher()
+        with open(self.paths[0]) as f:
+            first_line = f.readline()
+        partial = LogSummary(15, 1024)
+        partial.add_message('monitor.syslog.warn', 'Parsed message.')
+        checkpoint = Checkpoint(self.checkpoint_path)
+        checkpoint.update(self.paths[0], os.stat(self.paths[0]), len(first_line), partial)
+        checkpoint.save()
+
+        self.assertEqual(sorted(self._messages(w.watch())),
+                         ['Alert message 1.', 'Alert message 2.', 'Alert message 3.'])
+        self.assertIn('[monitor.syslog.warn]: 4 messages', w.watch()[0].message)
+
+    def test_checkpoint_progress(self):
+        w = self._watcher()
+        w.CHECKPOINT_BYTES = 1
+        checkpoint = w.checkpoint.load()
+        st = os.stat(self.paths[0])
+        summary = LogSummary(15, 1024)
+        f = w._checkpoint_progress(self.paths[0], st, 0, summary)
+        f(10)
+        self.assertEqual(Checkpoint(self.checkpoint_path).load().get(self.paths[0], st)['offset'], 10)
+        f(st.st_size)
+        self.assertEqual(Checkpoint(self.checkpoint_path).load().get(self.paths[0], st)['offset'], 10)
+        self.assertEqual(checkpoint.files[self.paths[0]]['offset'], 10)
+
+    def test_notified(self):
+        w = self._watcher()
+        w.watch()
+
+        # crashed after the notification
+        for path in self.paths:
+            w.checkpoint.set_notified(path)
+        w.checkpoint.save()
+        os.remove(self.paths[0])
+
+        w = self._watcher()
+        self.assertEqual(w.watch(), [])
+        w.after_success()
+        self.assertEqual(os.listdir(self.temp_dir), ['archive'])
+
+    def test_new_file_after_notified(self):
+        w = self._watcher()
+        w.watch()
+        w.checkpoint.set_notified(self.paths[0])
+        w.checkpoint.save()
+
+        self.assertEqual(sorted(self._messages(w.watch())), ['Alert message 2.', 'Alert message 3.'])
+
+    def test_archive(self):
+        w = self._watcher(archive_dir=self.archive_dir)
+        w.watch()
+        w.after_success()
+        self.assertEqual(os.listdir(self.temp_dir), ['archive'])
+        self.assertEqual(sorted(os.listdir(self.archive_dir)),
+                         ['alert.20150801_1234_1.log', 'alert.20150801_1234_2.log'])
+
+    def test_print_only(self):
+        w = self._watcher(print_only=True, archive_dir=self.archive_dir)
+        w.watch()
+        with captured_output() as (out, err):
+            w.after_success()
+        self.assertEqual(sorted(out.getvalue().splitlines()), [
+            'Would archive: %s -> %s' % (p, os.path.join(self.archive_dir, os.path.basename(p))) for p in self.paths
+        ])
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ['alert.20150801_1234_1.log', 'alert.20150801_1234_2.log', 'archive'])
@@ -1,10 +1,14 @@
 import logging
+import os
 import sys
 import re
-from easy_alert.watcher.process_watcher import ProcessReader, ProcessCounter, ProcessWatcher
+import random
+import shutil
+import tempfile
+from easy_alert.watcher.process_watcher import ProcessReader, ProcfsProcessReader, ProcessCounter, ProcessWatcher
 from easy_alert.setting.setting_error import SettingError
 from easy_alert.entity.level import Level
-from easy_alert.util import Matcher
+from easy_alert.util import Matcher, MultiPatternMatcher
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -40,6 +44,164 @@ class TestProcessReader(unittest.TestCase):
         })
 
 
+class MockProcfsProcessReader(ProcfsProcessReader):
+    def __init__(self, proc_root, expected_raw=None, vanished=(), incremental=True):
+        super(MockProcfsProcessReader, self).__init__(proc_root, incremental)
+        self.expected_raw = expected_raw
+        self.vanished = vanished
+        self.opened = []
+
+    def _read_raw(self):
+        return self.expected_raw
+
+    def _read_file(self, pid, name):
+        if pid in self.vanished:
+            raise IOError(3, 'No such process')
+        self.opened.append((pid, name))
+        return super(MockProcfsProcessReader, self)._read_file(pid, name)
+
+
+class TestProcfsProcessReader(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_root)
+
+    def _make_process(self, pid, ppid, comm, cmdline, state='S', start_time=100):
+        path = os.path.join(self.proc_root, str(pid))
+        if not os.path.exists(path):
+            os.mkdir(path)
+        with open(os.path.join(path, 'stat'), 'w') as f:
+            f.write('%d (%s) %s %d 1 1 0 -1 4194560 100 0 0 0 12 3 0 0 20 0 1 0 %d 1000 50 0\n'
+                    % (pid, comm, state, ppid, start_time))
+        with open(os.path.join(path, 'cmdline'), 'w') as f:
+            f.write(cmdline)
+
+    def test_read(self):
+        self._make_process(1, 0, 'launchd', '/sbin/launchd\0')
+        self._make_process(2, 0, 'kthreadd', '')
+        self._make_process(37, 1, 'syslogd', '/usr/sbin/syslogd\0')
+        self._make_process(40, 1, 'awesome (app) 1', 'your-awesome-app\0arg1\0arg2\0arg 3\0')
+        self._make_process(41, 40, 'zombie', '', state='Z')
+        self._make_process(42, 1, 'vanished', '/bin/vanished\0')
+        os.mkdir(os.path.join(self.proc_root, 'sys'))
+        with open(os.path.join(self.proc_root, 'uptime'), 'w') as f:
+            f.write('100.0 100.0\n')
+
+        ret = MockProcfsProcessReader(self.proc_root, vanished=['42']).read()
+        self.assertEqual(ret, {
+            1: (0, '/sbin/launchd'),
+            2: (0, '[kthreadd]'),
+            37: (1, '/usr/sbin/syslogd'),
+            40: (1, 'your-awesome-app arg1 arg2 arg 3'),
+            41: (40, '[zombie]'),
+        })
+
+    def test_read_incremental(self):
+        self._make_process(1, 0, 'init', '/sbin/init\0')
+        self._make_process(40, 1, 'app', 'app\0arg1\0')
+        self._make_process(41, 40, 'app', 'app\0arg1\0')
+        reader = MockProcfsProcessReader(self.proc_root)
+
+        expected = {1: (0, '/sbin/init'), 40: (1, 'app arg1'), 41: (40, 'app arg1')}
+        self.assertEqual(reader.read(), expected)
+        self.assertEqual(len([x for x in reader.opened if x[1] == 'cmdline']), 3)
+
+        # nothing changed
+        reader.opened = []
+        self.assertEqual(reader.read(), expected)
+        self.assertEqual(sorted(reader.opened), [('1', 'stat'), ('40', 'stat'), ('41', 'stat')])
+
+        # reparented, recycled, exec-ed, exited and new processes
+        shutil.rmtree(os.path.join(self.proc_root, '41'))
+        self._make_process(40, 1, 'app', 'app\0arg2\0', start_time=200)
+        self._make_process(42, 1, 'sh', 'sh\0')
+        self._make_process(43, 1, 'app', 'app\0arg1\0')
+        reader.opened = []
+        self.assertEqual(reader.read(), {1: (0, '/sbin/init'), 40: (1, 'app arg2'), 42: (1, 'sh'), 43: (1, 'app arg1')})
+        self.assertEqual(sorted(x[0] for x in reader.opened if x[1] == 'cmdline'), ['40', '42', '43'])
+
+        self._make_process(42, 1, 'python', 'python\0app.py\0')
+        self._make_process(43, 42, 'app', 'app\0arg1\0')
+        reader.opened = []
+        self.assertEqual(reader.read(),
+                         {1: (0, '/sbin/init'), 40: (1, 'app arg2'), 42: (1, 'python app.py'), 43: (42, 'app arg1')})
+        self.assertEqual([x[0] for x in reader.opened if x[1] == 'cmdline'], ['42'])
+
+    def test_read_usage(self):
+        self._make_process(1, 0, 'init', '/sbin/init\0')
+        now = [1000.0]
+        reader = MockProcfsProcessReader(self.proc_root)
+        reader.clock = lambda: now[0]
+        page_size = ProcfsProcessReader.PAGE_SIZE
+        clock_ticks = ProcfsProcessReader.CLOCK_TICKS
+
+        # no uptime file
+        reader.read()
+        self.assertEqual(reader.usage, {1: (50 * page_size, None)})
+
+        # utime + stime: 15 ticks -> 15 + clock ticks / 2 in 2 seconds
+        with open(os.path.join(self.proc_root, '1', 'stat'), 'w') as f:
+            f.write('1 (init) S 0 1 1 0 -1 4194560 100 0 0 0 %d 3 0 0 20 0 1 0 100 1000 60 0\n' % (12 + clock_ticks))
+        self._make_process(2, 1, 'new', 'new\0')
+        now[0] += 2.0
+        reader.read()
+        self.assertEqual(reader.usage, {1: (60 * page_size, 50.0), 2: (50 * page_size, None)})
+
+    def test_read_usage_lifetime(self):
+        self._make_process(1, 0, 'init', '/sbin/init\0', start_time=0)
+        self._make_process(2, 1, 'app', 'app\0', start_time=ProcfsProcessReader.CLOCK_TICKS * 10)
+        with open(os.path.join(self.proc_root, 'uptime'), 'w') as f:
+            f.write('40.0 80.0\n')
+        clock_ticks = float(ProcfsProcessReader.CLOCK_TICKS)
+
+        # utime + stime: 15 ticks in the lifetime (40 and 30 seconds)
+        reader = MockProcfsProcessReader(self.proc_root)
+        reader.read()
+        self.assertAlmostEqual(reader.usage[1][1], 15 / clock_ticks * 100 / 40)
+        self.assertAlmostEqual(reader.usage[2][1], 15 / clock_ticks * 100 / 30)
+
+    def test_watch_cpu_one_shot(self):
+        # 5 seconds of CPU time in 10 seconds
+        self._make_process(1, 0, 'init', '/sbin/init\0', start_time=0)
+        self._make_process(2, 1, 'app', 'app\0', start_time=ProcfsProcessReader.CLOCK_TICKS * 90)
+        with open(os.path.join(self.proc_root, '2', 'stat'), 'w') as f:
+            f.write('2 (app) S 1 1 1 0 -1 4194560 100 0 0 0 %d 0 0 0 20 0 1 0 %d 1000 50 0\n'
+                    % (ProcfsProcessReader.CLOCK_TICKS * 5, ProcfsProcessReader.CLOCK_TICKS * 90))
+        with open(os.path.join(self.proc_root, 'uptime'), 'w') as f:
+            f.write('100.0 100.0\n')
+
+        w = ProcessWatcher([{'name': 'app', 'regexp': '^app', 'cpu': {'warn': '< 30'}}],
+                           MockProcfsProcessReader(self.proc_root))
+        alerts = w.watch()
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0].level, Level(logging.WARN))
+        self.assertTrue('50' in alerts[0].message, alerts[0].message)
+
+    def test_read_not_incremental(self):
+        self._make_process(1, 0, 'init', '/sbin/init\0')
+        reader = MockProcfsProcessReader(self.proc_root, incremental=False)
+        reader.read()
+        reader.read()
+        self.assertEqual(reader.opened, [('1', 'stat'), ('1', 'cmdline')] * 2)
+
+    def test_read_fallback(self):
+        reader = MockProcfsProcessReader(os.path.join(self.proc_root, 'not_exist'), expected_raw="""  PID  PPID ARGS
+    1     0 /sbin/launchd
+   37     1 /usr/sbin/syslogd""")
+        self.assertFalse(reader.is_available())
+        self.assertEqual(reader.read(), {1: (0, '/sbin/launchd'), 37: (1, '/usr/sbin/syslogd')})
+
+    def test_read_real(self):
+        reader = ProcfsProcessReader()
+        if not reader.is_available():
+            self.skipTest('proc filesystem is not available')
+        ret = reader.read()
+        self.assertIn(os.getpid(), ret)
+        self.assertEqual(ret[os.getpid()][0], os.getppid())
+
+
 class TestProcessCounter(unittest.TestCase):
     def test_distinct(self):
         pc = ProcessCounter({
@@ -135,6 +297,35 @@ class TestProcessCounter(unittest.TestCase):
         })
         self.assertEqual(pc._aggregate(), {'A': 10, 'B': 12})
 
+    def test_update(self):
+        rand = random.Random(12345)
+        pd = dict((x, (x // 4, 'A%d' % (x % 3))) for x in range(1, 200))
+        pc = ProcessCounter(dict(pd))
+
+        for i in range(50):
+            pd = dict(pd)
+            for _ in range(rand.randint(0, 10)):
+                op = rand.randint(0, 3)
+                pid = rand.randint(1, 250)
+                if op == 0:
+                    pd.pop(pid, None)
+                elif op == 1:
+                    pd[pid] = (rand.randint(0, 250), 'A%d' % rand.randint(0, 3))
+                elif op == 2 and pid in pd:
+                    pd[pid] = (pd[pid][0], 'B%d' % rand.randint(0, 3))
+                elif op == 3 and pid in pd:
+                    pd[pid] = (rand.randint(0, 250), pd[pid][1])
+
+            expected = ProcessCounter(pd)
+            self.assertEqual(pc.update(pd), pc)
+            self.assertEqual(pc._distinct(), expected._distinct())
+            self.assertEqual(pc._aggregate(), expected._aggregate())
+
+        # rebuilt from scratch if most of the processes have changed
+        pc.update({1: (0, 'X')})
+        self.assertEqual(pc._distinct(), {'X': 1})
+        self.assertEqual(pc._aggregate(), {'X': 1})
+
     def test_count(self):
         pc = ProcessCounter({
             1: (0, '/sbin/launchd'),
@@ -150,6 +341,26 @@ class TestProcessCounter(unittest.TestCase):
         self.assertEqual(pc.count(re.compile('awesome[-]?app')), 1)
         self.assertEqual(pc.count(re.compile('awesome[-]?app'), False), 3)
 
+    def test_count_all(self):
+        pc = ProcessCounter({
+            1: (0, '/sbin/launchd'),
+            37: (1, '/usr/sbin/syslogd'),
+            38: (1, '/usr/libexec/UserEventAgent (System)'),
+            40: (1, 'your-awesome-app arg1 arg2 "arg 3"'),
+            11111: (11112, 'your-awesome-app arg1 arg2 "arg 3"'),
+            11112: (40, 'your-awesome-app arg1 arg2 "arg 3"'),
+        })
+        patterns = [re.compile(p) for p in ['.*', '.*', 'awesome[-]?app', 'awesome[-]?app', '^/usr/', 'xxx']]
+        matcher = MultiPatternMatcher(patterns)
+        aggregates = [True, False, True, False, True, False]
+
+        self.assertEqual(pc.count_all(matcher.match, aggregates), [4, 6, 1, 3, 2, 0])
+        self.assertEqual(pc.count_all(matcher.match, aggregates),
+                         [pc.count(p, a) for p, a in zip(patterns, aggregates)])
+        self.assertEqual(pc.count_all(matcher.match, [True] * 6), [4, 4, 1, 1, 2, 0])
+        self.assertEqual(pc.count_all(matcher.match, [False] * 6), [6, 6, 3, 3, 2, 0])
+        self.assertEqual(pc.count_all(matcher.match, []), [])
+
 
 class TestProcessWatcher(unittest.TestCase):
     def test_init_error(self):
@@ -173,6 +384,11 @@ class TestProcessWatcher(unittest.TestCase):
                    "ProcessWatcher settings syntax error: Invalid matcher string: >")
         assert_err([{'name': 'name', 'regexp': '.*', 'debug': '===123'}],
                    "ProcessWatcher settings syntax error: Invalid matcher string: ===123")
+        assert_err([{'name': 'name', 'regexp': '.*', 'rss': '<100'}], "ProcessWatcher value should be dict: <100")
+        assert_err([{'name': 'name', 'regexp': '.*', 'cpu': {'error': 'x'}}],
+                   "ProcessWatcher settings syntax error: Invalid matcher string: x")
+        assert_err([{'name': 'name', 'regexp': '.*', 'cpu': {}}],
+                   "ProcessWatcher not found threshold: {'regexp': '.*', 'name': 'name', 'cpu': {}}")
 
     def test_init_normal(self):
         s = [
@@ -181,14 +397,38 @@ class TestProcessWatcher(unittest.TestCase):
              'critical': '>10', 'error': '>=8', 'warn': '==6', 'info': '<=4', 'debug': '<2'},
         ]
         self.assertEqual(ProcessWatcher(s).settings, [
-            ('n1', re.compile('.*'), True, [(Level(logging.ERROR), Matcher('== 1'))]),
+            ('n1', re.compile('.*'), True, [(Level(logging.ERROR), Matcher('== 1'))], [], []),
             ('n2', re.compile('.*'), False, [
                 (Level(logging.CRITICAL), Matcher('> 10')),
                 (Level(logging.ERROR), Matcher('>= 8')),
                 (Level(logging.WARN), Matcher('= 6')),
                 (Level(logging.INFO), Matcher('<= 4')),
                 (Level(logging.DEBUG), Matcher('< 2')),
-            ])
+            ], [], [])
+        ])
+
+    def test_init_process_reader(self):
+        s = [{'name': 'n1', 'regexp': '.*', 'error': '>= 1'}]
+        w1, w2 = ProcessWatcher(s), ProcessWatcher(s)
+
+        # each watcher has its own reader, which is not a part of the settings
+        self.assertTrue(isinstance(w1.process_reader, ProcfsProcessReader))
+        self.assertFalse(w1.process_reader is w2.process_reader)
+        self.assertEqual(w1, w2)
+
+        reader = MockProcessReader('')
+        self.assertTrue(ProcessWatcher(s, reader).process_reader is reader)
+
+    def test_init_normal_usage(self):
+        s = [
+            {'name': 'n1', 'regexp': '.*', 'rss': {'error': '< 2048', 'warn': '< 1024'}},
+            {'name': 'n2', 'regexp': '.*', 'error': '>= 1', 'cpu': {'warn': '<150'}},
+        ]
+        self.assertEqual(ProcessWatcher(s).settings, [
+            ('n1', re.compile('.*'), True, [],
+             [(Level(logging.ERROR), Matcher('< 2048')), (Level(logging.WARN), Matcher('< 1024'))], []),
+            ('n2', re.compile('.*'), True, [(Level(logging.ERROR), Matcher('>= 1'))], [],
+             [(Level(logging.WARN), Matcher('< 150'))]),
         ])
 
     def test_watch(self):
@@ -215,6 +455,72 @@ class TestProcessWatcher(unittest.TestCase):
         self.assertEqual(result[0].level, Level(logging.ERROR))
         self.assertEqual(len(result[0].message.splitlines()), 7)
 
+    def test_watch_verdict_cache(self):
+        process_reader = MockProcessReader("""  PID  PPID ARGS
+    1     0 /sbin/launchd
+   37     1 /usr/sbin/syslogd
+   40     1 your-awesome-app arg1 arg2 "arg 3\"""")
+
+        w = ProcessWatcher(
+            [
+                {'name': 'syslogd', 'error': '=1', 'regexp': '^/usr/sbin/syslogd'},
+                {'name': 'awesome', 'error': '=2', 'regexp': 'awesome[-]?app'},
+            ], process_reader, cache_ticks=2)
+
+        self.assertEqual(len(w.watch()), 1)
+        self.assertEqual(len(w.verdict_cache), 3)
+        self.assertEqual(w.verdict_cache('your-awesome-app arg1 arg2 "arg 3"'), frozenset([1]))
+        self.assertEqual(w.verdict_cache('/usr/sbin/syslogd'), frozenset([0]))
+
+        w.watch()
+        self.assertEqual(w.verdict_cache.misses, 3)
+
+        # forget the args strings which have disappeared
+        process_reader.expected = """  PID  PPID ARGS
+    1     0 /sbin/launchd"""
+        w.watch()
+        w.watch()
+        self.assertEqual(len(w.verdict_cache), 1)
+
+    def test_watch_usage(self):
+        mb = 1024 * 1024
+        process_reader = MockProcessReader("""  PID  PPID ARGS
+    1     0 /sbin/launchd
+   40     1 your-awesome-app arg1
+   41    40 your-awesome-app arg1
+   42     1 your-awesome-app arg2""")
+        process_reader.usage = {1: (100 * mb, 1.0), 40: (600 * mb, 50.0), 41: (500 * mb, None), 42: (1000 * mb, 60.0)}
+
+        w = ProcessWatcher(
+            [
+                {'name': 'launchd', 'regexp': 'launchd', 'rss': {'error': '< 1024'}, 'cpu': {'warn': '< 10'}},
+                {'name': 'awesome', 'regexp': 'awesome[-]?app', 'rss': {'error': '< 2048', 'warn': '< 1024'},
+                 'cpu': {'warn': '< 100'}},
+                {'name': 'awesome arg1', 'regexp': 'awesome-app arg1', 'aggregate': False, 'error': '=2',
+                 'rss': {'error': '< 1024'}, 'cpu': {'error': '< 50'}},
+            ], process_reader)
+
+        self.assertEqual(w._sum_usage(w.process_reader.read(), process_reader.usage), ([100, 2100, 1100], [1, 110, 50]))
+
+        result = w.watch()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].level, Level(logging.ERROR))
+        lines = result[0].message.splitlines()
+        self.assertEqual(len(lines), 8)
+        self.assertIn(' awesome: 2100 ', lines[2])
+        self.assertIn(' awesome: 110', lines[3])
+        self.assertIn(' awesome arg1: 1100 ', lines[4])
+        self.assertIn(' awesome arg1: 50', lines[5])
+
+        # CPU usage is not checked before it is sampled
+        process_reader.usage = {1: (100 * mb, None), 40: (600 * mb, None), 41: (500 * mb, None)}
+        self.assertEqual(w._sum_usage(w.process_reader.read(), process_reader.usage), ([100, 1100, 1100], None))
+        self.assertEqual(len(w.watch()[0].message.splitlines()), 6)
+
+        # resource usage is not available
+        process_reader.usage = None
+        self.assertEqual(w.watch(), [])
+
     def test_watch_empty(self):
         process_reader = MockProcessReader("""  PID  PPID ARGS
     1     0 /sbin/launchd
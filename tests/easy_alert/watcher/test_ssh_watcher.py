@@ -1,4 +1,12 @@
+import os
 import sys
+import time
+import shutil
+import socket
+import tempfile
+import logging
+import threading
+from easy_alert.entity.level import Level
 from easy_alert.setting.setting_error import SettingError
 from easy_alert.watcher.ssh_watcher import SSHWatcher
 
@@ -24,6 +32,12 @@ class TestSSHWatcher(unittest.TestCase):
         assert_err([{'user': 'user', 'key': 'path/to/key', 'name': 's'}], "SSHWatcher not found config key: 'host'")
         assert_err([{'user': 'user', 'key': 'path/to/key', 'port': 'a', 'name': 's', 'host': 'h'}],
                    "SSHWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'targets': 'xxx'}, 'SSHWatcher settings not a list: xxx')
+        assert_err({'targets': [], 'concurrency': 'a'},
+                   "SSHWatcher settings syntax error: invalid literal for int() with base 10: 'a'")
+        assert_err({'targets': [], 'concurrency': 0}, 'SSHWatcher concurrency should be positive: 0')
+        assert_err({'targets': [], 'cache': 'x', 'cache_ttl': 'a'},
+                   'SSHWatcher settings syntax error: could not convert string to float: a')
 
     def test_init_normal(self):
         s = [
@@ -36,3 +50,208 @@ class TestSSHWatcher(unittest.TestCase):
             ('u2', 'k2', 22222, False, 'n2', 'h2', None),
             ('u3', 'k3', 33333, True, None, None, 'd3')
         ])
+        self.assertEqual(SSHWatcher(s).concurrency, 10)
+        self.assertEqual(SSHWatcher(s).deadline, 50)
+
+        w = SSHWatcher({'targets': s[:1], 'concurrency': 3, 'deadline': 5})
+        self.assertEqual(w.settings, [('u1', 'k1', 22, False, 'n1', 'h1', None)])
+        self.assertEqual(w.concurrency, 3)
+        self.assertEqual(w.deadline, 5.0)
+
+    def test_watch_concurrent(self):
+        s = [{'user': 'u', 'key': 'k', 'name': 'n%d' % i, 'host': 'h%d' % i} for i in range(6)]
+        w = SSHWatcher({'targets': s, 'concurrency': 3})
+
+        lock = threading.Lock()
+        running = [0, 0]  # current, max
+
+        def check(host, port, user, key):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            # finish in the reverse order
+            time.sleep(0.05 * (6 - int(host[1:])))
+            with lock:
+                running[0] -= 1
+            return host in ['h0', 'h2'], 'error: %s' % host
+
+        w._check_ssh_connection = check
+        alerts = w.watch()
+        self.assertEqual(running[1], 3)
+        self.assertEqual(len(alerts), 1)
+        lines = alerts[0].message.splitlines()
+        self.assertEqual([l for l in lines if l.startswith('[n')], [
+            '[n1](u@h1:22): error: h1',
+            '[n3](u@h3:22): error: h3',
+            '[n4](u@h4:22): error: h4',
+            '[n5](u@h5:22): error: h5',
+        ])
+
+    def test_watch_deadline(self):
+        s = [{'user': 'u', 'key': 'k', 'name': 'n%d' % i, 'host': 'h%d' % i} for i in range(3)]
+        w = SSHWatcher({'targets': s, 'concurrency': 3, 'deadline': 0.2})
+        event = threading.Event()
+        finished = threading.Event()
+
+        def check(host, port, user, key):
+            if host == 'h1':
+                event.wait(5)
+                finished.set()
+            return True, ''
+
+        w._check_ssh_connection = check
+        t = time.time()
+        try:
+            alerts = w.watch()
+        finally:
+            event.set()
+            finished.wait(5)
+        self.assertTrue(time.time() - t < 2)
+        self.assertEqual(len(alerts), 1)
+        self.assertTrue('[n1](u@h1:22): WorkerTimeout: ' in alerts[0].message, alerts[0].message)
+        self.assertFalse('[n0]' in alerts[0].message)
+        self.assertFalse('[n2]' in alerts[0].message)
+
+    def test_check_ssh_connection_error(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        server.close()
+
+        is_success, msg = SSHWatcher._check_ssh_connection('127.0.0.1', port, 'user', 'path/to/key')
+        self.assertFalse(is_success)
+        self.assertTrue(msg.startswith('error: '), msg)
+
+    def test_watch_deadline_pending(self):
+        s = [{'user': 'u', 'key': 'k', 'name': 'n%d' % i, 'host': 'h%d' % i} for i in range(20)]
+        w = SSHWatcher({'targets': s, 'concurrency': 2, 'deadline': 0.3})
+        lock = threading.Lock()
+        started = []
+
+        def check(host, port, user, key):
+            with lock:
+                started.append(host)
+            time.sleep(0.2)
+            return False, 'error'
+
+        w._check_ssh_connection = check
+        alerts = w.watch()
+        n = len(started)
+        self.assertTrue(2 <= n <= 6, n)
+
+        # the pending hosts are not checked after the deadline
+        time.sleep(0.5)
+        self.assertEqual(len(started), n)
+
+        self.assertEqual(len(alerts), 2)
+        self.assertEqual(alerts[0].level, Level(logging.ERROR))
+        self.assertEqual(alerts[1].level, Level(logging.WARN))
+        errors = [l for l in alerts[0].message.splitlines() if l.startswith('[')]
+        not_checked = [l for l in alerts[1].message.splitlines() if l.startswith('[')]
+        self.assertEqual(len(errors) + len(not_checked), 20)
+        self.assertTrue(len(not_checked) >= 14, not_checked)
+        self.assertEqual(not_checked[-1], '[n19](u@h19:22)')
+        self.assertTrue('before the deadline (0.3 sec)' in alerts[1].message)
+
+    def test_run_dynamic_command(self):
+        self.assertEqual(SSHWatcher._run_dynamic_command('printf "10.0.0.1 web-1\\n\\n  10.0.0.2  web-2 \\n"'),
+                         [('10.0.0.1', 'web-1'), ('10.0.0.2', 'web-2')])
+        self.assertEqual(SSHWatcher._run_dynamic_command('true'), [])
+
+        with self.assertRaises(RuntimeError) as cm:
+            SSHWatcher._run_dynamic_command('echo "10.0.0.1 web-1"; echo oops >&2; exit 3')
+        self.assertEqual(cm.exception.args[0], 'Dynamic command failed with exit status 3: oops')
+
+        with self.assertRaises(ValueError) as cm:
+            SSHWatcher._run_dynamic_command('echo xxx')
+        self.assertEqual(cm.exception.args[0], "Unexpected output of the dynamic command: 'xxx'")
+
+    def test_watch_inventory_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'inventory.json')
+            s = {'targets': [{'user': 'u', 'key': 'k', 'dynamic': 'cmd'}], 'cache': path, 'cache_ttl': 60,
+                 'cache_max_stale': 600}
+            now = [1000.0]
+            calls = []
+            output = [[('h1', 'n1'), ('h2', 'n2')]]
+
+            def run(command):
+                calls.append(command)
+                if isinstance(output[0], Exception):
+                    raise output[0]
+                return output[0]
+
+            def new_watcher():
+                w = SSHWatcher(s)
+                w.cache.clock = lambda: now[0]
+                w._run_dynamic_command = run
+                w._check_ssh_connection = lambda host, port, user, key: (False, 'error')
+                return w
+
+            def hosts(alerts):
+                return [l.split('(')[0] for l in alerts[0].message.splitlines() if l.startswith('[')]
+
+            w = new_watcher()
+            self.assertEqual(hosts(w.watch()), ['[n1]', '[n2]'])
+            self.assertEqual(calls, ['cmd'])
+            w.after_success()
+            self.assertTrue(os.path.exists(path))
+
+            # fresh: the command is not run even in the new process
+            now[0] += 59
+            output[0] = [('h3', 'n3')]
+            w = new_watcher()
+            self.assertEqual(hosts(w.watch()), ['[n1]', '[n2]'])
+            self.assertEqual(calls, ['cmd'])
+
+            # expired
+            now[0] += 1
+            self.assertEqual(hosts(w.watch()), ['[n3]'])
+            self.assertEqual(calls, ['cmd', 'cmd'])
+            w.after_success()
+
+            # stale-while-error
+            now[0] += 599
+            output[0] = RuntimeError('rate limited')
+            w = new_watcher()
+            alerts = w.watch()
+            self.assertEqual(hosts(alerts), ['[n3]'])
+            self.assertEqual(calls, ['cmd', 'cmd', 'cmd'])
+
+            # the failure is reported
+            self.assertEqual(len(alerts), 2)
+            self.assertEqual(alerts[1].level, Level(logging.WARN))
+            self.assertTrue('[cmd]: RuntimeError: rate limited (using the output cached at ' in alerts[1].message,
+                            alerts[1].message)
+
+            # too old to use
+            now[0] += 1
+            alerts = w.watch()
+            self.assertEqual(len(alerts), 1)
+            self.assertEqual(alerts[0].level, Level(logging.ERROR))
+            self.assertTrue('\n[cmd]: RuntimeError: rate limited\n' in alerts[0].message, alerts[0].message)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_watch_inventory_failure(self):
+        s = [
+            {'user': 'u', 'key': 'k', 'name': 'n1', 'host': 'h1'},
+            {'user': 'u', 'key': 'k', 'dynamic': 'echo "h2 n2"'},
+            {'user': 'u', 'key': 'k', 'dynamic': 'echo oops >&2; exit 3'},
+        ]
+        w = SSHWatcher(s)
+        w._check_ssh_connection = lambda host, port, user, key: (False, 'error')
+        alerts = w.watch()
+
+        # the other servers are still checked
+        self.assertEqual(len(alerts), 2)
+        self.assertEqual(alerts[0].level, Level(logging.ERROR))
+        self.assertTrue('[n1](u@h1:22): error\n[n2](u@h2:22): error\n' in alerts[0].message, alerts[0].message)
+        self.assertEqual(alerts[1].level, Level(logging.ERROR))
+        self.assertTrue('\n[echo oops >&2; exit 3]: RuntimeError: Dynamic command failed with exit status 3: oops\n'
+                        in alerts[1].message, alerts[1].message)
+
+        # reset for each run
+        w.settings = w.settings[:2]
+        self.assertEqual(len(w.watch()), 1)